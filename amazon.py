@@ -1,9 +1,23 @@
-from playwright.sync_api import sync_playwright
+import asyncio
 import random
-import time
 import logging
-import csv
-import os
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse, urlunparse
+
+from blocking import get_blocker
+from cache import get_cache
+from checkpoint import open_checkpoint
+from crawl_plan import category_node, load_plan, new_plan, plan_brand_urls, plan_path, resolve_brand_url, save_plan
+from dedup import claim, open_dedup_index
+from engine import gather_limited, run_workers
+from extraction import apply_defaults, extract_items, field, parse_html
+from http_fetch import create_fetcher
+from normalize import PRODUCT_SCHEMA, normalize_product
+from metrics import log_item, metrics
+from pacing import act_and_wait, goto, pacer, wait_for_selector
+from pool import BrowserPool
+from retry import BlockedError, get_dead_letters, get_retrier
+from shard import WORKER_PROCESSES, ShardedRun
+from sink import close_sink, get_sink, open_sink, output_formats, write_outputs
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -20,6 +34,42 @@ class Selectors:
     RATING_OF_ITEM = "span[aria-label*='out of 5 stars']"
     PRICE_OF_ITEM = ".a-price .a-offscreen"
     NEXT_BUTTON = ".s-pagination-next.s-pagination-button"
+    PAGINATION_ITEMS = ".s-pagination-strip .s-pagination-item"
+    # Fields read from each item in ALL_ITEMS by the batched extractor
+    ITEM_FIELDS = {
+        "asin": field(attribute="data-asin"),
+        "name": field(NAME_OF_ITEM),
+        "rating": field(RATING_OF_ITEM, attribute="aria-label"),
+        "price": field(PRICE_OF_ITEM),
+    }
+    ITEM_DEFAULTS = {"asin": None, "name": "No Name", "rating": "No Rating", "price": "No Price"}
+
+# Number of result pages of one brand fetched in parallel
+PAGE_WORKERS = 3
+
+# Reads the highest page number shown in the pagination strip
+PAGE_COUNT_JS = """
+(selector) => {
+    const numbers = Array.from(document.querySelectorAll(selector))
+        .map(element => parseInt(element.textContent.trim(), 10))
+        .filter(number => !isNaN(number));
+    return numbers.length ? Math.max(...numbers) : 1;
+}
+"""
+
+# Number of browser contexts used to crawl the brands of a subcategory in parallel
+BRAND_WORKERS = 4
+
+# Reads the href and text of every matched link, for the carousels read during discovery
+LINKS_JS = "(nodes) => nodes.map(node => [node.getAttribute('href'), node.innerText.trim()])"
+
+LAUNCH_OPTIONS = {"args": ['--start-maximized'], "headless": False}
+
+# Completed subcategories, brands and result pages, so an interrupted crawl can resume
+CHECKPOINT_PATH = "data/crawl_state.sqlite"
+
+# Formats products are saved in. CSV keeps the scraped strings, JSONL and Parquet hold typed fields
+OUTPUT_FORMATS = output_formats("csv", "jsonl", "parquet")
 
 def get_random_user_agent():
     user_agents = [
@@ -30,213 +80,585 @@ def get_random_user_agent():
     ]
     return random.choice(user_agents)
 
-def extract_product_info(product):
-    name = product.query_selector(Selectors.NAME_OF_ITEM).inner_text() if product.query_selector(Selectors.NAME_OF_ITEM) else "No Name"
-    rating = product.query_selector(Selectors.RATING_OF_ITEM).get_attribute("aria-label") if product.query_selector(Selectors.RATING_OF_ITEM) else "No Rating"
-    price = product.query_selector(Selectors.PRICE_OF_ITEM).inner_text() if product.query_selector(Selectors.PRICE_OF_ITEM) else "No Price"
-    
+async def new_context(browser):
+    """Create a browser context with a random user agent, Amazon resource blocking and the page cache."""
+    context = await browser.new_context(user_agent=get_random_user_agent())
+    await get_blocker("amazon").attach(context)
+    await get_cache().attach(context)
+    pacer.watch(context)
+    return context
+
+def extract_product_info(record):
+    """Turn a raw record from the batched extractor into a product, or None if it has no price."""
+    product_info = apply_defaults(record, Selectors.ITEM_DEFAULTS)
+
     # Exclude products with no price
-    if price == "No Price":
+    if product_info["price"] == "No Price":
         return None  # Skip this product
-    
-    return {
-        "name": name,
-        "rating": rating,
-        "price": price,
-    }
 
-def save_data_to_csv(products):
-    """Save scraped product data to a CSV file."""
-    directory = f"data/"
-    os.makedirs(directory, exist_ok=True)
-    
-    csv_file = f"{directory}/products.csv"
-    with open(csv_file, mode="a", newline='', encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=["name", "rating", "price"])
-        if file.tell() == 0:
-            writer.writeheader()
-        writer.writerows(products)
-    logging.info(f"Data saved to {csv_file}")
-
-def navigate_to_main_category(page):
-    main_category_link = page.query_selector(Selectors.MAIN_CATEGORY_LINK)
-    if main_category_link:
-        main_category_link.click()
-        time.sleep(random.uniform(2, 5)) 
-    else:
-        logging.warning("Main category link not found!")
+    return product_info
 
-def navigate_to_brand(page, brand,index):
-    brand.click()
-    time.sleep(random.uniform(3, 5))
-    page.wait_for_load_state("load", timeout=60000)
-    time.sleep(random.uniform(2, 5)) 
+async def save_products(products, on_written=None):
+    """Queue scraped products for every output format; `on_written` runs once the CSV rows are on disk."""
+    await write_outputs(
+        "data/products", products, OUTPUT_FORMATS, ["asin", "name", "rating", "price"], PRODUCT_SCHEMA, normalize_product,
+        on_written=on_written,
+    )
 
-def scrape_brand_products(page, scraped_products):
+def build_page_url(url, page_number):
+    """Return the results URL for a page number, following Amazon's `&page=N` pattern."""
+    parts = urlparse(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query["page"] = [str(page_number)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+async def get_page_count(page):
+    """Read the total number of result pages from the pagination strip."""
+    try:
+        return await page.evaluate(PAGE_COUNT_JS, Selectors.PAGINATION_ITEMS)
+    except Exception as e:
+        logging.warning(f"Could not read the page count: {e}")
+        return 1
+
+def product_key(product_info):
+    """Stable dedup key of a product: its ASIN, or its name for the rare result without one."""
+    return product_info["asin"] or product_info["name"]
+
+def filter_new_products(product_records, scraped_products):
+    """Turn raw records into products, dropping those without a price and those already scraped."""
     brand_products = []
+    for record in product_records:
+        product_info = extract_product_info(record)
+
+        if product_info is None:
+            continue  # Skip products with no price
+
+        # Check for duplicates based on the ASIN. Claiming checks and adds in one step, so neither
+        # concurrent brand tasks nor the worker processes of a sharded crawl can race on the shared keys.
+        if not claim(scraped_products, product_key(product_info)):
+            metrics.count("duplicates", site="amazon")
+            log_item("duplicate", "Duplicate product found: %s, skipping.", product_info["name"])
+            continue
+
+        brand_products.append(product_info)
+        log_item("product", "Scraped product: %s", product_info)
+    return brand_products
+
+async def fetch_result_page(page_pool, url, brand_url=None):
+    """Load one results page on a page borrowed from the pool and extract its products.
+
+    Failed loads are retried. A page that keeps failing is dead-lettered with its brand and returns None.
+    """
+    async def load():
+        page = await page_pool.get()
+        try:
+            await pacer.pause(url)
+            await goto(page, url, timeout=60000)
+            await wait_for_selector(page, Selectors.ALL_ITEMS, timeout=30000)
+            return await extract_items(page, Selectors.ALL_ITEMS, Selectors.ITEM_FIELDS)
+        except Exception as e:
+            if await pacer.check_page(page):
+                raise BlockedError(f"Captcha on {url}") from e
+            raise
+        finally:
+            page_pool.put_nowait(page)
+
+    try:
+        return await get_retrier("amazon").run(url, load, "page", {"brand_url": brand_url})
+    except Exception as e:
+        logging.error(f"Failed to fetch results page {url}: {e}")
+        return None
+
+async def fetch_result_pages(page, page_urls, page_workers=PAGE_WORKERS, brand_url=None):
+    """Fetch result pages directly and concurrently, returning their records (None for failed pages) in page order."""
+    page_pool = asyncio.Queue()
+    extra_pages = [await page.context.new_page() for _ in range(min(page_workers, len(page_urls)))]
+    for extra_page in extra_pages:
+        page_pool.put_nowait(extra_page)
+
+    try:
+        return await asyncio.gather(*(fetch_result_page(page_pool, url, brand_url) for url in page_urls))
+    finally:
+        for extra_page in extra_pages:
+            await extra_page.close()
+
+def pending_page_urls(brand_url, first_page, total_pages, checkpoint=None):
+    """Return the result page URLs of a brand in page order, leaving out pages completed by an earlier run."""
+    page_urls = [build_page_url(brand_url, page_number) for page_number in range(first_page, total_pages + 1)]
+    if checkpoint:
+        page_urls = [url for url in page_urls if not checkpoint.is_done("page", url)]
+    return page_urls
+
+async def save_result_page(records, scraped_products, checkpoint=None, page_url=None, save=save_products):
+    """Save the new products of one result page with `save` and record the page as completed.
+
+    Pages that failed to load (None) stay pending so a resumed run fetches them again.
+    """
+    if records is None:
+        return
+    products = filter_new_products(records, scraped_products)
+    product_keys = [product_key(product) for product in products]
+
+    def on_written():
+        # Recorded only once the rows are on disk, so a crash can never skip unsaved products
+        scraped_products.commit(product_keys)
+        if checkpoint and page_url:
+            checkpoint.complete_page(page_url)
+        if page_url:
+            # Resolves the dead letter of a page that failed in an earlier run, however it was fetched now
+            get_dead_letters().discard("amazon", "page", page_url)
+
+    await save(products, on_written)
+
+async def finish_brand(checkpoint, brand_url):
+    """Mark a brand completed once none of its result pages is pending any more."""
+    # Pages are recorded by the output sink once their rows are on disk, so let it catch up first
+    await get_sink().drain()
+    total_pages = checkpoint.get_page_count(brand_url)
+    if total_pages and not pending_page_urls(brand_url, 1, total_pages, checkpoint):
+        checkpoint.mark_done("brand", brand_url)
+
+def page_count_from_html(tree):
+    """Read the total number of result pages from the pagination strip of parsed HTML."""
+    numbers = [int(text) for text in (node.text(strip=True) for node in tree.css(Selectors.PAGINATION_ITEMS)) if text.isdigit()]
+    return max(numbers, default=1)
+
+async def scrape_brand_products_http(fetcher, page, brand_url, scraped_products, page_workers=PAGE_WORKERS, checkpoint=None, save=save_products):
+    """Scrape a brand's result pages over plain HTTP, loading only pages that fail validation in the browser.
+
+    Returns False when the first page already needs the browser, so the caller can scrape the brand there.
+    """
+    first_page_url = build_page_url(brand_url, 1)
+    total_pages = checkpoint.get_page_count(brand_url) if checkpoint else None
+    if total_pages and checkpoint.is_done("page", first_page_url):
+        first_page_records = None  # Completed by an earlier run
+    else:
+        first_page = await fetcher.fetch_items(brand_url, Selectors.ALL_ITEMS, Selectors.ITEM_FIELDS)
+        if first_page is None:
+            return False
+        first_page_records, tree = first_page
+        total_pages = page_count_from_html(tree)
+        if checkpoint:
+            checkpoint.set_page_count(brand_url, total_pages)
+
+    page_urls = pending_page_urls(brand_url, 2, total_pages, checkpoint)
+    results = await gather_limited(
+        [fetcher.fetch_items(url, Selectors.ALL_ITEMS, Selectors.ITEM_FIELDS) for url in page_urls], page_workers
+    )
+
+    page_pool = asyncio.Queue()
+    page_pool.put_nowait(page)
+    pages_of_records = []
+    for url, result in zip(page_urls, results):
+        if isinstance(result, tuple):
+            pages_of_records.append(result[0])
+        else:
+            logging.info(f"Escalating {url} to the browser.")
+            pages_of_records.append(await fetch_result_page(page_pool, url, brand_url))
+
+    # Merge in page order so the output matches a sequential walk
+    await save_result_page(first_page_records, scraped_products, checkpoint, first_page_url, save)
+    for url, records in zip(page_urls, pages_of_records):
+        await save_result_page(records, scraped_products, checkpoint, url, save)
+    return True
+
+async def resume_brand_products(page, brand_url, scraped_products, checkpoint, page_workers=PAGE_WORKERS, save=save_products):
+    """Fetch only the result pages of a partly scraped brand that an earlier run did not complete.
+
+    Returns False when there is no recorded progress for the brand to resume from.
+    """
+    total_pages = checkpoint.get_page_count(brand_url)
+    if not total_pages or not checkpoint.is_done("page", build_page_url(brand_url, 1)):
+        return False
+
+    page_urls = pending_page_urls(brand_url, 2, total_pages, checkpoint)
+    logging.info(f"Resuming {brand_url}: {len(page_urls)} of {total_pages} result pages left.")
+    pages_of_records = await fetch_result_pages(page, page_urls, page_workers, brand_url)
+    for url, records in zip(page_urls, pages_of_records):
+        await save_result_page(records, scraped_products, checkpoint, url, save)
+    return True
+
+async def scrape_brand_products(page, scraped_products, page_workers=PAGE_WORKERS, checkpoint=None, brand_url=None, save=save_products):
+    # Result pages are keyed on the brand URL the crawl was given, not on wherever the browser ended up
+    brand_url = brand_url or page.url
+    first_page_url = build_page_url(brand_url, 1)
+
+    # Jump straight to the remaining result pages when the page count is known
+    total_pages = await get_page_count(page)
+    if total_pages > 1 and page_workers > 0:
+        logging.info(f"Found {total_pages} result pages, fetching the rest directly with {page_workers} pages.")
+        if checkpoint:
+            checkpoint.set_page_count(brand_url, total_pages)
+        first_page_records = None
+        if not (checkpoint and checkpoint.is_done("page", first_page_url)):
+            first_page_records = await extract_items(page, Selectors.ALL_ITEMS, Selectors.ITEM_FIELDS)
+        page_urls = pending_page_urls(brand_url, 2, total_pages, checkpoint)
+        remaining_records = await fetch_result_pages(page, page_urls, page_workers, brand_url)
+        # Merge in page order so the output matches a sequential walk
+        await save_result_page(first_page_records, scraped_products, checkpoint, first_page_url, save)
+        for url, records in zip(page_urls, remaining_records):
+            await save_result_page(records, scraped_products, checkpoint, url, save)
+        return
+
+    # Otherwise walk the pages by clicking "Next"
+    page_number = 1
     while True:
-        product_elements = page.query_selector_all(Selectors.ALL_ITEMS)
-        if not product_elements:
-            logging.warning("No products found on this page.")
-            break
+        page_url = build_page_url(brand_url, page_number)
+        if checkpoint and checkpoint.is_done("page", page_url):
+            logging.info(f"Page {page_number} was completed by an earlier run, skipping.")
+        else:
+            # Read every field of every product on the page in one round trip
+            product_records = await extract_items(page, Selectors.ALL_ITEMS, Selectors.ITEM_FIELDS)
+            if not product_records:
+                if await pacer.check_page(page):
+                    # Retried from the pages saved so far when there is a checkpoint, the brand stays pending otherwise
+                    raise BlockedError(f"Captcha on {page_url}")
+                logging.warning("No products found on this page.")
+                if page_number > 1:
+                    page_number -= 1
+                elif checkpoint:
+                    # A brand without any products has no page left to fetch, so it can be finished
+                    checkpoint.complete_page(page_url)
+                break
 
-        for product in product_elements:
-            product_info = extract_product_info(product)
-            
-            if product_info is None:
-                continue  # Skip products with no price
-
-            # Check for duplicates based on product name
-            if product_info["name"] in scraped_products:
-                logging.info(f"Duplicate product found: {product_info['name']}, skipping.")
-                continue
-            
-            brand_products.append(product_info)
-            scraped_products.add(product_info["name"])  # Add product name to set to avoid duplicates
-            logging.info(f"Scraped product: {product_info}")
-
-        # Save brand-specific data
-        save_data_to_csv(brand_products)
-        brand_products = []
+            # Save brand-specific data
+            await save_result_page(product_records, scraped_products, checkpoint, page_url, save)
 
         # Check if there's a "Next" button for pagination
-        next_button = page.query_selector(Selectors.NEXT_BUTTON)
-        if next_button and next_button.is_enabled():
+        next_button = await page.query_selector(Selectors.NEXT_BUTTON)
+        if next_button and await next_button.is_enabled():
             logging.info("Navigating to next page...")
-            next_button.click()
+            await act_and_wait(page, next_button.click, selector=Selectors.ALL_ITEMS, url_change=True)
             logging.info("Page loaded, scraping next page...")
-            time.sleep(random.uniform(3, 5))  
+            await pacer.pause(page.url)
+            page_number += 1
         else:
             logging.info("No more pages to navigate.")
             break
 
-def go_back_to_brands_page(page, brand_listing_url):
-    """Navigate directly to the brand list page and wait for brand links to load."""
-    logging.info("Returning to the brand list after scraping products.")
-    try:
-        # Navigate directly to the brand listing page
-        logging.info(f"Navigating back to the brand listing URL: {brand_listing_url}")
-        page.goto(brand_listing_url, timeout=60000)  # Go to the saved brand listing URL
-        
-        # Wait for the brand links to load (page must be loaded fully before interacting with it)
-        page.wait_for_selector(Selectors.ALL_BRANDS[0], timeout=60000)  # Check first brand selector in list
-        logging.info("Successfully returned to the brand listing page.")
-    except TimeoutError:
-        logging.error("Timeout while navigating back to the brand listing page.")
-    except Exception as e:
-        logging.error(f"An unexpected error occurred while returning to the brand listing page: {e}")
+    if checkpoint:
+        checkpoint.set_page_count(brand_url, page_number)
+
+async def read_links(page, url, groups, required, fetcher=None):
+    """Read the links of every selector group on `url`, as {group: [(href, text), ...]}.
+
+    Pages are read over HTTP when possible. The browser only loads a page when the `required` group is
+    missing from its HTML, e.g. because the carousel is rendered by script.
+    """
+    links = None
+    if fetcher:
+        html = await fetcher.fetch_html(url)
+        if html is not None:
+            tree = parse_html(html)
+            links = {
+                group: [(node.attributes.get("href"), node.text(strip=True)) for selector in selectors for node in tree.css(selector)]
+                for group, selectors in groups.items()
+            }
+    if not links or not links[required]:
+        await pacer.pause(url)
+        await get_retrier("amazon").run(url, lambda: goto(page, url, timeout=60000))
+        try:
+            await wait_for_selector(page, ", ".join(groups[required]), timeout=60000)
+        except Exception:
+            logging.warning(f"No {required} found on {url}.")
+        links = {}
+        for group, selectors in groups.items():
+            links[group] = []
+            for selector in selectors:
+                links[group].extend(await page.eval_on_selector_all(selector, LINKS_JS))
+    return {group: [(href, text) for href, text in group_links if href] for group, group_links in links.items()}
+
+def brand_node(page_url, brand_links):
+    """A node of the crawl plan: a page with brand carousels and the search URLs of its brands."""
+    node = category_node(page_url)
+    brand_urls = []
+    for href, text in brand_links:
+        brand_url = resolve_brand_url(page_url, href, text, node)
+        if brand_url not in brand_urls:
+            brand_urls.append(brand_url)
+    return {"url": page_url, "brands": brand_urls}
+
+async def discover_crawl_plan(page, url, category_url=None, fetcher=None):
+    """Walk the category tree once and resolve every brand of every subcategory to its search URL."""
+    if not category_url:
+        home = await read_links(page, url, {"category": [Selectors.MAIN_CATEGORY_LINK]}, "category", fetcher)
+        if not home["category"]:
+            logging.warning("Main category link not found!")
+            return None
+        category_url = home["category"][0][0]
+    category_url = urljoin(url, category_url)
+
+    category = await read_links(
+        page, category_url, {"subcategories": [Selectors.ALL_SUBCATEGORIES], "brands": Selectors.ALL_BRANDS}, "subcategories", fetcher
+    )
+    sub_category_urls = []
+    for href, _ in category["subcategories"]:
+        if urljoin(category_url, href) not in sub_category_urls:
+            sub_category_urls.append(urljoin(category_url, href))
+    logging.info(f"Found {len(sub_category_urls)} subcategories.")
+
+    nodes = []
+    for sub_category_url in sub_category_urls:
+        links = await read_links(page, sub_category_url, {"brands": Selectors.ALL_BRANDS}, "brands", fetcher)
+        nodes.append(brand_node(sub_category_url, links["brands"]))
+    # The category page carries brand carousels of its own, so it is a node like its subcategories
+    nodes.append(brand_node(category_url, category["brands"]))
+    return new_plan(url, category_url, nodes)
+
+async def get_crawl_plan(pool, url, category_url=None, fetcher=None, refresh=False):
+    """Load the saved crawl plan of a category, or discover it on a page leased from `pool` when there is none.
+
+    Returns None if discovery found nothing to crawl.
+    """
+    path = plan_path(url, category_url)
+    plan = None if refresh else load_plan(path)
+    if plan:
+        logging.info(f"Loaded the crawl plan {path}: {len(plan_brand_urls(plan))} brands in {len(plan['nodes'])} pages.")
+        return plan
+
+    async with pool.lease() as page:
+        plan = await discover_crawl_plan(page, url, category_url, fetcher)
+    if not plan or not plan_brand_urls(plan):
+        logging.warning("No brands found while discovering the category.")
+        return None
+    save_plan(path, plan)
+    logging.info(f"Saved the crawl plan {path}: {len(plan_brand_urls(plan))} brands in {len(plan['nodes'])} pages.")
+    return plan
+
+async def brand_worker(worker_id, pool, brand_queue, scraped_products, fetcher=None, checkpoint=None, save_for=None):
+    """Scrape brands from the shared queue, on a page leased from the browser pool for each brand.
+
+    Queue items are (label, brand URL). With `save_for`, each brand's products are saved with `save_for(label)`.
+    """
+    while True:
+        try:
+            index, brand_url = brand_queue.get_nowait()
+        except asyncio.QueueEmpty:
+            break
+        save = save_for(index) if save_for else save_products
 
-def scrape_all_brands(page, scraped_products):
-    for selector in Selectors.ALL_BRANDS:
-        brand_listing_url = page.url  # Save the initial brand listing page URL
-        logging.info(f"Brand Listing URL: {brand_listing_url}")
+        if checkpoint and checkpoint.is_done("brand", brand_url):
+            logging.info(f"Worker {worker_id} skipping brand {index}, completed by an earlier run.")
+            continue
+
+        async def scrape_brand():
+            async with pool.lease() as page:
+                logging.info(f"Worker {worker_id} scraping brand {index}: {brand_url}")
+                # Server-rendered result pages are fetched over HTTP first, the browser is only the fallback
+                if fetcher and await scrape_brand_products_http(fetcher, page, brand_url, scraped_products, checkpoint=checkpoint, save=save):
+                    logging.info(f"Worker {worker_id} finished scraping for brand {index} over HTTP.")
+                # A retried brand resumes from the pages its failed attempt saved, when there is a checkpoint
+                elif not (checkpoint and await resume_brand_products(page, brand_url, scraped_products, checkpoint, save=save)):
+                    await pacer.pause(brand_url)
+                    await goto(page, brand_url, timeout=60000)
+                    await scrape_brand_products(page, scraped_products, checkpoint=checkpoint, brand_url=brand_url, save=save)
+                    logging.info(f"Worker {worker_id} finished scraping for brand {index}.")
 
         try:
-            all_brands = page.query_selector_all(selector)
-            if not all_brands:
-                logging.warning(f"No brands found for selector {selector}.")
-                continue
-
-            logging.info(f"Found {len(all_brands)} brands using selector {selector}.")
-
-            for index in range(len(all_brands)):
-                # Re-fetch the list of brands each time after navigating back to brand list page
-                go_back_to_brands_page(page, brand_listing_url)
-                all_brands = page.query_selector_all(selector)
-
-                if index >= len(all_brands):
-                    logging.warning(f"Brand index {index} out of range after re-fetching.")
-                    break
-                
-                brand = all_brands[index]
-                
-                # Navigate to the brand page
-                navigate_to_brand(page, brand, index)
-                scrape_brand_products(page, scraped_products)
-                
-                # Log the navigation
-                logging.info(f"Finished scraping for brand {index}, returning to brand list.")
-        
+            await get_retrier("amazon").run(brand_url, scrape_brand, "brand")
+            if checkpoint:
+                await finish_brand(checkpoint, brand_url)
         except Exception as e:
-            logging.error(f"An error occurred while processing brands for selector {selector}: {e}")
+            logging.error(f"Worker {worker_id} failed on brand {index} ({brand_url}): {e}")
+
+async def scrape_brands(pool, brand_urls, scraped_products, workers=BRAND_WORKERS, fetcher=None, checkpoint=None):
+    """Spread brands across the contexts of the browser pool. Returns True when every brand has been completed."""
+    logging.info(f"Scraping {len(brand_urls)} brands with {workers} workers.")
+
+    async def worker(worker_id, brand_queue):
+        await brand_worker(worker_id, pool, brand_queue, scraped_products, fetcher, checkpoint)
+
+    await run_workers(enumerate(brand_urls), worker, workers)
+    return checkpoint is None or checkpoint.all_done("brand", brand_urls)
+
+async def scrape_plan_nodes(nodes, pool, scraped_products, workers=BRAND_WORKERS, fetcher=None, checkpoint=None):
+    """Scrape the brands of crawl plan nodes straight from their search URLs.
+
+    A node is recorded as a completed subcategory once all of its brands are. Returns True when every
+    brand has been completed.
+    """
+    if checkpoint:
+        nodes = [node for node in nodes if not checkpoint.is_done("subcategory", node["url"])]
+    brand_urls = plan_brand_urls({"nodes": nodes})
+    complete = await scrape_brands(pool, brand_urls, scraped_products, workers, fetcher, checkpoint)
+    if checkpoint:
+        for node in nodes:
+            if checkpoint.all_done("brand", node["brands"]):
+                checkpoint.mark_done("subcategory", node["url"])
+    return complete
+
+async def scrape_subcategory_shard(worker_id, nodes, options):
+    """Worker process side of the sharded crawl: scrape the brands of every plan node handed to this process."""
+    # The parent already started over or resumed, the workers only share its checkpoint
+    checkpoint = open_checkpoint(options["checkpoint_path"], resume=True) if options["checkpoint_path"] else None
+    # Keys are claimed in the index all processes share, the parent already released those of dead processes
+    scraped_products = open_dedup_index(options["dedup_namespace"], recover=False)
+    fetcher = create_fetcher(get_random_user_agent(), get_cache()) if options["use_http"] else None
+    brand_workers = options["brand_workers"]
+    pool = BrowserPool(new_context, brand_workers, LAUNCH_OPTIONS, warm_url=options["url"], name=f"amazon-{worker_id}")
+    try:
+        await pool.start()
+        async for node_url, brand_urls in nodes:
+            try:
+                logging.info(f"Scraping the {len(brand_urls)} brands of {node_url}")
+                node = {"url": node_url, "brands": brand_urls}
+                await scrape_plan_nodes([node], pool, scraped_products, brand_workers, fetcher, checkpoint)
+            except Exception as e:
+                logging.error(f"Failed on subcategory {node_url}: {e}")
+    finally:
+        await pool.close()
+        if fetcher:
+            await fetcher.close()
+        # Pages are recorded once the parent has their rows on disk, so wait for that before closing
+        await get_sink().drain()
+        scraped_products.close()
+        if checkpoint:
+            checkpoint.close()
+        get_blocker("amazon").report()
+        get_cache().report()
+
+def dedup_namespace(url, category_url=None):
+    """Dedup keys of one category, kept across runs. Crawls of other categories claim keys of their own."""
+    return f"amazon:{category_url or url}"
+
+def finish_crawl(checkpoint):
+    """Forget the progress of a completed crawl, so the next one scrapes the category again instead of skipping it.
+
+    The dedup keys stay, products saved by any earlier crawl of the category are not saved again.
+    """
+    logging.info(f"Crawl completed, clearing the checkpoint {checkpoint.path}.")
+    checkpoint.reset()
+
+async def scrape_amazon_sharded(url, category_url=None, processes=WORKER_PROCESSES, brand_workers=BRAND_WORKERS, use_http=True, checkpoint_path=CHECKPOINT_PATH, resume=True, refresh_plan=False):
+    """Crawl a category with the nodes of its crawl plan spread over worker processes, each with its own browser.
 
-def go_back_to_sub_category_page(page, sub_category_listing_url):
-    logging.info("Returning to the subcategory listing after scraping products.")
+    Dedup keys claimed in this run are shared by every process and all rows are written by this one.
+    Returns False if the crawl stopped on an error. An interrupted crawl is picked up again unless `resume` is off.
+    """
+    complete = False
+    open_sink()
+    checkpoint = open_checkpoint(checkpoint_path, resume) if checkpoint_path else None
+    # Opened here to release the claims a dead process left, before the workers open their own
+    namespace = dedup_namespace(url, category_url)
+    open_dedup_index(namespace).close()
+    options = {
+        "url": url, "brand_workers": brand_workers, "use_http": use_http, "checkpoint_path": checkpoint_path,
+        "dedup_namespace": namespace,
+    }
+    run = ShardedRun(scrape_subcategory_shard, processes, options, name="amazon")
+    fetcher = create_fetcher(get_random_user_agent(), get_cache()) if use_http else None
+    pool = BrowserPool(new_context, 1, LAUNCH_OPTIONS, name="amazon")
     try:
-        # Navigate directly to the subcategory listing page
-        logging.info(f"Navigating back to the subcategory listing URL: {sub_category_listing_url}")
-        page.goto(sub_category_listing_url, timeout=60000) 
-        page.wait_for_selector(Selectors.ALL_SUBCATEGORIES[0], timeout=60000)  # Wait for the subcategory selector
-        logging.info("Successfully returned to the subcategory listing page.")
-    except TimeoutError:
-        logging.error("Timeout while navigating back to the subcategory listing page.")
+        await pool.start()
+        plan = await get_crawl_plan(pool, url, category_url, fetcher, refresh_plan)
+        await pool.close()
+        if not plan:
+            return False
+
+        nodes = plan["nodes"]
+        if checkpoint:
+            nodes = [node for node in nodes if not checkpoint.is_done("subcategory", node["url"])]
+        logging.info(f"Sharding {len(nodes)} subcategories over {processes} processes.")
+        run.start()
+        for node in nodes:
+            run.submit(node["url"], node["brands"])
+        stats = await run.close()
+        complete = (
+            stats["failed_processes"] == 0
+            and checkpoint is not None
+            and checkpoint.all_done("subcategory", [node["url"] for node in plan["nodes"]])
+        )
+        return stats["failed_processes"] == 0
     except Exception as e:
-        logging.error(f"An unexpected error occurred while returning to the subcategory listing page: {e}")
-
-def navigate_to_subcategory(page, sub_category, index, scraped_products, sub_category_listing_url):
-    sub_category.click()
-    time.sleep(random.uniform(3, 5))  # Wait for the subcategory to load
-    page.wait_for_load_state("load", timeout=60000)
-    time.sleep(random.uniform(2, 5)) 
-
-    # Now scrape brands for this subcategory
-    scrape_all_brands(page, scraped_products)
-    time.sleep(random.uniform(2, 5))
-
-    logging.info(f"Returning to the subcategory page after scraping brands for subcategory {index}.")
-    page.go_back()
-    time.sleep(random.uniform(3, 5))  # Allow time for the page to reload
-    
-    # Refresh the list of subcategories after going back to ensure it's up to date
-    go_back_to_sub_category_page(page, sub_category_listing_url)
-    time.sleep(random.uniform(2, 5))  # Wait to ensure it's refreshed before processing the next subcategory
-
-def scrap_all_sub_categories(page, scraped_products):
-    # Get all subcategories listed in the main category
-    all_sub_categories = page.query_selector_all(Selectors.ALL_SUBCATEGORIES)
-    if not all_sub_categories:
-        logging.warning("No subcategories found.")
-        return
+        logging.error(f"An error occurred: {e}")
+        return False
+    finally:
+        await pool.close()
+        if fetcher:
+            await fetcher.close()
+        # Pages are recorded as their rows are written, so the sink has to catch up before the checkpoint is cleared
+        await get_sink().drain()
+        close_sink()
+        if complete:
+            finish_crawl(checkpoint)
+        if checkpoint:
+            checkpoint.close()
+        metrics.report()
 
-    logging.info(f"Found {len(all_sub_categories)} subcategories.")
-    
-    # Save the current URL of the subcategory listing page to return later
-    sub_category_listing_url = page.url
-    
-    # Iterate through each subcategory
-    for index in range(len(all_sub_categories)):
-        sub_category = all_sub_categories[index]
-        
-        # Navigate to the subcategory page and scrape brands
-        navigate_to_subcategory(page, sub_category, index, scraped_products, sub_category_listing_url)
-
-        time.sleep(random.uniform(3, 5))  # Allow time for the page to reload
-        
-        # Re-fetch the subcategory list to ensure we're up to date for the next iteration
-        all_sub_categories = page.query_selector_all(Selectors.ALL_SUBCATEGORIES)
-
-def scrape_amazon_bestsellers(url):
-    scraped_products = set()
-    with sync_playwright() as p:
-        browser = p.chromium.launch(args=['--start-maximized'], headless=False)
-        context = browser.new_context(user_agent=get_random_user_agent())
-        page = context.new_page()
+async def scrape_amazon_bestsellers(url, category_url=None, brand_workers=BRAND_WORKERS, use_http=True, checkpoint_path=CHECKPOINT_PATH, resume=True, refresh_plan=False, brand_urls=None):
+    """Crawl the bestsellers of a category. Returns False if the crawl stopped on an error.
 
-        try:
-            logging.info(f"Visiting: {url}")
-            page.goto(url, timeout=60000) 
-            time.sleep(random.uniform(2, 5))
+    The category tree is walked once and saved as a crawl plan, later runs go straight to the brands'
+    search URLs until the plan expires or `refresh_plan` is set. With `brand_urls` only those brands are
+    scraped, without a plan.
+
+    An interrupted crawl is picked up again unless `resume` is off. Once a crawl completes its checkpoint is
+    cleared, so the next crawl walks the category again; products saved by earlier crawls stay deduplicated.
+    """
+    complete = False
+    open_sink()
+    checkpoint = open_checkpoint(checkpoint_path, resume) if checkpoint_path else None
+    # Products saved by earlier runs of the category stay deduplicated, only claims of dead processes are released
+    scraped_products = open_dedup_index(dedup_namespace(url, category_url))
+    fetcher = create_fetcher(get_random_user_agent(), get_cache()) if use_http else None
+    # One context per brand worker, the first one also walks the category tree when there is no plan yet
+    pool = BrowserPool(new_context, max(brand_workers, 1), LAUNCH_OPTIONS, warm_url=url, name="amazon")
+    try:
+        await pool.start()
+        if brand_urls is not None:
+            await scrape_brands(pool, brand_urls, scraped_products, brand_workers, fetcher, checkpoint)
+        else:
+            plan = await get_crawl_plan(pool, url, category_url, fetcher, refresh_plan)
+            if not plan:
+                return False
+            complete = await scrape_plan_nodes(plan["nodes"], pool, scraped_products, brand_workers, fetcher, checkpoint)
 
-            # Navigate to the main category and scrape subcategories
-            navigate_to_main_category(page)
-            scrap_all_sub_categories(page,scraped_products)
-            scrape_all_brands(page, scraped_products)
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return False
+    finally:
+        await pool.close()
+        if fetcher:
+            await fetcher.close()
+        # The sink records completed pages and dedup keys, so let it catch up first. Draining rather than
+        # relying on close_sink(), which leaves the sink open while a job scheduler still holds it.
+        await get_sink().drain()
+        close_sink()
+        if complete and checkpoint:
+            finish_crawl(checkpoint)
+        scraped_products.close()
+        if checkpoint:
+            checkpoint.close()
+        get_blocker("amazon").report()
+        get_cache().report()
+        metrics.report()
+    return True
 
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-        finally:
-            browser.close()
+def dead_letter_brand_urls():
+    """The brands earlier runs gave up on, and the brands of the result pages they gave up on, each once."""
+    brand_urls = []
+    for entry in get_dead_letters().entries("amazon"):
+        brand_url = entry["url"] if entry["item_type"] == "brand" else entry["context"].get("brand_url")
+        if brand_url and brand_url not in brand_urls:
+            brand_urls.append(brand_url)
+    return brand_urls
+
+async def replay_dead_letters(url, brand_workers=BRAND_WORKERS, use_http=True, checkpoint_path=CHECKPOINT_PATH):
+    """Scrape again the brands and result pages earlier runs gave up on.
+
+    With a checkpoint only their pending result pages are fetched. Entries are resolved as their items
+    are saved. Returns False if the replay stopped on an error or left any of them failing.
+    """
+    brand_urls = dead_letter_brand_urls()
+    if not brand_urls:
+        logging.info("No dead letters to replay.")
+        return True
+    logging.info(f"Replaying {len(brand_urls)} brands from the dead-letter queue.")
+    completed = await scrape_amazon_bestsellers(
+        url, brand_workers=brand_workers, use_http=use_http, checkpoint_path=checkpoint_path, resume=True, brand_urls=brand_urls
+    )
+    return completed and not get_dead_letters().entries("amazon")
 
 if __name__ == "__main__":
     url = "https://www.amazon.in"
-    scrape_amazon_bestsellers(url)
\ No newline at end of file
+    asyncio.run(scrape_amazon_bestsellers(url))
@@ -0,0 +1,152 @@
+import asyncio
+import html
+import logging
+import os
+import re
+from collections import Counter
+
+from metrics import log_item
+from pacing import goto, pacer
+from retry import BlockedError
+
+PDF_MODES = ("queue", "deferred", "off")
+
+def safe_filename(name):
+    return re.sub(r'[<>:"/\\|?*]', '', name)
+
+def write_text(path, text):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+def read_text(path):
+    with open(path, encoding='utf-8') as file:
+        return file.read()
+
+HEAD = re.compile(r"<head(?:\s[^>]*)?>", re.IGNORECASE)
+
+def with_base_url(page_html, url):
+    """Point the relative links of saved HTML back at the page it came from, so its CSS and images resolve."""
+    base = f'<base href="{html.escape(url, quote=True)}">'
+    match = HEAD.search(page_html)
+    if match:
+        # The first <base> of a document wins, so it goes first in <head>
+        return page_html[:match.end()] + base + page_html[match.end():]
+    return base + page_html
+
+class ArchivePipeline:
+    """Saves pages as HTML on pages leased from a browser pool, with PDF rendering as a separate queue stage.
+
+    `pdf_mode` is "queue" to render PDFs while snapshots are still being taken, "deferred" to render
+    them once every snapshot is done, or "off". PDFs are rendered from the saved HTML, based at the
+    page's URL so its CSS and images resolve, and pages are only fetched once. `pdf_pool` should hold
+    a headless browser that loads images, Chromium cannot print in headed mode. Pages are leased per item, so the pools
+    can recycle their contexts between pages. The dedup key of an item is committed to `dedup` once its
+    snapshot is saved, so a failed page is retried next run.
+    With a `retrier` failed snapshots are retried, and dead-lettered as "snapshot" items with their name,
+    key and output directory once they run out of attempts.
+    """
+
+    def __init__(self, pool, output_dir, workers=3, pdf_mode="queue", pdf_pool=None, pdf_workers=1, dedup=None, retrier=None):
+        if pdf_mode not in PDF_MODES:
+            raise ValueError(f"pdf_mode must be one of {PDF_MODES}, got {pdf_mode!r}")
+        self.pool = pool
+        self.output_dir = output_dir
+        self.workers = workers
+        self.pdf_mode = pdf_mode
+        self.pdf_pool = pdf_pool or pool
+        self.pdf_workers = pdf_workers
+        self.dedup = dedup
+        self.retrier = retrier
+        self.snapshot_queue = asyncio.Queue()
+        self.pdf_queue = asyncio.Queue()
+        self.submitted = set()
+        self.stats = Counter()
+        self.snapshot_tasks = []
+        self.pdf_tasks = []
+
+    def start(self):
+        self.snapshot_tasks = [asyncio.create_task(self.snapshot_worker(worker_id)) for worker_id in range(self.workers)]
+        if self.pdf_mode == "queue":
+            self.start_pdf_workers()
+
+    def start_pdf_workers(self):
+        self.pdf_tasks = [asyncio.create_task(self.pdf_worker(worker_id)) for worker_id in range(self.pdf_workers)]
+
+    def submit(self, url, name, key=None):
+        """Queue a page for archiving under `name`. URLs already submitted are ignored."""
+        if url in self.submitted:
+            return False
+        self.submitted.add(url)
+        self.snapshot_queue.put_nowait((url, name, key))
+        return True
+
+    async def snapshot_worker(self, worker_id):
+        while True:
+            item = await self.snapshot_queue.get()
+            if item is None:
+                break
+            url, name, key = item
+
+            async def take_snapshot():
+                async with self.pool.lease() as page:
+                    await self.snapshot(page, worker_id, url, name)
+
+            try:
+                if self.retrier:
+                    context = {"name": name, "key": key, "output_dir": self.output_dir}
+                    await self.retrier.run(url, take_snapshot, "snapshot", context)
+                else:
+                    await take_snapshot()
+                if self.dedup is not None and key is not None:
+                    self.dedup.commit([key])
+            except Exception as e:
+                self.stats["snapshot_failures"] += 1
+                logging.error(f"Archive worker {worker_id} failed on {url}: {e}")
+
+    async def snapshot(self, page, worker_id, url, name):
+        try:
+            await pacer.pause(url)
+            await goto(page, url)  # Resolves on the load event
+        except Exception as e:
+            if await pacer.check_page(page):
+                raise BlockedError(f"Captcha on {url}") from e
+            raise
+        html_path = os.path.join(self.output_dir, f"{safe_filename(name)}.html")
+        await asyncio.to_thread(write_text, html_path, await page.content())
+        self.stats["snapshots"] += 1
+        log_item("snapshot", "Archive worker %s saved %s", worker_id, html_path)
+        if self.pdf_mode != "off":
+            self.pdf_queue.put_nowait((url, html_path, os.path.join(self.output_dir, f"{safe_filename(name)}.pdf")))
+
+    async def pdf_worker(self, worker_id):
+        while True:
+            item = await self.pdf_queue.get()
+            if item is None:
+                break
+            url, html_path, pdf_path = item
+            try:
+                async with self.pdf_pool.lease() as page:
+                    await page.set_content(with_base_url(await asyncio.to_thread(read_text, html_path), url))
+                    await page.pdf(path=pdf_path)
+                self.stats["pdfs"] += 1
+            except Exception as e:
+                self.stats["pdf_failures"] += 1
+                logging.error(f"PDF worker {worker_id} failed on {html_path}: {e}")
+
+    async def close(self):
+        """Finish every queued snapshot and PDF, then stop the workers and return the statistics."""
+        for _ in self.snapshot_tasks:
+            self.snapshot_queue.put_nowait(None)
+        await asyncio.gather(*self.snapshot_tasks)
+
+        if self.pdf_mode == "deferred":
+            self.start_pdf_workers()
+        for _ in self.pdf_tasks:
+            self.pdf_queue.put_nowait(None)
+        await asyncio.gather(*self.pdf_tasks)
+
+        logging.info(
+            f"Archived {self.stats['snapshots']} pages and {self.stats['pdfs']} PDFs "
+            f"({self.stats['snapshot_failures']} snapshot and {self.stats['pdf_failures']} PDF failures)"
+        )
+        return dict(self.stats)
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import amazon
+import mock_site
+import olx
+import youtube
+from metrics import metrics
+from pacing import pacer
+
+try:
+    import psutil
+except ImportError:  # Optional, without it peak RSS comes from getrusage and misses the browser while it runs
+    psutil = None
+
+RESULTS_DIR = "benchmarks/results"
+
+# Runs of each pipeline, the reported numbers are their medians
+REPEAT = 3
+
+# Seconds between two samples of the memory of the benchmarked process and its browsers
+RSS_INTERVAL = 0.1
+
+# Each pipeline runs a scraper entry point against its mock site, as (site, coroutine function of the mock URL)
+PIPELINES = {
+    "amazon": ("amazon", lambda url: amazon.scrape_amazon_bestsellers(url, use_http=True, checkpoint_path=None, resume=False)),
+    "amazon-browser": ("amazon", lambda url: amazon.scrape_amazon_bestsellers(url, use_http=False, checkpoint_path=None, resume=False)),
+    "olx": ("olx", lambda url: olx.run(url, mock_site.OLX_QUERY, mock_site.OLX_LOCATION, use_http=True)),
+    "olx-browser": ("olx", lambda url: olx.run(url, mock_site.OLX_QUERY, mock_site.OLX_LOCATION, use_http=False)),
+    "youtube": ("youtube", lambda url: youtube.main_youtube_scraper(url, mock_site.YOUTUBE_QUERY)),
+}
+
+def run_headless():
+    """Point every scraper's browser launch at headless mode, there is nobody to watch the benchmark."""
+    amazon.LAUNCH_OPTIONS = {**amazon.LAUNCH_OPTIONS, "headless": True}
+    olx.LISTING_HEADLESS = True
+    youtube.LAUNCH_OPTIONS = {**youtube.LAUNCH_OPTIONS, "headless": True}
+
+class PeakMemory:
+    """Samples the resident memory of this process and all its children (Playwright's driver and browsers)."""
+
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        process = psutil.Process()
+        total = 0
+        for member in [process] + process.children(recursive=True):
+            try:
+                total += member.memory_info().rss
+            except psutil.Error:
+                pass  # Exited between listing and reading it
+        self.peak = max(self.peak, total)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        if psutil is not None:
+            self.sample()
+            self.thread = threading.Thread(target=self.run, name="peak-memory", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """Stop sampling and return the peak in bytes."""
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            return self.peak
+        # ru_maxrss is in KiB on Linux. Children only count once they have exited, and only the largest of them.
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        return usage * 1024
+
+def run_one(name, fixtures_dir, latency):
+    """Run one pipeline against its mock site in this process and return its measurements."""
+    site_name, pipeline = PIPELINES[name]
+    site = mock_site.MockSite(site_name, fixtures_dir, latency).start()
+    run_headless()
+    pacer.enabled = False  # The benchmark measures the scraper, not its politeness delays
+    metrics.reset()
+    memory = PeakMemory()
+    memory.start()
+    start = time.perf_counter()
+    try:
+        completed = asyncio.run(pipeline(site.url))
+    finally:
+        elapsed = time.perf_counter() - start
+        peak_rss = memory.stop()
+        site.stop()
+
+    summary = metrics.summary()
+    counters = summary["counters"]
+    return {
+        "completed": bool(completed),
+        "seconds": elapsed,
+        "requests": site.requests,
+        "pages": counters.get("pages", 0),
+        "items": counters.get("items", 0),
+        "rows_written": counters.get("rows_written", 0),
+        "pages_per_sec": counters.get("pages", 0) / elapsed if elapsed else 0.0,
+        "items_per_sec": counters.get("items", 0) / elapsed if elapsed else 0.0,
+        "peak_rss_mb": peak_rss / 1_000_000,
+        "counters": counters,
+        "stages": {
+            stage: {key: stats[key] for key in ("count", "seconds", "mean", "p50", "p95")}
+            for stage, stats in summary["stages"].items()
+        },
+    }
+
+def run_isolated(name, fixtures_dir, latency):
+    """Run one pipeline in a fresh interpreter and working directory.
+
+    Every run starts from empty caches, dedup keys and output files, and its memory is its own.
+    """
+    with tempfile.TemporaryDirectory(prefix=f"benchmark-{name}-") as workdir:
+        output = os.path.join(workdir, "result.json")
+        command = [
+            sys.executable, os.path.abspath(__file__), "--fixtures", os.path.abspath(fixtures_dir),
+            "run-one", name, "--latency", str(latency), "--output", output,
+        ]
+        process = subprocess.run(command, cwd=workdir)
+        if process.returncode != 0 or not os.path.exists(output):
+            logging.error(f"Benchmark of {name} exited with code {process.returncode}")
+            return None
+        with open(output, encoding="utf-8") as file:
+            return json.load(file)
+
+def median_result(runs):
+    """Median of every measurement across repeated runs of a pipeline."""
+    result = {
+        key: statistics.median(run[key] for run in runs)
+        for key in ("seconds", "requests", "pages", "items", "rows_written", "pages_per_sec", "items_per_sec", "peak_rss_mb")
+    }
+    result["completed"] = all(run["completed"] for run in runs)
+    result["runs"] = len(runs)
+    stages = {}
+    for stage in sorted({stage for run in runs for stage in run["stages"]}):
+        samples = [run["stages"][stage] for run in runs if stage in run["stages"]]
+        stages[stage] = {key: statistics.median(sample[key] for sample in samples) for key in ("count", "seconds", "mean", "p50", "p95")}
+    result["stages"] = stages
+    return result
+
+def git_commit():
+    """Current commit, marked "-dirty" when the tree has uncommitted changes."""
+    repo = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if status.strip() else "")
+
+def print_result(name, result):
+    print(
+        f"{name:<15} {result['pages_per_sec']:>8.1f} pages/s {result['items_per_sec']:>9.1f} items/s "
+        f"{result['seconds']:>7.1f}s {result['peak_rss_mb']:>7.0f} MB peak RSS"
+        f"{'' if result['completed'] else '  (did not complete)'}"
+    )
+    for stage, stats in sorted(result["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"    {stage:<12} {stats['count']:>7.0f} calls mean {stats['mean']:.4f}s, p50 <= {stats['p50']}s, p95 <= {stats['p95']}s")
+
+def run_benchmarks(names, fixtures_dir, latency, repeat, results_dir):
+    """Benchmark every pipeline in `names` and save the results. Returns the path they were saved to."""
+    for site in {PIPELINES[name][0] for name in names}:
+        if not os.path.exists(os.path.join(fixtures_dir, site, "index.json")):
+            mock_site.generate_fixtures(fixtures_dir)
+            break
+
+    report = {
+        "commit": git_commit(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fixtures": mock_site.fixtures_digest(fixtures_dir),
+        "latency": latency,
+        "repeat": repeat,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pipelines": {},
+    }
+    for name in names:
+        runs = []
+        for attempt in range(repeat):
+            logging.info(f"Benchmarking {name}, run {attempt + 1} of {repeat}")
+            run = run_isolated(name, fixtures_dir, latency)
+            if run is not None:
+                runs.append(run)
+        if not runs:
+            report["pipelines"][name] = {"completed": False, "runs": 0}
+            continue
+        report["pipelines"][name] = median_result(runs)
+        print_result(name, report["pipelines"][name])
+
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+    print(f"Results saved to {path}")
+    return path
+
+def compare(baseline_path, candidate_path):
+    """Print the change of every pipeline's throughput and memory between two saved results."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(candidate_path, encoding="utf-8") as file:
+        candidate = json.load(file)
+    for key in ("fixtures", "latency", "platform"):
+        if baseline.get(key) != candidate.get(key):
+            print(f"Warning: {key} differs ({baseline.get(key)} vs {candidate.get(key)}), the numbers are not directly comparable.")
+
+    print(f"{baseline['commit']} -> {candidate['commit']}")
+    for name in sorted(set(baseline["pipelines"]) & set(candidate["pipelines"])):
+        before, after = baseline["pipelines"][name], candidate["pipelines"][name]
+        if not before.get("runs") or not after.get("runs"):
+            print(f"{name:<15} missing runs")
+            continue
+        changes = []
+        for key, unit in (("pages_per_sec", "pages/s"), ("items_per_sec", "items/s"), ("seconds", "s"), ("peak_rss_mb", "MB")):
+            ratio = after[key] / before[key] if before[key] else (1.0 if not after[key] else float("inf"))
+            changes.append(f"{unit} {before[key]:.1f} -> {after[key]:.1f} ({ratio:.2f}x)")
+        print(f"{name:<15} " + ", ".join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers offline against local mock sites.")
+    parser.add_argument("--fixtures", default=mock_site.FIXTURES_DIR, help="directory of the mock sites' fixtures")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="benchmark the pipelines and save the results")
+    run.add_argument("--pipelines", nargs="+", choices=sorted(PIPELINES), default=sorted(PIPELINES))
+    run.add_argument("--repeat", type=int, default=REPEAT)
+    run.add_argument("--latency", type=float, default=0.0, help="seconds added to every mock response")
+    run.add_argument("--results", default=RESULTS_DIR, help="directory results are saved to")
+
+    commands.add_parser("fixtures", help="generate the fixtures again")
+
+    compare_command = commands.add_parser("compare", help="compare two saved results")
+    compare_command.add_argument("baseline")
+    compare_command.add_argument("candidate")
+
+    run_one_command = commands.add_parser("run-one", help=argparse.SUPPRESS)
+    run_one_command.add_argument("pipeline", choices=sorted(PIPELINES))
+    run_one_command.add_argument("--latency", type=float, default=0.0)
+    run_one_command.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmarks(args.pipelines, args.fixtures, args.latency, args.repeat, args.results)
+    elif args.command == "fixtures":
+        mock_site.generate_fixtures(args.fixtures)
+    elif args.command == "compare":
+        compare(args.baseline, args.candidate)
+    elif args.command == "run-one":
+        result = run_one(args.pipeline, args.fixtures, args.latency)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(result, file)
+
+if __name__ == "__main__":
+    main()
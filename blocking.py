@@ -0,0 +1,148 @@
+import logging
+import re
+from collections import Counter
+
+from metrics import metrics
+
+# Per-site blocking rules. Requests are aborted when their resource type or URL matches,
+# unless the URL matches one of the allow patterns.
+SITE_PROFILES = {
+    "amazon": {
+        "resource_types": {"image", "media", "font"},
+        "url_patterns": [
+            r"amazon-adsystem\.com",
+            r"fls-\w+\.amazon\.",
+            r"unagi\.amazon\.",
+            r"/uedata",
+            r"doubleclick\.net",
+            r"google-analytics\.com",
+        ],
+        "allow_patterns": [],
+    },
+    "olx": {
+        "resource_types": {"image", "media", "font"},
+        "url_patterns": [
+            r"googletagmanager\.com",
+            r"google-analytics\.com",
+            r"doubleclick\.net",
+            r"googlesyndication\.com",
+            r"facebook\.(net|com)/.*(tr|signals)",
+            r"hotjar\.com",
+            r"clarity\.ms",
+        ],
+        "allow_patterns": [],
+    },
+    "youtube": {
+        # Channel avatars are only read through their src attribute, so the images themselves can go
+        "resource_types": {"image", "media", "font"},
+        "url_patterns": [
+            r"/api/stats/",
+            r"/ptracking",
+            r"/youtubei/v1/log_event",
+            r"/pagead/",
+            r"doubleclick\.net",
+            r"googleads\.",
+            r"google-analytics\.com",
+        ],
+        "allow_patterns": [],
+    },
+}
+
+# Archived ads are printed with their pictures, so the PDF browser only drops the trackers
+SITE_PROFILES["olx-pdf"] = {**SITE_PROFILES["olx"], "resource_types": set()}
+
+# Typical transfer sizes used to estimate savings until real sizes for a type have been observed
+TYPICAL_SIZES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 60_000,
+    "script": 30_000,
+    "stylesheet": 20_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+}
+DEFAULT_SIZE = 10_000
+
+class ResourceBlocker:
+    """Aborts unneeded requests through Playwright routing and keeps per-run traffic statistics."""
+
+    def __init__(self, site, resource_types=(), url_patterns=(), allow_patterns=()):
+        self.site = site
+        self.resource_types = set(resource_types)
+        self.url_pattern = re.compile("|".join(url_patterns)) if url_patterns else None
+        self.allow_pattern = re.compile("|".join(allow_patterns)) if allow_patterns else None
+        self.reset()
+
+    def reset(self):
+        self.blocked = Counter()
+        self.allowed = Counter()
+        self.bytes_saved = 0
+        self.bytes_downloaded = 0
+        self.observed_bytes = Counter()
+        self.observed_count = Counter()
+
+    def should_block(self, url, resource_type):
+        if self.allow_pattern and self.allow_pattern.search(url):
+            return False
+        if resource_type in self.resource_types:
+            return True
+        return bool(self.url_pattern and self.url_pattern.search(url))
+
+    def estimate_size(self, resource_type):
+        """Average observed size of a resource type, falling back to a typical size."""
+        if self.observed_count[resource_type]:
+            return self.observed_bytes[resource_type] // self.observed_count[resource_type]
+        return TYPICAL_SIZES.get(resource_type, DEFAULT_SIZE)
+
+    async def attach(self, target):
+        """Install the blocker on a page or browser context."""
+        await target.route("**/*", self.handle_route)
+        target.on("response", self.record_response)
+
+    async def handle_route(self, route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.blocked[request.resource_type] += 1
+            self.bytes_saved += self.estimate_size(request.resource_type)
+            metrics.count("blocked_requests", site=self.site)
+            await route.abort()
+        else:
+            self.allowed[request.resource_type] += 1
+            # Let other route handlers (if any) see the request before it goes to the network
+            await route.fallback()
+
+    def record_response(self, response):
+        length = response.headers.get("content-length")
+        if not length or not length.isdigit():
+            return
+        resource_type = response.request.resource_type
+        self.bytes_downloaded += int(length)
+        metrics.count("bytes_downloaded", int(length), site=self.site)
+        self.observed_bytes[resource_type] += int(length)
+        self.observed_count[resource_type] += 1
+
+    def report(self):
+        """Log and return the blocking statistics of this run."""
+        stats = {
+            "site": self.site,
+            "blocked_requests": sum(self.blocked.values()),
+            "allowed_requests": sum(self.allowed.values()),
+            "blocked_by_type": dict(self.blocked),
+            "bytes_saved_estimate": self.bytes_saved,
+            "bytes_downloaded": self.bytes_downloaded,
+        }
+        logging.info(
+            f"[{self.site}] Blocked {stats['blocked_requests']} of "
+            f"{stats['blocked_requests'] + stats['allowed_requests']} requests, "
+            f"saved ~{self.bytes_saved / 1_000_000:.1f} MB, downloaded {self.bytes_downloaded / 1_000_000:.1f} MB "
+            f"(blocked by type: {stats['blocked_by_type']})"
+        )
+        return stats
+
+_blockers = {}
+
+def get_blocker(site):
+    """Return the shared blocker for a site, so every context of a run reports into the same totals."""
+    if site not in _blockers:
+        _blockers[site] = ResourceBlocker(site, **SITE_PROFILES[site])
+    return _blockers[site]
@@ -0,0 +1,226 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from email.utils import formatdate
+
+from pacing import looks_like_captcha, pacer
+
+CACHE_DIR = "data/cache"
+MAX_CACHE_BYTES = 500_000_000
+
+# Pages worth caching as (URL pattern, time to live in seconds). The first matching rule wins, other
+# URLs are never cached. Expired entries are revalidated with ETag / Last-Modified before refetching.
+CACHE_RULES = [
+    (r"^https://www\.amazon\.in/?(\?.*)?$", 24 * 3600),  # Home page
+    (r"^https://www\.amazon\.in/[^?]*/b/?\?", 12 * 3600),  # Category and subcategory pages
+    (r"^https://www\.amazon\.in/s\?", 3600),  # Brand listings and result pages
+    (r"^https://www\.olx\.com\.pk/?$", 24 * 3600),
+    (r"^https://www\.olx\.com\.pk/(items|[^/?]+_g\d+)/", 600),  # Listings, everywhere or in a location, change quickly
+]
+
+# Headers describing the encoding on the wire, which no longer apply to the decoded body we keep
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    url TEXT PRIMARY KEY,
+    body_hash TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+"""
+
+class PageCache:
+    """On-disk page cache: bodies stored by content hash, an SQLite index with TTLs and LRU eviction.
+
+    Plugs into Playwright routing for document requests and into the HTTP fetch path. Both read and
+    write it on worker threads, so the disk never holds up the event loop.
+    """
+
+    def __init__(self, directory=CACHE_DIR, rules=CACHE_RULES, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in rules]
+        self.max_bytes = max_bytes
+        self.connection = sqlite3.connect(os.path.join(directory, "index.sqlite"), check_same_thread=False)
+        # Reentrant, storing an entry evicts and looking one up may delete it while holding the lock
+        self.lock = threading.RLock()
+        self.connection.executescript(SCHEMA)
+        self.stats = Counter()
+
+    def ttl_for(self, url):
+        for pattern, ttl in self.rules:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def lookup(self, url):
+        """Return the cached entry for `url` with a `fresh` flag, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT body_hash, status, headers, expires_at FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        body_hash, status, headers, expires_at = row
+        if not os.path.exists(self.object_path(body_hash)):
+            self.delete(url)
+            return None
+        return {"url": url, "body_hash": body_hash, "status": status, "headers": json.loads(headers), "fresh": time.time() < expires_at}
+
+    def object_path(self, body_hash):
+        return os.path.join(self.objects_dir, body_hash[:2], body_hash)
+
+    def load_body(self, entry):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), entry["url"]))
+        with open(self.object_path(entry["body_hash"]), "rb") as file:
+            return file.read()
+
+    def revalidation_headers(self, entry):
+        headers = {}
+        if entry["headers"].get("etag"):
+            headers["If-None-Match"] = entry["headers"]["etag"]
+        if entry["headers"].get("last-modified"):
+            headers["If-Modified-Since"] = entry["headers"]["last-modified"]
+        return headers
+
+    def store(self, url, status, headers, body):
+        """Cache a successful response. Captcha pages and uncacheable URLs are ignored."""
+        ttl = self.ttl_for(url)
+        if ttl is None or status != 200 or looks_like_captcha(body.decode("utf-8", errors="ignore")):
+            return
+        headers = {name.lower(): value for name, value in headers.items() if name.lower() not in DROPPED_HEADERS}
+        headers.setdefault("date", formatdate(usegmt=True))
+        body_hash = hashlib.sha256(body).hexdigest()
+        path = self.object_path(body_hash)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(body)
+
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO entries (url, body_hash, status, headers, size, stored_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, status, json.dumps(headers), len(body), now, now + ttl, now),
+            )
+        self.stats["stored"] += 1
+        self.evict()
+
+    def refresh(self, url):
+        """Extend a revalidated entry by its URL's TTL."""
+        ttl = self.ttl_for(url) or 0
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE entries SET expires_at = ?, last_access = ? WHERE url = ?", (now + ttl, now, url))
+
+    def delete(self, url):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM entries WHERE url = ?", (url,))
+
+    def evict(self):
+        """Drop least recently used entries until the distinct bodies fit in `max_bytes`."""
+        with self.lock:
+            total = self.connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY body_hash)"
+            ).fetchone()[0]
+            while total > self.max_bytes:
+                row = self.connection.execute("SELECT url, body_hash, size FROM entries ORDER BY last_access LIMIT 1").fetchone()
+                if row is None:
+                    break
+                url, body_hash, size = row
+                self.delete(url)
+                # Bodies are shared between URLs with identical content, only remove the last reference
+                if not self.connection.execute("SELECT 1 FROM entries WHERE body_hash = ?", (body_hash,)).fetchone():
+                    try:
+                        os.remove(self.object_path(body_hash))
+                    except FileNotFoundError:
+                        pass
+                    total -= size
+                self.stats["evicted"] += 1
+
+    async def attach(self, target):
+        """Serve cacheable document requests of a page or browser context from the cache."""
+        await target.route("**/*", self.handle_route)
+
+    async def handle_route(self, route):
+        request = route.request
+        if request.resource_type != "document" or request.method != "GET" or self.ttl_for(request.url) is None:
+            await route.fallback()
+            return
+
+        entry = await asyncio.to_thread(self.lookup, request.url)
+        if entry and entry["fresh"]:
+            self.stats["hits"] += 1
+            await route.fulfill(status=entry["status"], headers=entry["headers"], body=await asyncio.to_thread(self.load_body, entry))
+            return
+
+        headers = dict(request.headers)
+        if entry:
+            headers.update(self.revalidation_headers(entry))
+        # A goto already holds a request slot for its page. Navigations started by clicks and form
+        # submits take one here, and taking a second for a goto would deadlock it at low concurrency.
+        slot = nullcontext() if pacer.holds(request_page(request)) else pacer.request(request.url)
+        try:
+            async with slot:
+                # Redirects go back to the browser, so the page ends up on the same URL as without the cache
+                response = await route.fetch(headers=headers, max_redirects=0)
+        except Exception as e:
+            logging.debug(f"Cache fetch failed for {request.url}, letting the browser load it: {e}")
+            await route.fallback()
+            return
+
+        if entry and response.status == 304:
+            self.stats["revalidated"] += 1
+            await asyncio.to_thread(self.refresh, request.url)
+            await route.fulfill(status=entry["status"], headers=entry["headers"], body=await asyncio.to_thread(self.load_body, entry))
+            return
+
+        self.stats["misses"] += 1
+        body = await response.body()
+        await asyncio.to_thread(self.store, request.url, response.status, response.headers, body)
+        await route.fulfill(response=response, body=body)
+
+    def report(self):
+        """Log and return the cache statistics of this run."""
+        stats = {name: self.stats[name] for name in ("hits", "revalidated", "misses", "stored", "evicted")}
+        lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+        hit_rate = (stats["hits"] + stats["revalidated"]) / lookups if lookups else 0
+        logging.info(f"Page cache: {stats} (hit rate {hit_rate:.0%})")
+        return stats
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def request_page(request):
+    """The page a routed request belongs to, or None for requests without one (e.g. from service workers)."""
+    try:
+        return request.frame.page
+    except Exception:
+        return None
+
+_cache = None
+
+def get_cache():
+    """Return the process-wide page cache, so every context and the HTTP path share it."""
+    global _cache
+    if _cache is None:
+        _cache = PageCache()
+    return _cache
@@ -0,0 +1,135 @@
+import json
+import logging
+import re
+
+from metrics import metrics, site_of
+from pacing import THROTTLE_STATUSES, pacer
+
+# Headers the browser or the request context sets itself and that must not be replayed
+SKIPPED_HEADERS = {"content-length", "host", "cookie", "connection", "accept-encoding"}
+
+class ResponseCapture:
+    """Decodes the JSON API responses behind a page into records, instead of scraping the rendered DOM.
+
+    `decode(payload)` returns (records, has_more), where has_more is None when the payload does not say.
+    Once a matching request has been seen, `next_request(last_request, payload)` can build the request
+    for the following page as a dict with url, method, headers and post_data (or return None).
+    `fetch_next` then sends it directly with the page's cookies, so later pages skip rendering entirely.
+    """
+
+    def __init__(self, pattern, decode, next_request=None, name="api"):
+        self.pattern = re.compile(pattern)
+        self.decode = decode
+        self.next_request = next_request
+        self.name = name
+        self.records = []
+        self.responses = 0
+        self.exhausted = False
+        self.last_request = None
+        self.last_payload = None
+
+    def attach(self, page):
+        page.on("response", self.on_response)
+
+    async def on_response(self, response):
+        if not self.pattern.search(response.url) or not response.ok:
+            return
+        try:
+            payload = await response.json()
+        except Exception as e:
+            logging.debug(f"[{self.name}] Could not decode response from {response.url}: {e}")
+            return
+        request = response.request
+        self.handle_payload({
+            "url": request.url,
+            "method": request.method,
+            "headers": request.headers,
+            "post_data": request.post_data,
+        }, payload)
+
+    def handle_payload(self, request, payload):
+        site = site_of(request["url"])
+        try:
+            with metrics.timer("extraction", site=site):
+                records, has_more = self.decode(payload)
+        except Exception as e:
+            logging.warning(f"[{self.name}] Could not read records from the API response: {e}")
+            return
+        if not records and has_more is None:
+            return  # A matching URL that does not carry results
+        metrics.count("items", len(records), site=site)
+        self.responses += 1
+        self.records.extend(records)
+        self.exhausted = has_more is False
+        self.last_request = request
+        self.last_payload = payload
+
+    def take(self):
+        """Return the records decoded since the previous call."""
+        records, self.records = self.records, []
+        return records
+
+    def can_fetch_next(self):
+        return bool(self.next_request and self.last_request and not self.exhausted)
+
+    async def fetch_next(self, page):
+        """Request the next page of the API directly. Returns False when that is not possible or fails."""
+        if not self.can_fetch_next():
+            return False
+        request = self.next_request(self.last_request, self.last_payload)
+        if request is None:
+            return False
+
+        headers = {name: value for name, value in request["headers"].items() if name.lower() not in SKIPPED_HEADERS}
+        await pacer.pause(request["url"])
+        site = site_of(request["url"])
+        try:
+            async with pacer.request(request["url"]):
+                with metrics.timer("navigation", site=site):
+                    response = await page.request.fetch(
+                        request["url"], method=request["method"], headers=headers, data=request["post_data"]
+                    )
+                    body = await response.body()
+        except Exception as e:
+            logging.warning(f"[{self.name}] Direct API request failed: {e}")
+            return False
+        metrics.count("pages", site=site)
+        metrics.count("bytes_downloaded", len(body), site=site)
+
+        if response.status in THROTTLE_STATUSES:
+            pacer.record_throttle(request["url"], f"HTTP {response.status}")
+            return False
+        if not response.ok:
+            logging.warning(f"[{self.name}] Direct API request returned HTTP {response.status}")
+            return False
+
+        pacer.record_success(request["url"])
+        try:
+            payload = json.loads(body)
+        except Exception as e:
+            logging.warning(f"[{self.name}] Direct API response was not JSON: {e}")
+            return False
+        responses = self.responses
+        self.handle_payload(request, payload)
+        return self.responses > responses
+
+def find_key(payload, name):
+    """Yield every value stored under the key `name` anywhere in a JSON payload."""
+    stack = [payload]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            for key, child in value.items():
+                if key == name:
+                    yield child
+                else:
+                    stack.append(child)
+        elif isinstance(value, list):
+            stack.extend(reversed(value))
+
+def json_body(request):
+    """Parse the JSON body of a captured request, or return None."""
+    try:
+        return json.loads(request["post_data"]) if request["post_data"] else None
+    except ValueError:
+        return None
@@ -0,0 +1,89 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS completed (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+CREATE TABLE IF NOT EXISTS page_counts (
+    brand_url TEXT PRIMARY KEY,
+    total_pages INTEGER NOT NULL
+);
+"""
+
+class CrawlCheckpoint:
+    """Crawl frontier kept in SQLite: completed subcategories, brands and result pages.
+
+    Every write is committed straight away, so a crashed run resumes after its last completed page.
+    The crawl resets it once it completes, so progress never carries over into the next crawl.
+    Safe to share with the output sink's writer thread, which records pages once their rows are on disk.
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def is_done(self, kind, key):
+        with self.lock:
+            row = self.connection.execute("SELECT 1 FROM completed WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+        return row is not None
+
+    def all_done(self, kind, keys):
+        return all(self.is_done(kind, key) for key in keys)
+
+    def mark_done(self, kind, key):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO completed (kind, key, completed_at) VALUES (?, ?, ?)", (kind, key, time.time())
+            )
+
+    def complete_page(self, page_url):
+        """Record a result page as completed once the products saved from it are on disk."""
+        self.mark_done("page", page_url)
+
+    def get_page_count(self, brand_url):
+        with self.lock:
+            row = self.connection.execute("SELECT total_pages FROM page_counts WHERE brand_url = ?", (brand_url,)).fetchone()
+        return row[0] if row else None
+
+    def set_page_count(self, brand_url, total_pages):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO page_counts (brand_url, total_pages) VALUES (?, ?)", (brand_url, total_pages)
+            )
+
+    def summary(self):
+        with self.lock:
+            return dict(self.connection.execute("SELECT kind, COUNT(*) FROM completed GROUP BY kind").fetchall())
+
+    def reset(self):
+        """Forget all progress so the next crawl starts from scratch."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM completed")
+            self.connection.execute("DELETE FROM page_counts")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+def open_checkpoint(path, resume=True):
+    """Open the checkpoint at `path`, picking up an interrupted crawl unless `resume` is off."""
+    checkpoint = CrawlCheckpoint(path)
+    if not resume:
+        checkpoint.reset()
+    summary = checkpoint.summary()
+    if any(summary.values()):
+        logging.info(f"Resuming crawl from {path}: {summary}")
+    return checkpoint
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
+
+PLAN_DIR = "data/crawl_plans"
+
+# Raised whenever the plan layout or the way brand links are resolved changes, older plans are then discovered again
+PLAN_VERSION = 1
+
+# Plans older than this are discovered again, the carousels follow the season's bestsellers
+PLAN_TTL = 7 * 24 * 3600
+
+# Query parameters that only record how a link was reached and never change the results
+TRACKING_PARAMS = re.compile(r"^(ref|ref_|pf_rd_\w+|pd_rd_\w+|content-id|qid|crid|sprefix|_encoding)$")
+
+def plan_path(url, category_url=None, directory=PLAN_DIR):
+    """File the plan of one category is kept in, named after the site and the category crawled."""
+    name = hashlib.sha1(f"{url}|{category_url or ''}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(directory, f"{urlparse(url).hostname or 'site'}-{name}.json")
+
+def strip_tracking(url):
+    parts = urlparse(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMS.match(name)]
+    return urlunparse(parts._replace(query=urlencode(query), fragment=""))
+
+def resolve_brand_url(page_url, href, text=None, node=None):
+    """The search URL a brand link leads to, so the brand can be opened without clicking through the carousel.
+
+    Search links are kept without their tracking parameters. Links to brand stores and landing pages are
+    replaced by a search for the brand's name, within the category `node` when it is known.
+    """
+    url = urljoin(page_url, href)
+    path = urlparse(url).path
+    if path == "/s" or path.startswith("/s/") or not text:
+        return strip_tracking(url)
+    query = {"k": text}
+    if node:
+        query["rh"] = f"n:{node}"
+    return urljoin(page_url, "/s?" + urlencode(query))
+
+def category_node(url):
+    """The browse node ID of a category URL, e.g. 976419031 in /electronics/b/?node=976419031."""
+    return dict(parse_qsl(urlparse(url).query)).get("node")
+
+def new_plan(url, category_url, nodes):
+    """A crawl plan: the subcategory pages of a category (and the category page itself) with their brands' URLs."""
+    return {
+        "version": PLAN_VERSION,
+        "created": time.time(),
+        "url": url,
+        "category_url": category_url,
+        "nodes": nodes,
+    }
+
+def plan_brand_urls(plan):
+    """Every brand URL of the plan in crawl order, each once."""
+    brand_urls = []
+    for node in plan["nodes"]:
+        for brand_url in node["brands"]:
+            if brand_url not in brand_urls:
+                brand_urls.append(brand_url)
+    return brand_urls
+
+def load_plan(path, ttl=PLAN_TTL):
+    """Return the plan saved at `path`, or None if there is none, it is from another version or it expired."""
+    try:
+        with open(path, encoding="utf-8") as file:
+            plan = json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Could not read the crawl plan {path}: {e}")
+        return None
+    if plan.get("version") != PLAN_VERSION:
+        logging.info(f"Crawl plan {path} is from version {plan.get('version')}, discovering the category again.")
+        return None
+    if time.time() - plan.get("created", 0) > ttl:
+        logging.info(f"Crawl plan {path} expired, discovering the category again.")
+        return None
+    return plan
+
+def save_plan(path, plan):
+    """Write a plan, replacing the previous one atomically."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        json.dump(plan, file, indent=1)
+    os.replace(temporary_path, path)
@@ -0,0 +1,216 @@
+import hashlib
+import logging
+import math
+import os
+import sqlite3
+import threading
+import uuid
+
+DEDUP_PATH = "data/dedup.sqlite"
+
+# Keys the smallest Bloom filter is sized for (about 120 KB). Filters are sized from the keys on disk and
+# rebuilt bigger once they fill up. A filter only saves disk lookups, a false positive costs one indexed
+# read and never drops an item.
+BLOOM_MIN_CAPACITY = 100_000
+BLOOM_ERROR_RATE = 0.01
+
+# Owner of the claims made by this process, so a crawl starting up can tell them from those of a process that died
+PROCESS_TOKEN = uuid.uuid4().hex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    namespace TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    PRIMARY KEY (namespace, hash)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS claims (
+    namespace TEXT NOT NULL,
+    hash INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    PRIMARY KEY (namespace, hash)
+) WITHOUT ROWID;
+"""
+
+def key_hash(key):
+    """64-bit hash of a dedup key, stored instead of the key itself."""
+    return int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+def claim(seen, key):
+    """Add `key` to `seen` and return True, or return False if it was there already.
+
+    Objects with a `claim` method, like the persistent DedupIndex, check and add in one step.
+    """
+    if hasattr(seen, "claim"):
+        return seen.claim(key)
+    if key in seen:
+        return False
+    seen.add(key)
+    return True
+
+class BloomFilter:
+    def __init__(self, capacity=BLOOM_MIN_CAPACITY, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.count = 0
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hash_count = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, hashed):
+        hashed &= 0xFFFFFFFFFFFFFFFF
+        first, second = hashed & 0xFFFFFFFF, (hashed >> 32) | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, hashed):
+        self.count += 1
+        for position in self.positions(hashed):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, hashed):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(hashed))
+
+class DedupIndex:
+    """Dedup keys that persist across runs: 64-bit key hashes in SQLite, screened by an in-memory Bloom filter.
+
+    `claim(key)` returns True for a key never seen before. The claim is recorded in SQLite in one statement
+    that also checks the committed keys, so jobs, processes and indexes sharing the database can never both
+    claim a key. Claims are only turned into committed keys by `commit`, which callers run once the item is
+    saved, so an item lost in a crash is scraped again instead of being skipped for good.
+    """
+
+    def __init__(self, path=DEDUP_PATH, namespace="default", capacity=BLOOM_MIN_CAPACITY):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.namespace = namespace
+        self.capacity = capacity
+        self.pending = set()  # Claims of this index not committed yet, released on close
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()  # Commits come from the output sink's writer thread
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # Every claim is a transaction of its own. In WAL mode NORMAL skips the sync on commit and stays consistent,
+        # a power cut can only forget the latest keys, whose items are then scraped again.
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.bloom = None
+
+    def load_bloom(self):
+        """Build the Bloom filter from the keys on disk, sized for twice as many."""
+        with self.lock:
+            count = self.connection.execute("SELECT COUNT(*) FROM seen WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+            bloom = BloomFilter(max(self.capacity, count * 2))
+            for (hashed,) in self.connection.execute("SELECT hash FROM seen WHERE namespace = ?", (self.namespace,)):
+                bloom.add(hashed)
+        self.bloom = bloom
+        if count:
+            logging.info(f"[{self.namespace}] Dedup index holds {count} keys from earlier runs.")
+        return bloom
+
+    def remember(self, hashes):
+        """Add stored keys to the Bloom filter, dropping it to be rebuilt bigger once it is full."""
+        if self.bloom is None:
+            return
+        for hashed in hashes:
+            self.bloom.add(hashed)
+        if self.bloom.count > self.bloom.capacity:
+            self.bloom = None
+
+    def stored(self, hashed):
+        """Whether the key hash `hashed` was committed by this or an earlier run, as far as the Bloom filter knows.
+
+        Keys committed by other processes since the filter was built can be missed, `claim` checks those on disk.
+        """
+        # Read once, the writer thread drops a full filter to have it rebuilt
+        bloom = self.bloom or self.load_bloom()
+        if hashed not in bloom:
+            return False
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM seen WHERE namespace = ? AND hash = ?", (self.namespace, hashed)
+            ).fetchone()
+        return row is not None
+
+    def __contains__(self, key):
+        hashed = key_hash(key)
+        if self.stored(hashed):
+            return True
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT 1 FROM seen WHERE namespace = ? AND hash = ? UNION ALL "
+                "SELECT 1 FROM claims WHERE namespace = ? AND hash = ?",
+                (self.namespace, hashed, self.namespace, hashed),
+            ).fetchone()
+        return row is not None
+
+    def claim(self, key):
+        hashed = key_hash(key)
+        if self.stored(hashed):
+            return False
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO claims (namespace, hash, owner) SELECT ?, ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM seen WHERE namespace = ? AND hash = ?)",
+                (self.namespace, hashed, PROCESS_TOKEN, self.namespace, hashed),
+            )
+            claimed = cursor.rowcount == 1
+            if claimed:
+                self.pending.add(hashed)
+        if not claimed:
+            # Committed or claimed elsewhere, the filter sends the next lookup of this key to the disk
+            self.remember([hashed])
+        return claimed
+
+    def commit(self, keys):
+        """Persist claimed keys once their items are saved. Safe to call from the output sink's writer thread."""
+        hashes = [key_hash(key) for key in keys]
+        if not hashes:
+            return
+        rows = [(self.namespace, hashed) for hashed in hashes]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO seen (namespace, hash) VALUES (?, ?)", rows)
+            self.connection.executemany("DELETE FROM claims WHERE namespace = ? AND hash = ?", rows)
+            self.pending.difference_update(hashes)
+            self.remember(hashes)
+
+    def recover(self):
+        """Release the claims left by other processes, which died before committing them.
+
+        Run by the process starting a crawl, before any worker process of it claims keys. One crawl of a
+        namespace runs at a time, jobs of the same process share its claims and are left alone.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM claims WHERE namespace = ? AND owner != ?", (self.namespace, PROCESS_TOKEN)
+            )
+        if cursor.rowcount:
+            logging.info(f"[{self.namespace}] Released {cursor.rowcount} dedup claims left by an earlier process.")
+
+    def reset(self):
+        """Forget every key of this namespace, so the next run starts from scratch."""
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM seen WHERE namespace = ?", (self.namespace,))
+            self.connection.execute("DELETE FROM claims WHERE namespace = ?", (self.namespace,))
+            self.pending.clear()
+        self.bloom = None
+
+    def close(self):
+        """Release the claims of items that were never saved, so later runs and other jobs can scrape them."""
+        with self.lock:
+            with self.connection:
+                self.connection.executemany(
+                    "DELETE FROM claims WHERE namespace = ? AND hash = ?", [(self.namespace, hashed) for hashed in self.pending]
+                )
+            self.pending.clear()
+            self.connection.close()
+
+def open_dedup_index(namespace, reset=False, recover=True, path=DEDUP_PATH):
+    """Open the dedup keys of `namespace`, forgetting those of earlier runs when `reset` is set.
+
+    Claims left by processes that died are released unless `recover` is off, which worker processes
+    of a crawl need, as the claims of their siblings are live.
+    """
+    index = DedupIndex(path, namespace)
+    if reset:
+        index.reset()
+    elif recover:
+        index.recover()
+    return index
@@ -0,0 +1,39 @@
+import asyncio
+import logging
+
+async def gather_limited(coros, limit):
+    """Run coroutines concurrently with at most `limit` in flight, returning results in input order."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run_one(coro):
+        async with semaphore:
+            return await coro
+
+    results = await asyncio.gather(*(run_one(coro) for coro in coros), return_exceptions=True)
+    for result in results:
+        if isinstance(result, Exception):
+            logging.error(f"Task failed: {result}")
+    return results
+
+async def run_workers(items, worker, workers):
+    """Feed items through a queue to `workers` long-lived worker tasks.
+
+    `worker(worker_id, item_queue)` is expected to pull items with `get_nowait()` until the queue is empty.
+    """
+    item_queue = asyncio.Queue()
+    for item in items:
+        item_queue.put_nowait(item)
+
+    tasks = [asyncio.create_task(worker(worker_id, item_queue)) for worker_id in range(min(workers, item_queue.qsize()))]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for worker_id, result in enumerate(results):
+        if isinstance(result, Exception):
+            logging.error(f"Worker {worker_id} stopped with an error: {result}")
+    return results
+
+def run_all(*coros):
+    """Run several scraper entry points side by side on a single event loop."""
+    async def main():
+        return await asyncio.gather(*coros, return_exceptions=True)
+
+    return asyncio.run(main())
@@ -0,0 +1,146 @@
+import logging
+
+from metrics import metrics, site_of
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:  # Optional, only needed by the HTTP fetch path
+    LexborHTMLParser = None
+
+# Runs in the browser: reads every field of every matched item node and returns plain records.
+# A field with no selectors reads from the item node itself.
+EXTRACT_ITEMS_JS = """
+(nodes, fields) => nodes.map(node => {
+    const record = {};
+    for (const [name, spec] of Object.entries(fields)) {
+        let element = spec.selectors.length ? null : node;
+        for (const selector of spec.selectors) {
+            element = node.querySelector(selector);
+            if (element) break;
+        }
+        if (!element) {
+            record[name] = null;
+            continue;
+        }
+        const value = spec.attribute ? element.getAttribute(spec.attribute) : element[spec.property];
+        record[name] = value == null ? null : value.trim();
+    }
+    return record;
+})
+"""
+
+# Runs in the browser: on first use reads every current item and installs a MutationObserver that queues
+# items added later. Each later call only extracts the queued items, so its cost follows the number of new
+# items rather than the length of the page.
+EXTRACT_NEW_ITEMS_JS = """
+([selector, fields]) => {
+    const extract = """ + EXTRACT_ITEMS_JS + """;
+    const state = window.__incrementalExtraction || (window.__incrementalExtraction = {});
+    if (!state[selector]) {
+        const entry = {pending: Array.from(document.querySelectorAll(selector)), seen: new WeakSet()};
+        new MutationObserver(mutations => {
+            for (const mutation of mutations) {
+                for (const added of mutation.addedNodes) {
+                    if (added.nodeType !== Node.ELEMENT_NODE) continue;
+                    if (added.matches(selector)) entry.pending.push(added);
+                    entry.pending.push(...added.querySelectorAll(selector));
+                }
+            }
+        }).observe(document.body, {childList: true, subtree: true});
+        state[selector] = entry;
+    }
+    const entry = state[selector];
+    const nodes = [];
+    for (const node of entry.pending) {
+        if (node.isConnected && !entry.seen.has(node)) {
+            entry.seen.add(node);
+            nodes.push(node);
+        }
+    }
+    entry.pending = [];
+    return extract(nodes, fields);
+}
+"""
+
+HAS_NEW_ITEMS_JS = """
+(selector) => {
+    const entry = window.__incrementalExtraction && window.__incrementalExtraction[selector];
+    return !!entry && entry.pending.length > 0;
+}
+"""
+
+def field(*selectors, attribute=None, text_content=False):
+    """Describe one value of an item: the first matching selector wins, read as text or as an attribute."""
+    return {
+        "selectors": list(selectors),
+        "attribute": attribute,
+        "property": "textContent" if text_content else "innerText",
+    }
+
+async def extract_items(page, container_selector, fields):
+    """Extract all fields of all items matching `container_selector` in a single browser round trip."""
+    site = site_of(page.url)
+    try:
+        with metrics.timer("extraction", site=site):
+            records = await page.eval_on_selector_all(container_selector, EXTRACT_ITEMS_JS, fields)
+        metrics.count("items", len(records), site=site)
+        return records
+    except Exception as e:
+        logging.error(f"Batched extraction failed for {container_selector}: {e}")
+        return []
+
+async def extract_new_items(page, container_selector, fields):
+    """Extract only the items added to the page since the previous call for `container_selector`.
+
+    The first call on a page returns every current item.
+    """
+    site = site_of(page.url)
+    try:
+        with metrics.timer("extraction", site=site):
+            records = await page.evaluate(EXTRACT_NEW_ITEMS_JS, [container_selector, fields])
+        metrics.count("items", len(records), site=site)
+        return records
+    except Exception as e:
+        logging.error(f"Incremental extraction failed for {container_selector}: {e}")
+        return []
+
+async def wait_for_new_items(page, container_selector, timeout=30000):
+    """Wait until items have been added since the last `extract_new_items` call. Returns False on timeout."""
+    try:
+        with metrics.timer("wait", site=site_of(page.url)):
+            await page.wait_for_function(HAS_NEW_ITEMS_JS, arg=container_selector, timeout=timeout)
+        return True
+    except Exception:
+        return False
+
+def apply_defaults(record, defaults):
+    """Replace values whose element was not found with the scraper's placeholder strings."""
+    return {name: defaults.get(name) if value is None else value for name, value in record.items()}
+
+def parse_html(html):
+    return LexborHTMLParser(html)
+
+def extract_items_from_html(tree, container_selector, fields):
+    """Apply the same field specs as `extract_items` to server-rendered HTML parsed with selectolax."""
+    records = []
+    for node in tree.css(container_selector):
+        record = {}
+        for name, spec in fields.items():
+            element = None if spec["selectors"] else node
+            for selector in spec["selectors"]:
+                element = node.css_first(selector)
+                if element is not None:
+                    break
+            if element is None:
+                record[name] = None
+                continue
+            if spec["attribute"]:
+                value = element.attributes.get(spec["attribute"])
+                record[name] = value.strip() if value is not None else None
+            elif spec["property"] == "innerText":
+                # Without layout innerText can only be approximated by collapsing whitespace
+                record[name] = " ".join(element.text(deep=True).split())
+            else:
+                record[name] = element.text(deep=True).strip()
+        records.append(record)
+    return records
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+from collections import Counter
+
+try:
+    import httpx
+except ImportError:  # Optional, the scrapers fall back to the browser without it
+    httpx = None
+
+from extraction import LexborHTMLParser, extract_items_from_html, parse_html
+from metrics import metrics, site_of
+from pacing import THROTTLE_STATUSES, looks_like_captcha, pacer
+
+# httpx logs every request at INFO, which drowns out the scraper's own progress lines
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def http_fetch_available():
+    return httpx is not None and LexborHTMLParser is not None
+
+class HttpFetcher:
+    """Pooled keep-alive HTTP client for server-rendered pages, parsed with the shared field specs.
+
+    Pages that fail validation (bad status, captcha markers, no items) return None so the caller
+    can escalate that URL to the Playwright path. With a `cache`, cacheable pages are served from
+    disk while fresh and revalidated with conditional requests once they expire.
+    """
+
+    def __init__(self, user_agent, max_connections=20, timeout=30, cache=None):
+        self.client = httpx.AsyncClient(
+            headers={
+                "User-Agent": user_agent,
+                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+                "Accept-Language": "en-US,en;q=0.9",
+            },
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            follow_redirects=True,
+        )
+        self.cache = cache
+        self.stats = Counter()
+
+    async def fetch_html(self, url):
+        """Fetch a page and return its text, or None if it does not look like real content."""
+        entry = await asyncio.to_thread(self.cache.lookup, url) if self.cache and self.cache.ttl_for(url) is not None else None
+        if entry and entry["fresh"]:
+            self.cache.stats["hits"] += 1
+            return (await asyncio.to_thread(self.cache.load_body, entry)).decode("utf-8", errors="replace")
+
+        await pacer.pause(url)
+        site = site_of(url)
+        try:
+            async with pacer.request(url):
+                with metrics.timer("http_fetch", site=site):
+                    response = await self.client.get(url, headers=self.cache.revalidation_headers(entry) if entry else None)
+        except httpx.HTTPError as e:
+            logging.warning(f"HTTP fetch failed for {url}: {e}")
+            self.stats["errors"] += 1
+            return None
+
+        self.stats["bytes"] += len(response.content)
+        metrics.count("bytes_downloaded", len(response.content), site=site)
+        if entry and response.status_code == 304:
+            self.cache.stats["revalidated"] += 1
+            await asyncio.to_thread(self.cache.refresh, url)
+            pacer.record_success(url)
+            return (await asyncio.to_thread(self.cache.load_body, entry)).decode("utf-8", errors="replace")
+        if response.status_code in THROTTLE_STATUSES:
+            pacer.record_throttle(url, f"HTTP {response.status_code}")
+            self.stats["throttled"] += 1
+            return None
+        if response.status_code != 200:
+            self.stats["bad_status"] += 1
+            return None
+
+        html = response.text
+        if looks_like_captcha(html):
+            pacer.record_throttle(url, "captcha")
+            self.stats["captcha"] += 1
+            return None
+
+        pacer.record_success(url)
+        if self.cache:
+            self.cache.stats["misses"] += 1
+            await asyncio.to_thread(self.cache.store, url, response.status_code, response.headers, response.content)
+        return html
+
+    async def fetch_items(self, url, container_selector, fields):
+        """Fetch a page over HTTP and extract its items.
+
+        Returns (records, tree), or None when the page needs the browser.
+        """
+        html = await self.fetch_html(url)
+        site = site_of(url)
+        if html is None:
+            self.stats["escalated"] += 1
+            metrics.count("retries", site=site)
+            return None
+
+        with metrics.timer("extraction", site=site):
+            tree = parse_html(html)
+            records = extract_items_from_html(tree, container_selector, fields)
+        if not records:
+            self.stats["no_items"] += 1
+            self.stats["escalated"] += 1
+            metrics.count("retries", site=site)
+            return None
+
+        self.stats["pages"] += 1
+        metrics.count("pages", site=site)
+        metrics.count("items", len(records), site=site)
+        return records, tree
+
+    async def close(self):
+        await self.client.aclose()
+        logging.info(
+            f"HTTP fetcher: {self.stats['pages']} pages parsed, {self.stats['escalated']} escalated to the browser, "
+            f"{self.stats['bytes'] / 1_000_000:.1f} MB downloaded"
+        )
+
+def create_fetcher(user_agent, cache=None):
+    """Create an HttpFetcher, or return None when the optional HTTP dependencies are missing."""
+    if not http_fetch_available():
+        logging.info("httpx/selectolax not installed, using the browser for every page.")
+        return None
+    return HttpFetcher(user_agent, cache=cache)
@@ -0,0 +1,338 @@
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import sqlite3
+import time
+from collections import Counter
+
+import amazon
+import olx
+import youtube
+from metrics import metrics
+from retry import get_dead_letters
+from sink import close_sink, open_sink
+
+JOBS_PATH = "data/jobs.sqlite"
+# Crawl checkpoints of the jobs, one per job so jobs for different categories never clear each other's progress
+JOB_STATE_DIR = "data/job_state"
+
+# Jobs run at once across all sites, and per site unless overridden on the command line
+MAX_JOBS = 4
+SITE_LIMITS = {"amazon": 1, "olx": 2, "youtube": 2}
+
+MAX_ATTEMPTS = 3
+# A failed job waits RETRY_DELAY seconds before its second attempt, doubling for every attempt after that
+RETRY_DELAY = 60
+# How often the job table is read again for jobs added while the scheduler runs
+POLL_INTERVAL = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    site TEXT NOT NULL,
+    query TEXT NOT NULL DEFAULT '',
+    location TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT '',
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    not_before REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    UNIQUE (site, query, location, category)
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+"""
+
+JOB_FIELDS = ("site", "query", "location", "category", "priority", "max_attempts")
+
+def job_checkpoint_path(job):
+    return os.path.join(JOB_STATE_DIR, f"{job['site']}-{job['id']}.sqlite")
+
+async def run_amazon(job):
+    # Every run of a job crawls the category afresh, only the retry of a failed attempt resumes where it stopped
+    return await amazon.scrape_amazon_bestsellers(
+        "https://www.amazon.in", category_url=job["category"] or None,
+        checkpoint_path=job_checkpoint_path(job), resume=job["attempts"] > 0,
+    )
+
+async def run_olx(job):
+    return await olx.run("https://www.olx.com.pk", job["query"], job["location"])
+
+async def run_youtube(job):
+    return await youtube.main_youtube_scraper("https://www.youtube.com/", job["query"], youtube.query_base_path(job["query"]))
+
+# Site name: coroutine replaying the items its earlier runs dead-lettered
+REPLAYS = {
+    "amazon": lambda: amazon.replay_dead_letters("https://www.amazon.in"),
+    "olx": lambda: olx.replay_dead_letters(),
+}
+
+# Site name: (coroutine running one job, fields the job needs)
+SITES = {
+    "amazon": (run_amazon, ()),
+    "olx": (run_olx, ("query", "location")),
+    "youtube": (run_youtube, ("query",)),
+}
+
+class JobQueue:
+    """Persistent job table in SQLite: pending, running, done and failed scrape jobs with their attempts."""
+
+    def __init__(self, path=JOBS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def add(self, site, query="", location="", category="", priority=0, max_attempts=MAX_ATTEMPTS):
+        """Queue a job. Returns False if it is already in the table or misses a field its site needs."""
+        if site not in SITES:
+            logging.error(f"Unknown site {site!r}, expected one of {sorted(SITES)}.")
+            return False
+        job = {"query": query or "", "location": location or "", "category": category or ""}
+        missing = [name for name in SITES[site][1] if not job[name]]
+        if missing:
+            logging.error(f"{site} job {job} is missing {', '.join(missing)}.")
+            return False
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT OR IGNORE INTO jobs (site, query, location, category, priority, max_attempts, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (site, job["query"], job["location"], job["category"], int(priority or 0), int(max_attempts or MAX_ATTEMPTS), time.time()),
+            )
+        return cursor.rowcount == 1
+
+    def add_file(self, path):
+        """Queue every job of a JSON lines or CSV file with site, query, location, category and priority columns."""
+        with open(path, newline="", encoding="utf-8") as file:
+            if path.lower().endswith(".csv"):
+                records = list(csv.DictReader(file))
+            else:
+                records = [json.loads(line) for line in file if line.strip()]
+        added = sum(self.add(**{name: record[name] for name in JOB_FIELDS if record.get(name)}) for record in records)
+        logging.info(f"Queued {added} of {len(records)} jobs from {path}.")
+        return added
+
+    def recover(self):
+        """Put jobs left running by a process that died back in the queue. One scheduler runs per job table."""
+        with self.connection:
+            cursor = self.connection.execute("UPDATE jobs SET status = 'pending' WHERE status = 'running'")
+        if cursor.rowcount:
+            logging.info(f"Requeued {cursor.rowcount} jobs left running by an earlier process.")
+
+    def ready(self):
+        """Pending jobs whose retry delay has passed, highest priority first."""
+        return self.connection.execute(
+            "SELECT * FROM jobs WHERE status = 'pending' AND not_before <= ? ORDER BY priority DESC, id",
+            (time.time(),),
+        ).fetchall()
+
+    def next_retry_at(self):
+        return self.connection.execute("SELECT MIN(not_before) FROM jobs WHERE status = 'pending'").fetchone()[0]
+
+    def start(self, job_id):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+
+    def finish(self, job_id):
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = 'done', last_error = NULL, finished_at = ? WHERE id = ?", (time.time(), job_id)
+            )
+
+    def fail(self, job_id, error):
+        """Record a failed attempt and schedule a retry with backoff, or give up after `max_attempts`."""
+        attempts, max_attempts = self.connection.execute(
+            "SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        status = "pending" if attempts < max_attempts else "failed"
+        with self.connection:
+            self.connection.execute(
+                "UPDATE jobs SET status = ?, last_error = ?, not_before = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time() + RETRY_DELAY * 2 ** (attempts - 1), time.time(), job_id),
+            )
+        return status
+
+    def requeue(self, status="failed"):
+        """Give every job with `status` a fresh set of attempts."""
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, not_before = 0 WHERE status = ?", (status,)
+            )
+        return cursor.rowcount
+
+    def summary(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+
+    def jobs(self, status=None):
+        if status:
+            return self.connection.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+        return self.connection.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+
+    def close(self):
+        self.connection.close()
+
+def describe(job):
+    details = ", ".join(f"{name}={job[name]!r}" for name in ("query", "location", "category") if job[name])
+    return f"#{job['id']} {job['site']}({details})"
+
+class Scheduler:
+    """Runs queued jobs in one process, at most `max_jobs` at once and `site_limits[site]` per site.
+
+    Jobs share the process-wide pacer, cache and output sink, so requests to one site stay paced
+    across jobs. Jobs added to the table while the scheduler runs are picked up on the next poll.
+    """
+
+    def __init__(self, job_queue, max_jobs=MAX_JOBS, site_limits=None):
+        self.job_queue = job_queue
+        self.max_jobs = max_jobs
+        self.site_limits = {**SITE_LIMITS, **(site_limits or {})}
+        self.running = {}
+        self.stats = Counter()
+
+    def site_running(self, site):
+        return sum(1 for job in self.running.values() if job["site"] == site)
+
+    def dispatch(self):
+        for job in self.job_queue.ready():
+            if len(self.running) >= self.max_jobs:
+                break
+            if self.site_running(job["site"]) >= self.site_limits.get(job["site"], 1):
+                continue
+            self.job_queue.start(job["id"])
+            logging.info(f"Starting job {describe(job)}, attempt {job['attempts'] + 1} of {job['max_attempts']}.")
+            self.running[asyncio.create_task(self.run_job(job))] = job
+
+    async def run_job(self, job):
+        run, _ = SITES[job["site"]]
+        # The scraper's own report covers this job, the metrics file is written with the totals at the end
+        with metrics.scope(job=describe(job)):
+            return await run(job)
+
+    def record(self, task, job):
+        if task.exception() is not None:
+            error = f"{type(task.exception()).__name__}: {task.exception()}"
+        elif task.result() is False:
+            error = "the scraper reported an error"
+        else:
+            self.job_queue.finish(job["id"])
+            self.stats["done"] += 1
+            logging.info(f"Job {describe(job)} done.")
+            return
+        status = self.job_queue.fail(job["id"], error)
+        self.stats["retried" if status == "pending" else "failed"] += 1
+        if status == "pending":
+            metrics.count("retries", site=job["site"])
+        logging.error(f"Job {describe(job)} failed ({error}), {'will retry' if status == 'pending' else 'giving up'}.")
+
+    async def run(self):
+        """Run jobs until none are pending, then return the counts of done, retried and failed jobs."""
+        self.job_queue.recover()
+        # Held while jobs come and go, so each job's own close_sink() leaves the sink to the next one
+        open_sink()
+        try:
+            while True:
+                self.dispatch()
+                if not self.running:
+                    next_retry_at = self.job_queue.next_retry_at()
+                    if next_retry_at is None:
+                        break
+                    await asyncio.sleep(min(max(next_retry_at - time.time(), 1), POLL_INTERVAL))
+                    continue
+                done, _ = await asyncio.wait(self.running, timeout=POLL_INTERVAL, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    self.record(task, self.running.pop(task))
+        finally:
+            close_sink()
+        logging.info(f"Scheduler finished: {dict(self.stats)}, job table: {self.job_queue.summary()}")
+        metrics.report()
+        return dict(self.stats)
+
+def parse_site_limits(values):
+    limits = {}
+    for value in values or []:
+        site, _, limit = value.partition("=")
+        limits[site] = int(limit)
+    return limits
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue scrape jobs and run them from one process.")
+    parser.add_argument("--db", default=JOBS_PATH, help="job table location")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    add = commands.add_parser("add", help="queue a single job")
+    add.add_argument("site", choices=sorted(SITES))
+    add.add_argument("--query", default="")
+    add.add_argument("--location", default="")
+    add.add_argument("--category", default="", help="Amazon category URL")
+    add.add_argument("--priority", type=int, default=0, help="higher runs first")
+    add.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    load = commands.add_parser("load", help="queue the jobs of a JSON lines or CSV file")
+    load.add_argument("path")
+
+    run = commands.add_parser("run", help="run queued jobs until none are left")
+    run.add_argument("--max-jobs", type=int, default=MAX_JOBS)
+    run.add_argument("--site-limit", action="append", metavar="SITE=N", help="jobs run at once for a site")
+    run.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on this port while jobs run")
+
+    status = commands.add_parser("status", help="show the job table")
+    status.add_argument("--status", choices=["pending", "running", "done", "failed"])
+
+    retry = commands.add_parser("retry", help="requeue failed jobs")
+    retry.add_argument("--status", default="failed", choices=["failed", "done"])
+
+    dead_letters = commands.add_parser("dead-letters", help="show the items runs gave up on after their retries")
+    dead_letters.add_argument("--site", choices=sorted(SITES))
+    dead_letters.add_argument("--clear", action="store_true", help="forget them instead")
+
+    replay = commands.add_parser("replay", help="scrape the dead-lettered items of a site again")
+    replay.add_argument("site", choices=sorted(REPLAYS))
+
+    args = parser.parse_args()
+    job_queue = JobQueue(args.db)
+    try:
+        if args.command == "add":
+            added = job_queue.add(args.site, args.query, args.location, args.category, args.priority, args.max_attempts)
+            print("Job queued." if added else "Job not queued.")
+        elif args.command == "load":
+            job_queue.add_file(args.path)
+        elif args.command == "run":
+            if args.metrics_port:
+                metrics.serve(args.metrics_port)
+            asyncio.run(Scheduler(job_queue, args.max_jobs, parse_site_limits(args.site_limit)).run())
+        elif args.command == "status":
+            for job in job_queue.jobs(args.status):
+                error = f" - {job['last_error']}" if job["last_error"] else ""
+                print(f"{describe(job)} [{job['status']}, priority {job['priority']}, {job['attempts']}/{job['max_attempts']} attempts]{error}")
+            print(job_queue.summary())
+        elif args.command == "retry":
+            print(f"Requeued {job_queue.requeue(args.status)} jobs.")
+        elif args.command == "dead-letters":
+            if args.clear:
+                get_dead_letters().clear(args.site)
+            else:
+                entries = get_dead_letters().entries(args.site)
+                for entry in entries:
+                    print(f"{entry['site']} {entry['item_type']} {entry['url']} [{entry['error_class']}, {entry['attempts']} attempts] - {entry['error']}")
+                print(f"{len(entries)} dead letters.")
+        elif args.command == "replay":
+            if not asyncio.run(REPLAYS[args.site]()):
+                print("Some items failed again, see the dead letters.")
+    finally:
+        job_queue.close()
+
+if __name__ == "__main__":
+    main()
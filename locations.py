@@ -0,0 +1,78 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+LOCATIONS_PATH = "data/locations.sqlite"
+
+# Resolved locations are reused this long before they are picked from the suggestions again
+LOCATION_TTL = 30 * 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS locations (
+    name TEXT PRIMARY KEY,
+    label TEXT NOT NULL,
+    slug TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+"""
+
+# Location-scoped OLX paths start with the location's slug and ID, e.g. /lahore_g4060673/q-iphone
+LOCATION_SLUG = re.compile(r"^/([^/]+_g\d+)(?:/|$)")
+
+def location_slug_from_url(url):
+    """The location segment of a location-scoped listing URL, or None if the URL is not scoped to one."""
+    match = LOCATION_SLUG.match(urlparse(url).path)
+    return match.group(1) if match else None
+
+def normalize_location(name):
+    return " ".join(name.lower().split())
+
+class LocationCache:
+    """Locations resolved by earlier searches, as {location typed: (suggestion picked, URL slug)} in SQLite."""
+
+    def __init__(self, path=LOCATIONS_PATH, ttl=LOCATION_TTL):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ttl = ttl
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.executescript(SCHEMA)
+
+    def lookup(self, name):
+        """Return {"label", "slug"} of a location resolved within the TTL, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT label, slug FROM locations WHERE name = ? AND resolved_at > ?",
+                (normalize_location(name), time.time() - self.ttl),
+            ).fetchone()
+        return {"label": row[0], "slug": row[1]} if row else None
+
+    def store(self, name, label, slug):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO locations (name, label, slug, resolved_at) VALUES (?, ?, ?, ?)",
+                (normalize_location(name), label, slug, time.time()),
+            )
+        logging.info(f"Location {name!r} resolved to {slug}")
+
+    def forget(self, name):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM locations WHERE name = ?", (normalize_location(name),))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_locations = None
+
+def get_location_cache():
+    """Return the process-wide location cache, so every search of a run reuses what the others resolved."""
+    global _locations
+    if _locations is None:
+        _locations = LocationCache()
+    return _locations
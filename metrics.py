@@ -0,0 +1,304 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+METRICS_PATH = "data/metrics.prom"
+
+# Upper bounds in seconds of the stage latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Per-item log lines (scraped products, ads, channels) are logged at ITEM_LOG_LEVEL, and only one in
+# every ITEM_LOG_SAMPLE items of a kind. Set the level to logging.INFO and the sample to 1 to see them all.
+ITEM_LOG_LEVEL = logging.DEBUG
+ITEM_LOG_SAMPLE = 100
+
+# Counters shown in the run summary and exported with a help text, as {name: help}
+COUNTERS = {
+    "pages": "Pages loaded, in the browser or over HTTP",
+    "items": "Items extracted from pages and API responses",
+    "duplicates": "Items dropped as already seen",
+    "rows_written": "Rows written to the output files",
+    "retries": "Retried attempts and escalations to a slower path",
+    "blocked_requests": "Requests aborted by resource blocking",
+    "throttled": "Throttling signals (HTTP 429/503, captchas)",
+    "bytes_downloaded": "Response bytes received, from Content-Length where the browser fetched them",
+}
+
+# Gauges exported with a help text, as {name: help}. They hold the latest value set
+GAUGES = {
+    "rate_limit": "Requests per second currently allowed to a domain",
+    "concurrency_limit": "Requests currently allowed in flight to a domain at once",
+    "in_flight": "Requests in flight to a domain",
+}
+
+# Label given to a site's pages, so every stage of one scraper reports under the same name
+SITE_DOMAINS = {
+    "amazon.in": "amazon",
+    "olx.com.pk": "olx",
+    "youtube.com": "youtube",
+}
+
+# Metrics of the scope (see Metrics.scope) the current task runs in, if any
+_scope = ContextVar("metrics_scope", default=None)
+
+def site_of(url):
+    host = urlparse(url or "").hostname or ""
+    for domain, site in SITE_DOMAINS.items():
+        if host == domain or host.endswith("." + domain):
+            return site
+    return host or "unknown"
+
+def series(metric, labels):
+    """A sample name with its labels, e.g. scraper_pages_total{site="amazon"}."""
+    if not labels:
+        return metric
+    return metric + "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the `q` quantile, the usual histogram estimate."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+class Metrics:
+    """Per-stage latency histograms and run counters, exported in the Prometheus text format.
+
+    Stages are timed with `timer("navigation", site=...)`; counters go up with `count("pages", site=...)`.
+    Safe to update from the event loop, the output sink's writer thread and the export endpoint at once.
+    `labels` are added to every exported series, e.g. to tell the worker processes of a sharded run apart.
+    Jobs sharing the process each get a `scope` of their own, which their `report` covers.
+    """
+
+    def __init__(self, prefix="scraper", path=METRICS_PATH, labels=None):
+        self.prefix = prefix
+        self.path = path
+        self.labels = labels or {}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counters = Counter()
+            self.gauges = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def scoped(self):
+        """The metrics of the current scope, when there is one besides these."""
+        scoped = _scope.get()
+        return scoped if scoped is not None and scoped is not self else None
+
+    @contextmanager
+    def scope(self, **labels):
+        """Also collect what the current task and the tasks it starts record into metrics of their own.
+
+        Inside the scope `report` reports those instead of the process-wide totals, and leaves the metrics
+        file to the process. Work done on other threads, like the output sink's writes, only counts in the totals.
+        """
+        scoped = Metrics(self.prefix, path=None, labels=labels)
+        token = _scope.set(scoped)
+        try:
+            yield scoped
+        finally:
+            _scope.reset(token)
+
+    def count(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[(name, tuple(sorted(labels.items())))] += amount
+        scoped = self.scoped()
+        if scoped:
+            scoped.count(name, amount, **labels)
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+        scoped = self.scoped()
+        if scoped:
+            scoped.set(name, value, **labels)
+
+    def observe(self, stage, seconds, **labels):
+        key = tuple(sorted({"stage": stage, **labels}.items()))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+        scoped = self.scoped()
+        if scoped:
+            scoped.observe(stage, seconds, **labels)
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Time the `with` block as one observation of `stage`, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, **labels)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        lines = []
+        extra = tuple(sorted(self.labels.items()))
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((key, histogram.counts[:], histogram.sum, histogram.count) for key, histogram in self.histograms.items())
+
+        names = sorted({name for (name, _), _ in counters})
+        for name in names:
+            metric = f"{self.prefix}_{name}_total"
+            lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in counters:
+                if counter_name == name:
+                    lines.append(f"{series(metric, extra + labels)} {value}")
+
+        for name in sorted({name for (name, _), _ in gauges}):
+            metric = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {metric} {GAUGES.get(name, name)}")
+            lines.append(f"# TYPE {metric} gauge")
+            for (gauge_name, labels), value in gauges:
+                if gauge_name == name:
+                    lines.append(f"{series(metric, extra + labels)} {value:g}")
+
+        metric = f"{self.prefix}_stage_seconds"
+        lines.append(f"# HELP {metric} Time spent per pipeline stage")
+        lines.append(f"# TYPE {metric} histogram")
+        for labels, counts, total, count in histograms:
+            labels = extra + labels
+            cumulative = 0
+            for bound, bucket_count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{series(metric + '_bucket', labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{series(metric + '_sum', labels)} {total:.6f}")
+            lines.append(f"{series(metric + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path=None):
+        """Write the metrics to a file, e.g. for node_exporter's textfile collector. Replaced atomically."""
+        path = path or self.path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as file:
+            file.write(self.render())
+        os.replace(temporary_path, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """Serve the metrics at http://host:port/metrics on a background thread. Returns the server."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would drown out the scraper's own log
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        logging.info(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+    def summary(self):
+        """Return the counters and, per stage, the calls, total time, mean, p50 and p95 so far."""
+        with self.lock:
+            counters = Counter()
+            for (name, _), value in self.counters.items():
+                counters[name] += value
+            stages = {}
+            for key, histogram in self.histograms.items():
+                stage = dict(key)["stage"]
+                merged = stages.setdefault(stage, Histogram())
+                merged.counts = [a + b for a, b in zip(merged.counts, histogram.counts)]
+                merged.sum += histogram.sum
+                merged.count += histogram.count
+        return {
+            "elapsed": time.time() - self.started,
+            "counters": dict(counters),
+            "stages": {
+                stage: {
+                    "count": histogram.count,
+                    "seconds": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                }
+                for stage, histogram in stages.items()
+            },
+        }
+
+    def report(self):
+        """Log the run summary, write the metrics file and return the summary.
+
+        Inside a scope, only the metrics of the scope are logged and returned.
+        """
+        scoped = self.scoped()
+        if scoped:
+            return scoped.report()
+        summary = self.summary()
+        scope = " (" + ", ".join(f"{name}={value}" for name, value in self.labels.items()) + ")" if self.labels else ""
+        logging.info(f"Run metrics{scope} after {summary['elapsed']:.0f}s: {summary['counters']}")
+        with self.lock:
+            gauges = sorted(self.gauges.items())
+        if gauges:
+            logging.info("  " + ", ".join(f"{series(name, labels)} {value:g}" for (name, labels), value in gauges))
+        # Stages overlap when work runs concurrently, so shares are of the summed stage time
+        total = sum(stage["seconds"] for stage in summary["stages"].values()) or 1
+        for stage, stats in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            logging.info(
+                f"  {stage:<12} {stats['count']:>7} calls {stats['seconds']:>9.1f}s ({stats['seconds'] / total:>4.0%}) "
+                f"mean {stats['mean']:.3f}s, p50 <= {stats['p50']}s, p95 <= {stats['p95']}s"
+            )
+        if self.path:
+            try:
+                self.write()
+            except OSError as e:
+                logging.error(f"Could not write metrics to {self.path}: {e}")
+        return summary
+
+# Shared by every scraper in the process, like the pacer
+metrics = Metrics()
+
+_item_counts = Counter()
+
+def log_item(kind, message, *args):
+    """Log a per-item line at ITEM_LOG_LEVEL for one in every ITEM_LOG_SAMPLE items of `kind`.
+
+    `message` is %-formatted with `args` only when the line is actually logged.
+    """
+    _item_counts[kind] += 1
+    if (_item_counts[kind] - 1) % ITEM_LOG_SAMPLE == 0:
+        logging.log(ITEM_LOG_LEVEL, message, *args)
@@ -0,0 +1,416 @@
+import hashlib
+import html
+import json
+import logging
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit
+
+import youtube
+
+FIXTURES_DIR = "benchmarks/fixtures"
+
+# Size of the generated sites. Fixed, together with the seed, so results stay comparable between commits
+FIXTURE_SEED = 20240601
+AMAZON_SUBCATEGORIES = 3
+AMAZON_BRANDS = 4  # Per subcategory, the category page lists brands of its own too
+AMAZON_PAGES = 5  # Result pages per brand
+AMAZON_ITEMS_PER_PAGE = 24
+OLX_PAGES = 5
+OLX_ADS_PER_PAGE = 20
+YOUTUBE_BATCHES = 5  # The first results plus continuations
+YOUTUBE_CHANNELS_PER_BATCH = 20
+
+# Searches the generated OLX and YouTube fixtures answer
+OLX_QUERY = "iPhone"
+OLX_LOCATION = "Lahore"
+YOUTUBE_QUERY = youtube.SEARCH_QUERY
+
+# Locations the mock suggests, with the IDs in their location-scoped URLs
+OLX_LOCATIONS = {"Lahore": 4060673, "Karachi": 4060695, "Islamabad": 4060615, "Rawalpindi": 4060685, "Faisalabad": 4060581}
+OLX_AREAS = ["Johar Town", "DHA", "Gulberg", "Model Town", "Bahria Town"]
+
+def fixture_key(method, path, query="", body=None):
+    """Key a request is recorded and replayed under: method, path and sorted query string.
+
+    POST bodies only take part through their continuation token, the one part of the recorded API
+    bodies that selects a different page of results.
+    """
+    key = f"{method} {path}"
+    params = sorted(parse_qsl(query, keep_blank_values=True))
+    if params:
+        key += "?" + urlencode(params)
+    if body:
+        try:
+            continuation = json.loads(body).get("continuation")
+        except (ValueError, AttributeError):
+            continuation = None
+        if continuation:
+            key += f" continuation={continuation}"
+    return key
+
+def olx_listing_path(query, location=None):
+    """Listing path the mock OLX search box navigates to, as in its JavaScript."""
+    scope = f"{location.lower()}_g{OLX_LOCATIONS[location]}" if location else "items"
+    return f"/{scope}/q-" + "-".join(query.lower().split())
+
+class FixtureWriter:
+    """Writes fixture bodies and the index mapping request keys to them."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.index = {}
+        os.makedirs(os.path.join(directory, "bodies"), exist_ok=True)
+
+    def add(self, key, body, content_type="text/html; charset=utf-8"):
+        if isinstance(body, (dict, list)):
+            body, content_type = json.dumps(body), "application/json"
+        name = f"bodies/{len(self.index):05d}{'.json' if content_type == 'application/json' else '.html'}"
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as file:
+            file.write(body)
+        self.index[key] = {"file": name, "content_type": content_type}
+
+    def close(self):
+        with open(os.path.join(self.directory, "index.json"), "w", encoding="utf-8") as file:
+            json.dump(self.index, file, indent=1, sort_keys=True)
+
+def page(title, body, script=""):
+    return (
+        f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title></head>"
+        f"<body>{body}{f'<script>{script}</script>' if script else ''}</body></html>"
+    )
+
+def amazon_carousel(number, links):
+    cards = "".join(
+        f"<li class='sl-sobe-carousel-sub-card'><a class='sl-sobe-carousel-sub-card-link' href='{html.escape(href)}'>{html.escape(text)}</a></li>"
+        for href, text in links
+    )
+    return (
+        f"<div id='sobe_d_b_ms_{number}-carousel-viewport'><div class='sl-sobe-carousel-viewport-row'>"
+        f"<ol class='sl-sobe-carousel-viewport-row-inner'>{cards}</ol></div></div>"
+    )
+
+def amazon_results(rng, brand, page_number, asins):
+    items = []
+    for asin in asins:
+        price = f"<span class='a-price'><span class='a-offscreen'>₹{rng.randint(199, 99999):,}.00</span></span>" if rng.random() > 0.05 else ""
+        items.append(
+            f"<div class='s-result-item' data-asin='{asin}'><h2 class='a-size-mini'><span>{brand} product {asin}</span></h2>"
+            f"<span aria-label='{rng.randint(10, 50) / 10} out of 5 stars'></span>{price}"
+            f"<img src='/images/{asin}.jpg'></div>"
+        )
+    numbers = "".join(f"<span class='s-pagination-item'>{number}</span>" for number in range(1, AMAZON_PAGES + 1))
+    next_link = (
+        f"<a class='s-pagination-item s-pagination-next s-pagination-button' href='?k={quote(brand)}&page={page_number + 1}'>Next</a>"
+        if page_number < AMAZON_PAGES else ""
+    )
+    return page(
+        f"Amazon.in : {brand}",
+        f"<div class='s-main-slot'>{''.join(items)}</div><div class='s-pagination-strip'>{numbers}{next_link}</div>",
+    )
+
+def generate_amazon(writer, rng):
+    main_category = "/electronics/b/?ie=UTF8&node=976419031&ref_=nav_cs_electronics"
+    writer.add(fixture_key("GET", "/"), page("Amazon.in", f"<a href='{main_category}'>Electronics</a>"))
+
+    asin_counter = iter(range(10**6))
+    recent_asins = []
+
+    def brand_listing(brand_name):
+        """Add every result page of a brand. A few products also show up under other brands, as on the live site."""
+        for page_number in range(1, AMAZON_PAGES + 1):
+            asins = []
+            for _ in range(AMAZON_ITEMS_PER_PAGE):
+                if recent_asins and rng.random() < 0.1:
+                    asins.append(rng.choice(recent_asins))
+                else:
+                    asins.append(f"B0{next(asin_counter):08d}")
+            recent_asins[:] = (recent_asins + asins)[-200:]
+            body = amazon_results(rng, brand_name, page_number, asins)
+            writer.add(fixture_key("GET", "/s", urlencode({"k": brand_name, "page": page_number})), body)
+            if page_number == 1:
+                writer.add(fixture_key("GET", "/s", urlencode({"k": brand_name})), body)
+
+    def brand_carousel(prefix):
+        brands = [f"{prefix} brand {index}" for index in range(AMAZON_BRANDS)]
+        for brand_name in brands:
+            brand_listing(brand_name)
+        return amazon_carousel(4, [(f"/s?k={quote(brand_name)}", brand_name) for brand_name in brands])
+
+    subcategories = []
+    for index in range(AMAZON_SUBCATEGORIES):
+        path = f"/subcategory-{index}/b/"
+        writer.add(fixture_key("GET", path, f"node={index}"), page(f"Subcategory {index}", brand_carousel(f"Subcategory {index}")))
+        subcategories.append((f"{path}?node={index}", f"Subcategory {index}"))
+
+    body = amazon_carousel(7, subcategories) + brand_carousel("Electronics")
+    writer.add(fixture_key("GET", "/electronics/b/", urlsplit(main_category).query), page("Electronics", body))
+
+OLX_HOME_JS = """
+const locations = %s;
+let scope = "items";
+const input = document.querySelector("input[autocomplete='location-search']");
+const list = document.querySelector("div._53cb8cc6");
+input.addEventListener("input", () => {
+    const typed = input.value.trim().toLowerCase();
+    list.innerHTML = "";
+    if (typed.length < 3) return;
+    for (const [location, id] of Object.entries(locations).filter(([name]) => typed.includes(name.toLowerCase()) || name.toLowerCase().includes(typed))) {
+        const suggestion = document.createElement("div");
+        suggestion.className = "_948d9e0a b9e631ef _371e9918";
+        suggestion.textContent = location + ", Pakistan";
+        suggestion.addEventListener("click", () => {
+            input.value = location;
+            scope = location.toLowerCase() + "_g" + id;
+            list.innerHTML = "";
+        });
+        list.appendChild(suggestion);
+    }
+});
+document.querySelector("input[type='search']").addEventListener("keydown", event => {
+    if (event.key !== "Enter") return;
+    location.href = "/" + scope + "/q-" + event.target.value.trim().toLowerCase().split(/\\s+/).join("-");
+});
+"""
+
+OLX_LISTING_JS = """
+let nextPage = 2;
+const button = document.getElementById("load-more");
+button.addEventListener("click", async () => {
+    const response = await fetch("/api/relevance/v4/search?" + new URLSearchParams({query: %s, page: nextPage}));
+    if (!response.ok) { button.remove(); return; }
+    nextPage += 1;
+    const list = document.getElementById("listing");
+    for (const hit of (await response.json()).hits.hits) {
+        const ad = hit._source;
+        const item = document.createElement("li");
+        item.setAttribute("aria-label", "Listing");
+        item.innerHTML = `<article class="_68441e28"><a href="/item/${ad.slug}-iid-${ad.externalID}"><h2 class="_941ffa5e"></h2></a>` +
+            `<span class="_1f2a2b47">Rs ${ad.price.toLocaleString("en-US")}</span><span class="_77000f35"></span></article>`;
+        item.querySelector("h2").textContent = ad.title;
+        item.querySelector("._77000f35").textContent = ad.location.map(level => level.name).reverse().slice(0, 2).join(", ");
+        list.appendChild(item);
+    }
+});
+"""
+
+def olx_ad_card(ad):
+    return (
+        f"<li aria-label='Listing'><article class='_68441e28'><a href='/item/{ad['slug']}-iid-{ad['externalID']}'>"
+        f"<h2 class='_941ffa5e'>{html.escape(ad['title'])}</h2></a><span class='_1f2a2b47'>Rs {ad['price']:,}</span>"
+        f"<span class='_77000f35'>{html.escape(ad['location'][-1]['name'])}, {html.escape(ad['location'][-2]['name'])}</span>"
+        f"<img src='/images/{ad['externalID']}.jpg'></article></li>"
+    )
+
+def generate_olx(writer, rng):
+    home = (
+        "<input autocomplete='location-search' placeholder='Location'><div class='_53cb8cc6'></div>"
+        "<form onsubmit='return false'><input type='search' placeholder='Find Cars, Mobile Phones and more...'></form>"
+    )
+    writer.add(fixture_key("GET", "/"), page("OLX Pakistan", home, OLX_HOME_JS % json.dumps(OLX_LOCATIONS)))
+
+    listing_path = olx_listing_path(OLX_QUERY, OLX_LOCATION)
+    ad_id = iter(range(1_000_000_000, 2_000_000_000))
+    for page_number in range(1, OLX_PAGES + 1):
+        ads = []
+        for _ in range(OLX_ADS_PER_PAGE):
+            # Most ads match the search, some are in another city or about something else
+            city = OLX_LOCATION if rng.random() < 0.8 else rng.choice([name for name in OLX_LOCATIONS if name != OLX_LOCATION])
+            title = f"{OLX_QUERY} {rng.randint(7, 15)} {rng.choice(['Pro', 'Max', 'Mini', ''])}".strip() if rng.random() < 0.9 else "Samsung Galaxy"
+            ad = {
+                "externalID": str(next(ad_id)),
+                "slug": "-".join(title.lower().split()),
+                "title": title,
+                "price": rng.randint(20, 500) * 1000,
+                "location": [{"name": "Pakistan"}, {"name": "Punjab"}, {"name": city}, {"name": rng.choice(OLX_AREAS)}],
+            }
+            ads.append(ad)
+            writer.add(
+                fixture_key("GET", f"/item/{ad['slug']}-iid-{ad['externalID']}"),
+                page(title, f"<h1>{html.escape(title)}</h1><p>Rs {ad['price']:,}</p>" + "<p>Description of the ad.</p>" * 20),
+            )
+
+        writer.add(
+            fixture_key("GET", "/api/relevance/v4/search", urlencode({"query": OLX_QUERY, "page": page_number})),
+            {"hits": {"total": OLX_PAGES * OLX_ADS_PER_PAGE, "hits": [{"_source": ad} for ad in ads]}},
+        )
+        body = page(
+            f"{OLX_QUERY} in {OLX_LOCATION}",
+            f"<ul id='listing'>{''.join(olx_ad_card(ad) for ad in ads)}</ul><button id='load-more'>Load more</button>",
+            OLX_LISTING_JS % json.dumps(OLX_QUERY),
+        )
+        writer.add(fixture_key("GET", listing_path, urlencode({"page": page_number})), body)
+        if page_number == 1:
+            writer.add(fixture_key("GET", listing_path), body)
+
+YOUTUBE_HOME_JS = """
+document.getElementById("search-icon-legacy").addEventListener("click", () => {
+    location.href = "/results?search_query=" + encodeURIComponent(document.querySelector("#search-input input").value);
+});
+"""
+
+YOUTUBE_RESULTS_JS = """
+document.getElementById("filter-button").addEventListener("click", () => {
+    document.getElementById("filters").style.display = "block";
+});
+document.getElementById("endpoint").addEventListener("click", async event => {
+    event.preventDefault();
+    const query = new URLSearchParams(location.search).get("search_query");
+    const response = await fetch("/youtubei/v1/search?prettyPrint=false", {
+        method: "POST",
+        headers: {"Content-Type": "application/json"},
+        body: JSON.stringify({context: {client: {clientName: "WEB", clientVersion: "2.20240601"}}, query, params: "EgIQAg%3D%3D"}),
+    });
+    const payload = await response.json();
+    const contents = document.getElementById("contents");
+    for (const item of payload.contents) {
+        if (item.continuationItemRenderer) {
+            contents.appendChild(document.createElement("ytd-continuation-item-renderer"));
+            continue;
+        }
+        const channel = item.channelRenderer;
+        const renderer = document.createElement("ytd-channel-renderer");
+        renderer.innerHTML = `<a id="main-link"><div id="avatar"><img></div><span id="channel-title"></span></a>` +
+            `<div id="metadata"><subscribers><span id="video-count"></span></subscribers></div><div id="description"></div>`;
+        renderer.querySelector("#main-link").href = channel.navigationEndpoint.browseEndpoint.canonicalBaseUrl;
+        renderer.querySelector("img").src = channel.thumbnail.thumbnails[0].url;
+        renderer.querySelector("#channel-title").textContent = channel.title.simpleText;
+        renderer.querySelector("#video-count").textContent = channel.videoCountText.simpleText;
+        renderer.querySelector("#description").textContent = channel.descriptionSnippet.runs[0].text;
+        contents.appendChild(renderer);
+    }
+});
+"""
+
+def youtube_channel(rng, index):
+    channel_id = "UC" + hashlib.sha1(f"channel-{index}".encode()).hexdigest()[:22]
+    return {"channelRenderer": {
+        "channelId": channel_id,
+        "title": {"simpleText": f"Tutorial channel {index}"},
+        "subscriberCountText": {"simpleText": f"@tutorials{index}"},
+        "videoCountText": {"simpleText": f"{rng.randint(1, 999) / 10}K subscribers"},
+        "descriptionSnippet": {"runs": [{"text": f"Videos about testing and automation, channel {index}."}]},
+        "thumbnail": {"thumbnails": [{"url": f"//yt3.example/{channel_id}=s88"}, {"url": f"//yt3.example/{channel_id}=s176"}]},
+        "navigationEndpoint": {"browseEndpoint": {"browseId": channel_id, "canonicalBaseUrl": f"/@tutorials{index}"}},
+    }}
+
+def generate_youtube(writer, rng):
+    home = "<div id='search-input'><input></div><button id='search-icon-legacy'>Search</button>"
+    writer.add(fixture_key("GET", "/"), page("YouTube", home, YOUTUBE_HOME_JS))
+    results = (
+        "<button id='filter-button'>Filters</button>"
+        "<div id='filters' style='display: none'><a id='endpoint' href='?sp=EgIQAg%253D%253D'>Channel</a></div>"
+        "<div id='contents'></div>"
+    )
+    writer.add(fixture_key("GET", "/results"), page("YouTube results", results, YOUTUBE_RESULTS_JS))
+
+    channel_index = iter(range(10**6))
+    continuation = None
+    for batch in range(YOUTUBE_BATCHES):
+        contents = [youtube_channel(rng, next(channel_index)) for _ in range(YOUTUBE_CHANNELS_PER_BATCH)]
+        if batch + 1 < YOUTUBE_BATCHES:
+            token = f"token-{batch + 1}"
+            contents.append({"continuationItemRenderer": {"continuationEndpoint": {"continuationCommand": {"token": token}}}})
+        key = fixture_key("POST", "/youtubei/v1/search", "prettyPrint=false", json.dumps({"continuation": continuation}))
+        writer.add(key, {"contents": contents})
+        continuation = token
+
+SITES = {
+    "amazon": generate_amazon,
+    "olx": generate_olx,
+    "youtube": generate_youtube,
+}
+
+def generate_fixtures(directory=FIXTURES_DIR, seed=FIXTURE_SEED):
+    """Write the fixtures of every mock site to `directory`/<site>. The same seed writes the same bytes."""
+    for site, generate in SITES.items():
+        writer = FixtureWriter(os.path.join(directory, site))
+        generate(writer, random.Random(f"{seed}-{site}"))
+        writer.close()
+        logging.info(f"Wrote {len(writer.index)} {site} fixtures to {writer.directory}")
+
+def fixtures_digest(directory=FIXTURES_DIR):
+    """Hash of every fixture, so results are only compared when they were measured on the same pages."""
+    digest = hashlib.sha256()
+    for site in sorted(SITES):
+        site_dir = os.path.join(directory, site)
+        for root, _, files in sorted(os.walk(site_dir)):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, directory).encode())
+                with open(path, "rb") as file:
+                    digest.update(file.read())
+    return digest.hexdigest()[:16]
+
+class MockSite:
+    """Replays the fixtures of one site from a local HTTP server on a background thread.
+
+    Fixtures are looked up by `fixture_key`, falling back to the path alone, and anything else is
+    answered with a 404. `latency` seconds are added to every response to stand in for the network.
+    Recorded pages can replace the generated ones by writing them under the same keys in index.json.
+    """
+
+    def __init__(self, site, directory=FIXTURES_DIR, latency=0.0):
+        self.site = site
+        self.directory = os.path.join(directory, site)
+        with open(os.path.join(self.directory, "index.json"), encoding="utf-8") as file:
+            self.index = json.load(file)
+        self.latency = latency
+        self.server = None
+        self.requests = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def lookup(self, method, target, body):
+        parts = urlsplit(target)
+        return self.index.get(fixture_key(method, parts.path, parts.query, body)) or self.index.get(fixture_key(method, parts.path))
+
+    def start(self):
+        mock_site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def respond(self, body=None):
+                mock_site.requests += 1
+                if mock_site.latency:
+                    time.sleep(mock_site.latency)
+                entry = mock_site.lookup(self.command, self.path, body)
+                if entry is None:
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with open(os.path.join(mock_site.directory, entry["file"]), "rb") as file:
+                    content = file.read()
+                self.send_response(200)
+                self.send_header("Content-Type", entry["content_type"])
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def do_GET(self):
+                self.respond()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.respond(self.rfile.read(length).decode("utf-8", errors="replace") if length else None)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name=f"mock-{self.site}", daemon=True).start()
+        logging.info(f"Serving {len(self.index)} {self.site} fixtures at {self.url}")
+        return self
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
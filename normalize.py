@@ -0,0 +1,85 @@
+import re
+
+# Typed schemas for the JSONL and Parquet outputs, as {field name: Arrow type name}
+PRODUCT_SCHEMA = {
+    "asin": "string",
+    "name": "string",
+    "price": "float64",
+    "currency": "string",
+    "rating": "float64",
+}
+CHANNEL_SCHEMA = {
+    "channel_id": "string",
+    "title": "string",
+    "subscribers": "int64",
+    "description": "string",
+    "avatar": "string",
+    "url": "string",
+}
+
+CURRENCY_SYMBOLS = {
+    "₹": "INR",
+    "$": "USD",
+    "€": "EUR",
+    "£": "GBP",
+    "Rs": "PKR",  # OLX Pakistan
+}
+
+COUNT_SUFFIXES = {"K": 1_000, "M": 1_000_000, "B": 1_000_000_000}
+
+NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+RATING = re.compile(r"(\d+(?:\.\d+)?)\s*out of\s*\d+")
+# Numbers only count on their own, never the digits of an @handle such as "@user123"
+COUNT = re.compile(r"(?<![\w@.,])(\d[\d,]*(?:\.\d+)?)\s*([KMB])?\b", re.IGNORECASE)
+SUBSCRIBER_COUNT = re.compile(COUNT.pattern + r"\s*subscriber", re.IGNORECASE)
+
+def parse_number(text):
+    match = NUMBER.search(text or "")
+    return float(match.group().replace(",", "")) if match else None
+
+def parse_price(text):
+    """Split a price such as "₹1,299.00" into (1299.0, "INR"). Missing parts are None."""
+    amount = parse_number(text)
+    currency = None
+    for symbol, code in CURRENCY_SYMBOLS.items():
+        if text and symbol in text:
+            currency = code
+            break
+    return amount, currency
+
+def parse_rating(text):
+    """Read the score out of a rating label such as "4.3 out of 5 stars"."""
+    match = RATING.search(text or "")
+    return float(match.group(1)) if match else None
+
+def parse_count(text):
+    """Read an abbreviated count such as "1.2M subscribers" as an integer (1200000).
+
+    In text with several numbers, such as "@user123 • 5.6K subscribers", the one before "subscribers" wins.
+    """
+    match = SUBSCRIBER_COUNT.search(text or "") or COUNT.search(text or "")
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    suffix = (match.group(2) or "").upper()
+    return int(round(number * COUNT_SUFFIXES.get(suffix, 1)))
+
+def normalize_product(product):
+    price, currency = parse_price(product["price"])
+    return {
+        "asin": product["asin"],
+        "name": product["name"],
+        "price": price,
+        "currency": currency,
+        "rating": parse_rating(product["rating"]),
+    }
+
+def normalize_channel(channel):
+    return {
+        "channel_id": channel["channel_id"],
+        "title": channel["title"],
+        "subscribers": parse_count(channel["subscribers"]),
+        "description": channel["description"],
+        "avatar": channel["avatar"],
+        "url": channel["url"],
+    }
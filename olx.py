@@ -1,152 +1,503 @@
-from playwright.sync_api import sync_playwright
-import time
-import random
+import asyncio
+import logging
 import os
 import re
+from urllib.parse import parse_qs, urlencode, urljoin, urlparse, urlunparse
 
-def launch_browser(playwright, headless=True):
-    browser = playwright.chromium.launch(headless=headless, args=["--disable-blink-features=AutomationControlled"])
-    return browser
+from archive import ArchivePipeline
+from blocking import get_blocker
+from cache import get_cache
+from capture import ResponseCapture, find_key
+from dedup import claim, open_dedup_index
+from extraction import apply_defaults, extract_new_items, field, wait_for_new_items
+from http_fetch import create_fetcher
+from locations import get_location_cache, location_slug_from_url
+from metrics import log_item, metrics
+from pacing import act_and_wait, goto, pacer, wait_for_selector
+from pool import BrowserPool
+from retry import get_dead_letters, get_retrier
+from shard import WORKER_PROCESSES, ShardedRun
 
-def navigate_to_page(browser, url):
-    page = browser.new_page(
-        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.81 Safari/537.36",
-        permissions=["geolocation"]
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+class Selectors:
+    LOCATION_INPUT = "input[autocomplete='location-search']"
+    LOCATION_SUGGESTIONS = "div._53cb8cc6 div._948d9e0a.b9e631ef._371e9918"
+    SEARCH_INPUT = "input[type='search']"
+    ALL_ADS = "li[aria-label='Listing'] article._68441e28"
+    AD_TITLE = "h2._941ffa5e"
+    AD_PRICE = "span._1f2a2b47"
+    AD_LOCATION = "span._77000f35"
+    LOAD_MORE_BUTTON = "button:has-text('Load more')"
+    SEARCH_RESPONSE = r"/api/relevance/|/_msearch"  # Search API behind the listing and "Load more"
+    # Fields read from each ad in ALL_ADS by the batched extractor
+    AD_FIELDS = {
+        "title": field(AD_TITLE),
+        "price": field(AD_PRICE),
+        "location": field(AD_LOCATION),
+        "url": field("a[href]", attribute="href"),
+    }
+    AD_DEFAULTS = {"title": "No Title", "price": "No Price", "location": "No Location"}
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.81 Safari/537.36"
+
+# OLX caps listing pagination; this also guards against it repeating its last page forever
+MAX_LISTING_PAGES = 50
+
+# Worker pages that open matching ads and save them, in parallel with the listing walk
+ARCHIVE_WORKERS = 3
+
+LAUNCH_OPTIONS = {"args": ["--disable-blink-features=AutomationControlled"]}
+# The listing walk runs in a visible browser, set to True to run it headless
+LISTING_HEADLESS = False
+
+async def new_context(browser):
+    """Create a browser context for the listing and the archive workers, with resource blocking and the page cache."""
+    context = await browser.new_context(
+        user_agent=USER_AGENT,
+        permissions=["geolocation"],
+        viewport={"width": 1280, "height": 800}
     )
-    page.set_viewport_size({"width": 1280, "height": 800})
-    page.goto(url)
-    page.wait_for_load_state("networkidle")
-    return page
+    await get_blocker("olx").attach(context)
+    await get_cache().attach(context)
+    pacer.watch(context)
+    return context
+
+async def new_pdf_context(browser):
+    """Create a browser context for printing archived ads, which keeps their images and fonts."""
+    context = await browser.new_context(user_agent=USER_AGENT, viewport={"width": 1280, "height": 800})
+    await get_blocker("olx-pdf").attach(context)
+    pacer.watch(context)
+    return context
+
+def new_pdf_pool(pdf_mode, name="olx-pdf"):
+    """Pool of the browser that prints the archived ads, or None when no PDFs are rendered.
 
-def random_delay(min_delay=1, max_delay=3):
-    time.sleep(random.uniform(min_delay, max_delay))
+    Chromium only prints PDFs in headless mode, and the pages are printed with their images, so they get a browser of their own.
+    """
+    if pdf_mode == "off":
+        return None
+    return BrowserPool(new_pdf_context, 1, {**LAUNCH_OPTIONS, "headless": True}, name=name)
 
-def set_location(page, location, max_retries=5, retry_delay=2):
+async def navigate_to_page(page, url):
+    await goto(page, url)
+    await page.wait_for_selector(Selectors.LOCATION_INPUT)
+
+def location_search_url(url, slug, search_query):
+    """Listing URL of a search scoped to a location, e.g. /lahore_g4060673/q-iphone-15-pro-max."""
+    return urljoin(url, f"/{slug}/q-{'-'.join(search_query.lower().split())}")
+
+async def set_location(page, location, timeout=5000):
+    """Pick `location` from the location suggestions. Returns the suggestion picked, or None if none matched."""
     try:
-        location_box = page.wait_for_selector("input[autocomplete='location-search']", timeout=5000)
-        # Clear previous text
-        location_box.fill("")
-        random_delay()
-        # Simulate human-like typing
-        location_box.click()
-        for char in location:
-            location_box.press(char)
-            time.sleep(random.uniform(0.1, 0.3))
-            # Check for matching suggestions
-            suggestions = page.locator("div._53cb8cc6 div._948d9e0a.b9e631ef._371e9918")
-            suggestion_count = suggestions.count()
-            if suggestion_count > 0:
-                for i in range(suggestion_count):
-                    suggestion = suggestions.nth(i)
-                    suggestion_text = suggestion.inner_text()
-                    if location.lower() in suggestion_text.lower():
-                        suggestion.click()
-                        random_delay()
-                        print(f"Location set to: {suggestion_text}")
-                        return 
-        for attempt in range(max_retries):
-            print(f"No matching suggestion found on attempt {attempt + 1}. Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-            suggestions = page.locator("div._53cb8cc6 div._948d9e0a.b9e631ef._371e9918")
-            suggestion_count = suggestions.count()
-            if suggestion_count > 0:
-                for i in range(suggestion_count):
-                    suggestion = suggestions.nth(i)
-                    suggestion_text = suggestion.inner_text()
-                    if location.lower() in suggestion_text.lower():
-                        suggestion.click()
-                        random_delay()
-                        print(f"Location set to: {suggestion_text}")
-                        return 
-        print("Exceeded maximum retries. No matching suggestions found.")
+        location_box = await page.wait_for_selector(Selectors.LOCATION_INPUT, timeout=timeout)
+        # Typed in one go, the suggestions are only waited for once the whole name is in
+        await location_box.fill(location)
+        suggestion = page.locator(Selectors.LOCATION_SUGGESTIONS).filter(has_text=re.compile(re.escape(location), re.IGNORECASE)).first
+        await suggestion.wait_for(timeout=timeout)
+        suggestion_text = await suggestion.inner_text()
+        await suggestion.click()
+        print(f"Location set to: {suggestion_text}")
+        return suggestion_text
     except Exception as e:
         print(f"Location setting failed: {e}")
+        return None
+
+async def open_location_search(page, url, search_query, location):
+    """Open the location-scoped listing of a location resolved before. Returns False if it is not cached or failed."""
+    locations = get_location_cache()
+    cached = locations.lookup(location)
+    if not cached:
+        return False
+    search_url = location_search_url(url, cached["slug"], search_query)
+    try:
+        response = await goto(page, search_url)
+        if response is not None and not response.ok:
+            raise RuntimeError(f"HTTP {response.status}")
+    except Exception as e:
+        # The slug may have changed on the site, so the location is resolved again through the suggestions
+        print(f"Cached location {cached['slug']} failed, resolving it again: {e}")
+        locations.forget(location)
+        return False
+    try:
+        await wait_for_selector(page, Selectors.ALL_ADS, timeout=10000)
+    except Exception:
+        print("No ads on the listing.")
+    print(f"Location {cached['label']} taken from the cache.")
+    return True
 
-def search_olx(page, search_query, location):
-    set_location(page, location)
+async def search_olx(page, url, search_query, location):
+    """Open the listing of `search_query` in `location`. Returns False if the search failed.
+
+    A location resolved by an earlier search goes straight to its listing URL. Otherwise the location is
+    picked from the suggestions on the home page and its URL slug is remembered for the next search.
+    """
+    if await open_location_search(page, url, search_query, location):
+        return True
+    await get_retrier("olx").run(url, lambda: navigate_to_page(page, url))
+    location_label = await set_location(page, location)
     try:
-        search_box = page.wait_for_selector("input[type='search']")
-        search_box.fill(search_query)
-        random_delay()
-        search_box.press("Enter")
-        page.wait_for_load_state("networkidle")
-        random_delay()
+        search_box = await page.wait_for_selector(Selectors.SEARCH_INPUT)
+        await search_box.fill(search_query)
+        await pacer.pause(page.url, scale=0.5)
+        await act_and_wait(page, lambda: search_box.press("Enter"), selector=Selectors.ALL_ADS, url_change=True)
+        await pacer.pause(page.url)
     except Exception as e:
         print(f"Search failed: {e}")
+        return False
+    slug = location_slug_from_url(page.url)
+    if location_label and slug:
+        get_location_cache().store(location, location_label, slug)
+    return True
 
-def save_ad_content(page, ads_dir, title):
-    """Save ad content as HTML and PDF."""
-    ad_title_safe = re.sub(r'[<>:"/\\|?*]', '', title)
-    # Save HTML content
-    html_file_path = os.path.join(ads_dir, f"{ad_title_safe}.html")
-    with open(html_file_path, 'w', encoding='utf-8') as file:
-        file.write(page.content())
+def build_listing_page_url(listing_url, page_number):
+    parts = urlparse(listing_url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query["page"] = [str(page_number)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
 
-    # Save PDF
-    pdf_file_path = os.path.join(ads_dir, f"{ad_title_safe}.pdf")
-    page.pdf(path=pdf_file_path)
+async def fetch_listing_http(fetcher, listing_url):
+    """Read every ad of a listing page by page over plain HTTP. Returns None if the listing needs the browser."""
+    ad_records = []
+    seen_urls = set()
+    for page_number in range(1, MAX_LISTING_PAGES + 1):
+        result = await fetcher.fetch_items(build_listing_page_url(listing_url, page_number), Selectors.ALL_ADS, Selectors.AD_FIELDS)
+        if result is None:
+            if page_number == 1:
+                return None
+            break
 
-def collect_ads(page, ads_dir, search_query, location):
-    try:
+        new_records = [record for record in result[0] if record["url"] not in seen_urls]
+        if not new_records:
+            break
+        seen_urls.update(record["url"] for record in new_records)
+        ad_records.extend(new_records)
+    return ad_records
+
+AD_ID = re.compile(r"-iid-(\d+)")
+
+def ad_key(record):
+    """Stable dedup key of an ad: the ID in its link, or its title, price and location if it has no link."""
+    match = AD_ID.search(record.get("url") or "")
+    if match:
+        return match.group(1)
+    return f"{record['title']}|{record['price']}|{record['location']}"
+
+def merge_ad_records(api_records, dom_records):
+    """Combine the ads of the search API and of the rendered cards by ad ID, each ad once.
+
+    The API's record of an ad wins, ads only found in the cards are kept too.
+    """
+    merged = {}
+    for record in api_records + dom_records:
+        merged.setdefault(ad_key(record), record)
+    return list(merged.values())
+
+def select_new_ad(record, search_keywords, location, unique_ads):
+    """Return the ad if it matches the search and location and was not seen before, otherwise None."""
+    record = apply_defaults(record, Selectors.AD_DEFAULTS)
+    title = record["title"]
+    price = record["price"]
+    location_text = record["location"]
+
+    if not (any(keyword in title.lower() for keyword in search_keywords) and
+            location.lower() in location_text.lower()):
+        return None
+
+    # The same ad can arrive from the DOM and from the API, both link it by the same ad ID
+    if not claim(unique_ads, ad_key(record)):
+        metrics.count("duplicates", site="olx")
+        log_item("duplicate", "Duplicate ad found: %s", title)
+        return None
+
+    log_item("ad", "Title: %s, Price: %s, Location: %s", title, price, location_text)
+    return record
+
+def ad_from_hit(hit):
+    """Turn one search API hit into the same record the DOM extractor produces."""
+    source = hit.get("_source", hit)
+    levels = [level["name"] for level in source.get("location", []) if isinstance(level, dict) and level.get("name")]
+    price = source.get("price") or (source.get("extraFields") or {}).get("price")
+    return {
+        "title": source.get("title"),
+        "price": f"Rs {price:,}" if isinstance(price, (int, float)) else price,
+        # The cards show the two most specific levels, e.g. "Johar Town, Lahore"
+        "location": ", ".join(reversed(levels[-2:])) or None,
+        "url": f"/item/{source['slug']}-iid-{source['externalID']}" if source.get("slug") else None,
+    }
+
+def decode_listing_response(payload):
+    """Read the ads of a search API response. Payloads without ad hits are reported as not carrying results."""
+    hits = []
+    for value in find_key(payload, "hits"):
+        if isinstance(value, dict):
+            value = value.get("hits", [])
+        if isinstance(value, list):
+            hits.extend(hit for hit in value if isinstance(hit, dict))
+    ads = [ad_from_hit(hit) for hit in hits if "externalID" in hit.get("_source", hit)]
+    if not ads:
+        return [], None
+    return ads, True
+
+def next_listing_request(last_request, payload):
+    """Request the following listing page when the API pages through a `page` query parameter."""
+    parts = urlparse(last_request["url"])
+    query = parse_qs(parts.query, keep_blank_values=True)
+    if "page" not in query or not query["page"][0].isdigit():
+        return None
+    query["page"] = [str(int(query["page"][0]) + 1)]
+    return {**last_request, "url": urlunparse(parts._replace(query=urlencode(query, doseq=True)))}
+
+def new_listing_capture():
+    """Capture ads from the search API behind the listing, fetching later pages directly when it can."""
+    return ResponseCapture(Selectors.SEARCH_RESPONSE, decode_listing_response, next_listing_request, name="olx")
+
+def archive_ad(archive, listing_url, ad):
+    """Hand a matching ad to the archive workers, which save it as HTML and PDF."""
+    if not ad["url"]:
+        print(f"No link found for ad: {ad['title']}")
+        return
+    archive.submit(urljoin(listing_url, ad["url"]), ad["title"], ad_key(ad))
+
+async def collect_ads_http(page, fetcher, archive, search_query, location, unique_ads):
+    """Collect ads from the listing over HTTP and queue the matching ones for archiving.
+
+    Returns False if the listing could not be read over HTTP.
+    """
+    listing_url = page.url
+    ad_records = await fetch_listing_http(fetcher, listing_url)
+    if ad_records is None:
+        return False
+
+    print(f"Read {len(ad_records)} ads over HTTP.")
+    search_keywords = search_query.lower().split()
+    for record in ad_records:
+        ad = select_new_ad(record, search_keywords, location, unique_ads)
+        if ad is not None:
+            archive_ad(archive, listing_url, ad)
+    return True
+
+async def collect_ads(page, archive, search_query, location, fetcher=None, capture=None, unique_ads=None):
+    """Walk the listing and queue every matching ad for archiving, without ever leaving the results page.
+
+    `unique_ads` holds the keys of ads seen so far, usually the search's dedup index.
+    Returns False if collection stopped on an error.
+    """
+    if unique_ads is None:
         unique_ads = set()
+    try:
+        if fetcher and await collect_ads_http(page, fetcher, archive, search_query, location, unique_ads):
+            return True
+
         search_keywords = search_query.lower().split()
 
         while True:
-            random_delay()
-            ads = page.query_selector_all("li[aria-label='Listing'] article._68441e28")
-            if not ads:
-                print("No more ads found.")
+            # Read title, price and location of only the ads added since the last batch, in one round trip.
+            # The cards are marked as read here, so ads the search API did not carry must be kept from them now.
+            dom_records = await extract_new_items(page, Selectors.ALL_ADS, Selectors.AD_FIELDS)
+            ad_records = merge_ad_records(capture.take() if capture else [], dom_records)
+            if not ad_records:
+                if not await pacer.check_page(page):
+                    print("No more ads found.")
                 break
 
-            for ad in ads:
-                title = ad.query_selector("h2._941ffa5e").inner_text() if ad.query_selector("h2._941ffa5e") else "No Title"
-                price = ad.query_selector("span._1f2a2b47").inner_text() if ad.query_selector("span._1f2a2b47") else "No Price"
-                location_text = ad.query_selector("span._77000f35").inner_text() if ad.query_selector("span._77000f35") else "No Location"
-
-                if (any(keyword in title.lower() for keyword in search_keywords) and
-                        location.lower() in location_text.lower()):
-                    
-                    ad_identifier = (title, price, location_text)
-
-                    if ad_identifier not in unique_ads:
-                        unique_ads.add(ad_identifier)
-                        print(f"Title: {title}, Price: {price}, Location: {location_text}")
-                        
-                        # Open ad details page to save content
-                        ad.click()
-                        page.wait_for_load_state("networkidle")
-                        save_ad_content(page, ads_dir, title)  # Save both HTML and PDF
-                        page.go_back()  # Go back to the search results
-                    else:
-                        print(f"Duplicate ad found: {title}")
-
-            load_more_button = page.locator("button:has-text('Load more')")
-            if load_more_button.is_visible():
-                load_more_button.click()
-                random_delay()
+            for record in ad_records:
+                new_ad = select_new_ad(record, search_keywords, location, unique_ads)
+                if new_ad is not None:
+                    archive_ad(archive, page.url, new_ad)
+
+            if capture and capture.exhausted:
+                print("No more ads to load.")
+                break
+            # Once the search API is known the next page is requested directly, nothing has to render
+            if capture and await capture.fetch_next(page):
+                continue
+
+            load_more_button = page.locator(Selectors.LOAD_MORE_BUTTON)
+            if await load_more_button.is_visible():
+                await load_more_button.click()
+                # Wait until the new batch of ads has been appended to the listing
+                if not await wait_for_new_items(page, Selectors.ALL_ADS):
+                    print("No new ads appeared after loading more.")
+                await pacer.pause(page.url)
             else:
                 print("No more ads to load.")
                 break
     except Exception as e:
         print(f"Ad collection failed: {e}")
+        return False
+    return True
 
-def run(url, search_query, location):
+def ads_directory(search_query, location):
+    """Create and return the directory the ads of a search are archived in, <location>/<query>."""
     search_query_safe = re.sub(r'[<>:"/\\|?*]', '', search_query)
     location_safe = re.sub(r'[<>:"/\\|?*]', '', location)
-
-    # Directory structure
     ads_dir = os.path.join(location_safe, search_query_safe)
     os.makedirs(ads_dir, exist_ok=True)
+    return ads_dir
+
+def open_ads_index(ads_dir, recover=True):
+    """Dedup index of a search, so ads archived by earlier runs of the same search are not archived again."""
+    return open_dedup_index(f"olx:{ads_dir}", recover=recover)
+
+async def run(url, search_query, location, use_http=True, archive_workers=ARCHIVE_WORKERS, pdf_mode="queue"):
+    """Search OLX and archive every matching ad. Returns False if the search or ad collection failed."""
+    completed = False
+    archive = None
+    ads_dir = ads_directory(search_query, location)
+    unique_ads = open_ads_index(ads_dir)
+
+    fetcher = create_fetcher(USER_AGENT, get_cache()) if use_http else None
+    # The listing page plus one page per archive worker
+    pool = BrowserPool(new_context, archive_workers + 1, {**LAUNCH_OPTIONS, "headless": LISTING_HEADLESS}, name="olx")
+    pdf_pool = new_pdf_pool(pdf_mode)
+    try:
+        await pool.start()
+        if pdf_pool:
+            await pdf_pool.start()
+        archive = ArchivePipeline(
+            pool, ads_dir, archive_workers, pdf_mode=pdf_mode, pdf_pool=pdf_pool, dedup=unique_ads, retrier=get_retrier("olx")
+        )
+        archive.start()
+
+        async with pool.lease() as page:
+            capture = new_listing_capture()
+            capture.attach(page)
+            completed = (
+                await search_olx(page, url, search_query, location)
+                and await collect_ads(page, archive, search_query, location, fetcher, capture, unique_ads)
+            )
+    except Exception as e:
+        print(f"Search failed: {e}")
+        completed = False
+    finally:
+        if archive:
+            # Ads found before an error are still archived
+            archive_stats = await archive.close()
+            print(f"Archived {archive_stats.get('snapshots', 0)} ads and {archive_stats.get('pdfs', 0)} PDFs.")
+        if pdf_pool:
+            await pdf_pool.close()
+        await pool.close()
+        unique_ads.close()
+        if fetcher:
+            await fetcher.close()
+        get_cache().report()
+        metrics.report()
+        stats = get_blocker("olx").report()
+        print(f"Blocked {stats['blocked_requests']} requests, saved ~{stats['bytes_saved_estimate'] / 1_000_000:.1f} MB")
+    return completed
+
+async def archive_shard(worker_id, ads, options):
+    """Worker process side of the sharded run: archive every ad handed to this process.
+
+    Ads are claimed by the listing walk in the parent, the workers only record the ones they saved.
+    """
+    pool = BrowserPool(new_context, options["archive_workers"], {**LAUNCH_OPTIONS, "headless": True}, name=f"olx-{worker_id}")
+    pdf_pool = new_pdf_pool(options["pdf_mode"], name=f"olx-pdf-{worker_id}")
+    # The parent holds the claims of the ads it hands out, they must outlive this process' startup
+    saved_ads = open_ads_index(options["ads_dir"], recover=False)
+    try:
+        await pool.start()
+        if pdf_pool:
+            await pdf_pool.start()
+        archive = ArchivePipeline(
+            pool, options["ads_dir"], options["archive_workers"], pdf_mode=options["pdf_mode"], pdf_pool=pdf_pool,
+            dedup=saved_ads, retrier=get_retrier("olx")
+        )
+        archive.start()
+        async for ad_url, name, key in ads:
+            archive.submit(ad_url, name, key)
+        await archive.close()
+    finally:
+        await pool.close()
+        if pdf_pool:
+            await pdf_pool.close()
+        saved_ads.close()
+
+async def run_sharded(url, search_query, location, processes=WORKER_PROCESSES, use_http=True, archive_workers=ARCHIVE_WORKERS, pdf_mode="queue"):
+    """Walk the listing in this process and spread the ads to archive over worker processes with browsers of their own.
+
+    Returns False if the search or ad collection failed.
+    """
+    completed = False
+    stats = None
+    ads_dir = ads_directory(search_query, location)
+    unique_ads = open_ads_index(ads_dir)
+
+    fetcher = create_fetcher(USER_AGENT, get_cache()) if use_http else None
+    # Ads are submitted to the run as they are found, the first idle worker process archives each one
+    archive = ShardedRun(
+        archive_shard, processes, options={"ads_dir": ads_dir, "archive_workers": archive_workers, "pdf_mode": pdf_mode}, name="olx"
+    )
+    pool = BrowserPool(new_context, 1, {**LAUNCH_OPTIONS, "headless": LISTING_HEADLESS}, name="olx")
+    archive.start()
+    try:
+        await pool.start()
+        async with pool.lease() as page:
+            capture = new_listing_capture()
+            capture.attach(page)
+            completed = (
+                await search_olx(page, url, search_query, location)
+                and await collect_ads(page, archive, search_query, location, fetcher, capture, unique_ads)
+            )
+    except Exception as e:
+        print(f"Search failed: {e}")
+        completed = False
+    finally:
+        try:
+            await pool.close()
+        finally:
+            # The worker processes are waited for even if the listing browser failed to close
+            stats = await archive.close()
+            unique_ads.close()
+        print(f"Archived the {stats['items']} matching ads in {processes} processes.")
+        if fetcher:
+            await fetcher.close()
+        get_cache().report()
+        metrics.report()
+    return completed and stats is not None and stats["failed_processes"] == 0
+
+async def replay_dead_letters(archive_workers=ARCHIVE_WORKERS, pdf_mode="queue"):
+    """Archive again the ads earlier runs gave up on, into the directories of their searches.
+
+    Returns False if any of them failed again.
+    """
+    dead_letters = get_dead_letters()
+    entries = dead_letters.entries("olx", "snapshot")
+    if not entries:
+        print("No dead letters to replay.")
+        return True
+    pool = BrowserPool(new_context, archive_workers, {**LAUNCH_OPTIONS, "headless": True}, name="olx")
+    pdf_pool = new_pdf_pool(pdf_mode)
+    try:
+        await pool.start()
+        if pdf_pool:
+            await pdf_pool.start()
+        for ads_dir in sorted({entry["context"]["output_dir"] for entry in entries}):
+            os.makedirs(ads_dir, exist_ok=True)
+            saved_ads = open_ads_index(ads_dir)
+            try:
+                archive = ArchivePipeline(
+                    pool, ads_dir, archive_workers, pdf_mode=pdf_mode, pdf_pool=pdf_pool, dedup=saved_ads, retrier=get_retrier("olx")
+                )
+                archive.start()
+                for entry in entries:
+                    if entry["context"]["output_dir"] == ads_dir:
+                        archive.submit(entry["url"], entry["context"]["name"], entry["context"]["key"])
+                await archive.close()
+            finally:
+                saved_ads.close()
+    finally:
+        await pool.close()
+        if pdf_pool:
+            await pdf_pool.close()
+    remaining = len(dead_letters.entries("olx", "snapshot"))
+    print(f"Replayed {len(entries)} ads, {remaining} still failing.")
+    return remaining == 0
 
-    with sync_playwright() as playwright:
-        browser = launch_browser(playwright, headless=False)
-        page = navigate_to_page(browser, url)
-        search_olx(page, search_query, location)
-        collect_ads(page, ads_dir, search_query, location)
-        browser.close()
-
-# Parameters
-url = "https://www.olx.com.pk"
-search_query = "iphone 15 pro max"
-location = "Johar Town, Lahore"
-run(url, search_query, location)
+if __name__ == "__main__":
+    # Parameters
+    url = "https://www.olx.com.pk"
+    search_query = "iphone 15 pro max"
+    location = "Johar Town, Lahore"
+    asyncio.run(run(url, search_query, location))
@@ -0,0 +1,375 @@
+import asyncio
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+
+from metrics import metrics, site_of
+
+# Human-like jitter per domain as (min_delay, max_delay) in seconds, applied on top of real readiness waits
+DOMAIN_BUDGETS = {
+    "amazon.in": (1.0, 2.5),
+    "olx.com.pk": (0.5, 1.5),
+    "youtube.com": (0.5, 1.5),
+}
+DEFAULT_BUDGET = (0.5, 1.5)
+
+# Backoff applied to a domain's budget when it starts throttling us, and how fast it recovers
+BACKOFF_FACTOR = 2.0
+MAX_MULTIPLIER = 16.0
+RECOVERY_FACTOR = 0.9
+
+THROTTLE_STATUSES = {429, 503}
+
+# Starting request rate (per second) and the most requests ever allowed in flight at once, per domain.
+# Both are adapted while a run goes: raised while the domain stays fast and healthy, cut on trouble.
+DOMAIN_LIMITS = {
+    "amazon.in": (2.0, 8),
+    "olx.com.pk": (4.0, 8),
+    "youtube.com": (4.0, 6),
+}
+DEFAULT_LIMITS = (2.0, 4)
+INITIAL_CONCURRENCY = 2
+# Bursts the token bucket allows above the rate, in requests
+BURST = 4
+MIN_RATE = 0.2
+# A domain's rate never grows past its starting rate times this
+MAX_RATE_FACTOR = 4
+# Requests judged together: after each window the limits grow by one step when its p95 latency and error
+# rate are under these targets, and are cut otherwise
+LIMIT_WINDOW = 20
+TARGET_P95 = 5.0
+MAX_ERROR_RATE = 0.05
+RATE_STEP = 0.5
+DECREASE_FACTOR = 0.5
+# Signals arriving together (a burst of 429s) only cut the limits once
+DECREASE_COOLDOWN = 10
+
+# Markers of a captcha or "unusual traffic" interstitial instead of real content
+CAPTCHA_SELECTORS = ", ".join([
+    "form[action*='validateCaptcha']",
+    "#captchacharacters",
+    "form#captcha-form",
+    "iframe[src*='recaptcha']",
+    "#px-captcha",
+])
+
+# Text that only shows up on captcha / bot-check pages, for responses read without a browser
+CAPTCHA_MARKERS = (
+    "validateCaptcha",
+    "captchacharacters",
+    "Enter the characters you see below",
+    "unusual traffic",
+    "px-captcha",
+    "g-recaptcha",
+)
+
+def looks_like_captcha(html):
+    return any(marker in html for marker in CAPTCHA_MARKERS)
+
+def get_domain(url):
+    host = urlparse(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+class TokenBucket:
+    """Allows `rate` requests per second on average, with bursts of up to `burst` requests."""
+
+    def __init__(self, rate, burst=BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def reserve(self):
+        """Take a token and return how long to wait before it may be used. Callers wait in arrival order."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """Give back a reserved token that was never used."""
+        self.tokens = min(self.burst, self.tokens + 1)
+
+class DomainLimiter:
+    """Token bucket rate limit and AIMD concurrency limit of one domain.
+
+    Both limits grow additively while requests stay fast and succeed and are halved on throttling,
+    timeouts or a window of slow or failing requests.
+    """
+
+    def __init__(self, domain, rate, max_concurrency):
+        self.domain = domain
+        self.site = site_of(f"https://{domain}/")
+        self.bucket = TokenBucket(rate)
+        self.max_rate = rate * MAX_RATE_FACTOR
+        self.max_concurrency = max_concurrency
+        self.concurrency = min(INITIAL_CONCURRENCY, max_concurrency)
+        self.in_flight = 0
+        self.waiters = []
+        self.latencies = []
+        self.failures = 0
+        self.last_decrease = 0.0
+        self.last_p95 = None
+        self.last_error_rate = None
+        self.publish()
+
+    async def acquire(self):
+        # The token comes first, so requests waiting out the rate limit do not hold concurrency slots meanwhile
+        delay = self.bucket.reserve()
+        if delay:
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.bucket.refund()
+                raise
+        while self.in_flight >= self.concurrency:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self.wake()  # Pass on the slot this waiter was woken for
+                raise
+        self.in_flight += 1
+        self.publish()
+
+    def wake(self):
+        free = self.concurrency - self.in_flight
+        while self.waiters and free > 0:
+            waiter = self.waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def release(self, seconds, error=None):
+        self.in_flight -= 1
+        if error is not None and "timeout" in type(error).__name__.lower():
+            self.decrease("timeout")
+        self.latencies.append(seconds)
+        self.failures += error is not None
+        if len(self.latencies) >= LIMIT_WINDOW:
+            self.adjust()
+        self.publish()
+        self.wake()
+
+    def adjust(self):
+        """Judge the last window of requests and move both limits accordingly."""
+        latencies = sorted(self.latencies)
+        self.last_p95 = latencies[int(0.95 * (len(latencies) - 1))]
+        self.last_error_rate = self.failures / len(latencies)
+        self.latencies = []
+        self.failures = 0
+        if self.last_error_rate > MAX_ERROR_RATE:
+            self.decrease(f"{self.last_error_rate:.0%} errors")
+        elif self.last_p95 > TARGET_P95:
+            self.decrease(f"p95 latency {self.last_p95:.1f}s")
+        else:
+            self.concurrency = min(self.concurrency + 1, self.max_concurrency)
+            self.bucket.rate = min(self.bucket.rate + RATE_STEP, self.max_rate)
+            logging.debug(f"[{self.domain}] Raised limits to {self.bucket.rate:.2f} req/s, {self.concurrency} in flight.")
+
+    def decrease(self, reason):
+        now = time.monotonic()
+        if now - self.last_decrease < DECREASE_COOLDOWN:
+            return
+        self.last_decrease = now
+        self.concurrency = max(int(self.concurrency * DECREASE_FACTOR), 1)
+        self.bucket.rate = max(self.bucket.rate * DECREASE_FACTOR, MIN_RATE)
+        self.latencies = []
+        self.failures = 0
+        logging.warning(f"[{self.domain}] Cut limits to {self.bucket.rate:.2f} req/s, {self.concurrency} in flight ({reason}).")
+
+    def publish(self):
+        metrics.set("rate_limit", self.bucket.rate, site=self.site)
+        metrics.set("concurrency_limit", self.concurrency, site=self.site)
+        metrics.set("in_flight", self.in_flight, site=self.site)
+
+    def state(self):
+        return {
+            "rate": self.bucket.rate,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "p95": self.last_p95,
+            "error_rate": self.last_error_rate,
+        }
+
+class Pacer:
+    """Per-domain politeness budget that backs off on throttling signals and recovers on success."""
+
+    def __init__(self, budgets=None, enabled=True, limits=None):
+        self.budgets = dict(DOMAIN_BUDGETS if budgets is None else budgets)
+        self.limits = dict(DOMAIN_LIMITS if limits is None else limits)
+        self.enabled = enabled
+        self.multipliers = {}
+        self.limiters = {}
+        self.holders = Counter()  # Pages navigating under a request slot
+
+    def budget_for(self, domain):
+        for suffix, budget in self.budgets.items():
+            if domain == suffix or domain.endswith("." + suffix):
+                return budget
+        return DEFAULT_BUDGET
+
+    def limiter(self, domain):
+        if domain not in self.limiters:
+            rate, max_concurrency = next(
+                (limits for suffix, limits in self.limits.items() if domain == suffix or domain.endswith("." + suffix)),
+                DEFAULT_LIMITS,
+            )
+            self.limiters[domain] = DomainLimiter(domain, rate, max_concurrency)
+        return self.limiters[domain]
+
+    @asynccontextmanager
+    async def request(self, url, page=None):
+        """Hold one of the domain's request slots for the `with` block, waiting for its rate limit first.
+
+        The block's latency and any exception it raises feed the domain's adaptive limits. With a `page`,
+        the slot also covers the requests that page makes for the block, see `holds`.
+        """
+        if not self.enabled:
+            yield
+            return
+        limiter = self.limiter(get_domain(url))
+        await limiter.acquire()
+        if page is not None:
+            self.holders[page] += 1
+        start = time.monotonic()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            limiter.release(time.monotonic() - start, error)
+            if page is not None:
+                self.holders[page] -= 1
+                if not self.holders[page]:
+                    del self.holders[page]
+
+    def holds(self, page):
+        """Whether a request slot is held for `page`, i.e. it is navigating through `goto`."""
+        return page is not None and self.holders.get(page, 0) > 0
+
+    def state(self):
+        """Current rate, concurrency and recent health of every domain, as {domain: {...}}."""
+        return {domain: limiter.state() for domain, limiter in self.limiters.items()}
+
+    async def pause(self, url, scale=1.0):
+        """Sleep for the domain's jittered politeness delay, stretched by any active backoff."""
+        if not self.enabled:
+            return
+        domain = get_domain(url)
+        min_delay, max_delay = self.budget_for(domain)
+        multiplier = self.multipliers.get(domain, 1.0)
+        with metrics.timer("pause", site=site_of(url)):
+            await asyncio.sleep(random.uniform(min_delay, max_delay) * multiplier * scale)
+
+    def record_throttle(self, url, reason):
+        domain = get_domain(url)
+        multiplier = min(self.multipliers.get(domain, 1.0) * BACKOFF_FACTOR, MAX_MULTIPLIER)
+        self.multipliers[domain] = multiplier
+        if self.enabled:
+            self.limiter(domain).decrease(reason)
+        metrics.count("throttled", site=site_of(url))
+        logging.warning(f"Throttling signal from {domain} ({reason}), backing off to {multiplier:.1f}x delay.")
+
+    def record_success(self, url):
+        domain = get_domain(url)
+        if domain in self.multipliers:
+            multiplier = self.multipliers[domain] * RECOVERY_FACTOR
+            if multiplier <= 1.0:
+                del self.multipliers[domain]
+            else:
+                self.multipliers[domain] = multiplier
+
+    def watch(self, target):
+        """Back off automatically when a page or context receives a throttling HTTP status."""
+        target.on("response", self.on_response)
+
+    def on_response(self, response):
+        if response.status in THROTTLE_STATUSES:
+            self.record_throttle(response.url, f"HTTP {response.status}")
+        elif response.request.resource_type == "document" and response.ok:
+            self.record_success(response.url)
+
+    async def check_page(self, page):
+        """Return True and back off if the page is a captcha or block page."""
+        try:
+            if await page.query_selector(CAPTCHA_SELECTORS):
+                self.record_throttle(page.url, "captcha")
+                return True
+        except Exception as e:
+            logging.debug(f"Captcha check failed: {e}")
+        return False
+
+# Shared by every scraper in the process so a domain's backoff applies to all of its tasks
+pacer = Pacer()
+
+async def act_and_wait(page, action, selector=None, response_pattern=None, url_change=False, load_state=None, timeout=30000):
+    """Run `action` and wait for the readiness signals it should cause instead of sleeping a fixed time.
+
+    Signals: a selector becoming present, a network response whose URL matches `response_pattern`,
+    the page URL changing, or a load state being reached. Signals that do not arrive within
+    `timeout` are logged and do not raise.
+    """
+    old_url = page.url
+    response_waiter = None
+    if response_pattern:
+        pattern = re.compile(response_pattern)
+        response_waiter = asyncio.ensure_future(
+            page.wait_for_event("response", predicate=lambda response: bool(pattern.search(response.url)), timeout=timeout)
+        )
+
+    try:
+        await action()
+    except Exception:
+        if response_waiter:
+            response_waiter.cancel()
+        raise
+
+    # Checked in order, so a selector is only looked up once the navigation it depends on happened
+    waits = []
+    if response_waiter:
+        waits.append(lambda: response_waiter)
+    if url_change:
+        waits.append(lambda: page.wait_for_url(lambda url: url != old_url, timeout=timeout))
+    if load_state:
+        waits.append(lambda: page.wait_for_load_state(load_state, timeout=timeout))
+    if selector:
+        waits.append(lambda: page.wait_for_selector(selector, timeout=timeout))
+
+    ready = True
+    with metrics.timer("wait", site=site_of(old_url)):
+        for wait in waits:
+            try:
+                await wait()
+            except Exception as e:
+                ready = False
+                logging.warning(f"Readiness signal not received: {e}")
+    if url_change and ready:
+        metrics.count("pages", site=site_of(page.url))  # A click that navigated, the wait above timed the load
+    return ready
+
+async def goto(page, url, **kwargs):
+    """`page.goto`, timed as the navigation stage and counted as a page load."""
+    site = site_of(url)
+    async with pacer.request(url, page):
+        with metrics.timer("navigation", site=site):
+            response = await page.goto(url, **kwargs)
+    metrics.count("pages", site=site)
+    return response
+
+async def wait_for_selector(page, selector, **kwargs):
+    """`page.wait_for_selector`, timed as the wait stage."""
+    with metrics.timer("wait", site=site_of(page.url)):
+        return await page.wait_for_selector(selector, **kwargs)
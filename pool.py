@@ -0,0 +1,198 @@
+import asyncio
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from metrics import metrics
+from pacing import goto
+
+# A context is replaced once it has done this many main-frame navigations...
+MAX_NAVIGATIONS = 200
+# ...or once its page holds more JavaScript heap than this
+MAX_MEMORY_MB = 512
+# Attempts at relaunching a browser that crashed before a lease gives up
+RELAUNCH_ATTEMPTS = 3
+
+HEAP_SIZE_JS = "() => performance.memory ? performance.memory.usedJSHeapSize : null"
+
+class PooledContext:
+    """One slot of the pool: a browser context with the page that is lent out, and its usage so far."""
+
+    def __init__(self, slot_id):
+        self.slot_id = slot_id
+        self.browser = None
+        self.context = None
+        self.page = None
+        self.navigations = 0
+        self.broken = False
+
+    def usable(self):
+        return self.page is not None and not self.broken and self.browser.is_connected()
+
+class BrowserPool:
+    """Keeps a warm browser with a fixed number of contexts and lends out their pages.
+
+    `new_context(browser)` builds each context (user agent, blocking, cache), so startup cost is paid once
+    and a page is reused from one lease to the next. Each context is leased to one holder at a time. When
+    it comes back after `max_navigations` navigations or with more than `max_memory_mb` of JavaScript heap
+    it is replaced by a fresh one, and a browser that crashed is relaunched on the next lease.
+    """
+
+    def __init__(self, new_context, size=1, launch_options=None, max_navigations=MAX_NAVIGATIONS,
+                 max_memory_mb=MAX_MEMORY_MB, warm_url=None, name="browser"):
+        self.new_context = new_context
+        self.size = size
+        self.launch_options = launch_options or {}
+        self.max_navigations = max_navigations
+        self.max_memory_mb = max_memory_mb
+        self.warm_url = warm_url
+        self.name = name
+        self.playwright = None
+        self.browser = None
+        self.idle = asyncio.Queue()
+        self.slots = []
+        self.launch_lock = asyncio.Lock()
+        self.closing = False
+        self.stats = Counter()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def start(self):
+        """Launch the browser and warm up every context before the first lease."""
+        self.playwright = await async_playwright().start()
+        await self.launch()
+        self.slots = [PooledContext(slot_id) for slot_id in range(self.size)]
+        await asyncio.gather(*(self.renew(slot) for slot in self.slots))
+        for slot in self.slots:
+            self.idle.put_nowait(slot)
+        logging.info(f"[{self.name}] Pool ready with {self.size} warm contexts.")
+
+    async def launch(self):
+        self.browser = await self.playwright.chromium.launch(**self.launch_options)
+        self.browser.on("disconnected", self.on_disconnected)
+        self.stats["launches"] += 1
+
+    def on_disconnected(self, browser):
+        if not self.closing:
+            self.stats["crashes"] += 1
+            logging.warning(f"[{self.name}] Browser disconnected, it is relaunched on the next lease.")
+
+    async def ensure_browser(self):
+        async with self.launch_lock:
+            if self.browser.is_connected():
+                return
+            for attempt in range(1, RELAUNCH_ATTEMPTS + 1):
+                try:
+                    await self.launch()
+                    logging.info(f"[{self.name}] Relaunched the browser.")
+                    return
+                except Exception as e:
+                    metrics.count("retries", site=self.name.split("-")[0])  # Pools are named <site>-<worker or role>
+                    logging.error(f"[{self.name}] Relaunch attempt {attempt} failed: {e}")
+                    await asyncio.sleep(2 ** attempt)
+            raise RuntimeError(f"[{self.name}] Could not relaunch the browser")
+
+    def watch(self, slot, page):
+        """Count the main-frame navigations of every page in a slot's context, and notice crashed pages."""
+        def on_navigated(frame):
+            if frame.parent_frame is None:
+                slot.navigations += 1
+
+        def on_crash(page):
+            slot.broken = True
+            logging.warning(f"[{self.name}] Page in context {slot.slot_id} crashed.")
+
+        page.on("framenavigated", on_navigated)
+        page.on("crash", on_crash)
+
+    async def renew(self, slot):
+        """Replace a slot's context with a fresh one, relaunching the browser first if it has gone."""
+        if slot.context is not None:
+            try:
+                await slot.context.close()
+            except Exception as e:
+                logging.debug(f"[{self.name}] Could not close context {slot.slot_id}: {e}")
+            slot.context = slot.page = None
+
+        await self.ensure_browser()
+        slot.browser = self.browser
+        slot.navigations = 0
+        slot.broken = False
+        slot.context = await self.new_context(self.browser)
+        slot.context.on("page", lambda page: self.watch(slot, page))
+        slot.page = await slot.context.new_page()
+
+        if self.warm_url:
+            try:
+                await goto(slot.page, self.warm_url, timeout=60000)
+            except Exception as e:
+                logging.warning(f"[{self.name}] Warm-up of context {slot.slot_id} failed: {e}")
+
+    async def heap_mb(self, page):
+        try:
+            used = await page.evaluate(HEAP_SIZE_JS)
+        except Exception:
+            return None
+        return used / 1_000_000 if used else None
+
+    async def recycle_reason(self, slot):
+        if not slot.usable():
+            return "broken"
+        if slot.navigations >= self.max_navigations:
+            return "navigations"
+        memory = await self.heap_mb(slot.page)
+        if memory is not None and memory > self.max_memory_mb:
+            return "memory"
+        return None
+
+    @asynccontextmanager
+    async def lease(self):
+        """Borrow a page for the duration of the `async with` block."""
+        slot = await self.idle.get()
+        try:
+            if not slot.usable():
+                await self.renew(slot)
+            self.stats["leases"] += 1
+            yield slot.page
+        finally:
+            await self.release(slot)
+
+    async def release(self, slot):
+        try:
+            reason = await self.recycle_reason(slot) if slot.page is not None else None
+            if reason:
+                logging.info(f"[{self.name}] Recycling context {slot.slot_id} ({reason}, {slot.navigations} navigations).")
+                self.stats[f"recycled_{reason}"] += 1
+                await self.renew(slot)
+        except Exception as e:
+            # The slot goes back as it is and gets another renewal attempt on its next lease
+            slot.broken = True
+            logging.error(f"[{self.name}] Could not recycle context {slot.slot_id}: {e}")
+        finally:
+            self.idle.put_nowait(slot)
+
+    def report(self):
+        """Log and return the pool statistics of this run."""
+        stats = dict(self.stats)
+        logging.info(f"[{self.name}] Browser pool: {stats}")
+        return stats
+
+    async def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        if self.browser is not None:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logging.debug(f"[{self.name}] Could not close the browser: {e}")
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.report()
@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from metrics import metrics
+
+DEAD_LETTERS_PATH = "data/dead_letters.sqlite"
+
+# Classes of errors, each with the attempts an operation gets when it keeps failing that way
+TRANSIENT = "transient"  # Timeouts, dropped connections, crashed pages and browsers
+SELECTOR_MISSING = "selector_missing"  # The page loaded but the element waited for never showed up
+BLOCKED = "blocked"  # Captchas and throttling
+FATAL = "fatal"  # Bugs and bad input, another attempt would fail the same way
+ATTEMPTS = {TRANSIENT: 4, SELECTOR_MISSING: 2, BLOCKED: 3, FATAL: 1}
+
+# Retry n waits up to BACKOFF_BASE * 2 ** (n - 1) seconds, capped at BACKOFF_MAX, with full jitter
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+# Blocked pages wait longer, so the pacer's backoff has time to work before the next attempt
+BLOCKED_BACKOFF_FACTOR = 4
+
+# Failed attempts one URL may use in a process, however many times and from wherever it is retried
+MAX_URL_ATTEMPTS = 6
+
+# Error messages of Playwright and the network that mean the same request may well work a second time
+TRANSIENT_MARKERS = (
+    "net::ERR_",
+    "Target closed",
+    "has been closed",
+    "Execution context was destroyed",
+    "Navigation failed because page crashed",
+    "Connection closed",
+    "ECONNRESET",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dead_letters (
+    site TEXT NOT NULL,
+    item_type TEXT NOT NULL,
+    url TEXT NOT NULL,
+    error_class TEXT NOT NULL,
+    error TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    context TEXT NOT NULL,
+    failed_at REAL NOT NULL,
+    PRIMARY KEY (site, item_type, url)
+);
+"""
+
+class ScrapeError(Exception):
+    """An error the scrapers raise themselves, with the class it is retried as."""
+    error_class = FATAL
+
+class BlockedError(ScrapeError):
+    error_class = BLOCKED
+
+class SelectorMissingError(ScrapeError):
+    error_class = SELECTOR_MISSING
+
+def classify(error):
+    """Return the class an exception is retried as: TRANSIENT, SELECTOR_MISSING, BLOCKED or FATAL."""
+    if isinstance(error, ScrapeError):
+        return error.error_class
+    name = type(error).__name__
+    module = type(error).__module__
+    message = str(error)
+    # Playwright raises the same TimeoutError for slow navigations and for elements that never appear
+    if name == "TimeoutError" and "waiting for" in message and ("locator" in message or "selector" in message):
+        return SELECTOR_MISSING
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)) or "Timeout" in name:
+        return TRANSIENT
+    if module.startswith("httpx") or any(marker in message for marker in TRANSIENT_MARKERS):
+        return TRANSIENT
+    return FATAL
+
+def backoff_delay(attempt, error_class=TRANSIENT):
+    """Seconds to wait before retry `attempt` (1 for the first retry)."""
+    delay = min(BACKOFF_BASE * 2 ** (attempt - 1), BACKOFF_MAX)
+    if error_class == BLOCKED:
+        delay *= BLOCKED_BACKOFF_FACTOR
+    return random.uniform(0, delay)
+
+class DeadLetterQueue:
+    """URLs given up on after their retries, kept in SQLite with their error and context for a later replay.
+
+    Safe to share with the output sink's writer thread, which resolves entries once their items are saved.
+    """
+
+    def __init__(self, path=DEAD_LETTERS_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        # Held in memory so resolving an item that never failed costs no query
+        self.keys = set(self.connection.execute("SELECT site, item_type, url FROM dead_letters").fetchall())
+
+    def add(self, site, item_type, url, error_class, error, attempts, context=None):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dead_letters (site, item_type, url, error_class, error, attempts, context, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (site, item_type, url, error_class, str(error)[:1000], attempts, json.dumps(context or {}), time.time()),
+            )
+            self.keys.add((site, item_type, url))
+
+    def discard(self, site, item_type, url):
+        """Forget an entry once its item has been scraped after all."""
+        with self.lock:
+            if (site, item_type, url) not in self.keys:
+                return
+            with self.connection:
+                self.connection.execute(
+                    "DELETE FROM dead_letters WHERE site = ? AND item_type = ? AND url = ?", (site, item_type, url)
+                )
+            self.keys.discard((site, item_type, url))
+
+    def entries(self, site=None, item_type=None):
+        query = "SELECT site, item_type, url, error_class, error, attempts, context, failed_at FROM dead_letters WHERE 1 = 1"
+        params = []
+        if site:
+            query += " AND site = ?"
+            params.append(site)
+        if item_type:
+            query += " AND item_type = ?"
+            params.append(item_type)
+        with self.lock:
+            rows = self.connection.execute(query + " ORDER BY failed_at", params).fetchall()
+        columns = ("site", "item_type", "url", "error_class", "error", "attempts", "context", "failed_at")
+        entries = [dict(zip(columns, row)) for row in rows]
+        for entry in entries:
+            entry["context"] = json.loads(entry["context"])
+        return entries
+
+    def clear(self, site=None):
+        with self.lock, self.connection:
+            if site:
+                self.connection.execute("DELETE FROM dead_letters WHERE site = ?", (site,))
+                self.keys = {key for key in self.keys if key[0] != site}
+            else:
+                self.connection.execute("DELETE FROM dead_letters")
+                self.keys = set()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+_dead_letters = None
+
+def get_dead_letters():
+    """Return the process-wide dead-letter queue."""
+    global _dead_letters
+    if _dead_letters is None:
+        _dead_letters = DeadLetterQueue()
+    return _dead_letters
+
+class Retrier:
+    """Runs the operations on one site's URLs with classified retries and a per-URL budget of failed attempts.
+
+    An operation that runs out of attempts is added to the dead-letter queue and its last error is raised,
+    so the caller gives up on that one item and carries on with the rest.
+    """
+
+    def __init__(self, site, max_url_attempts=MAX_URL_ATTEMPTS):
+        self.site = site
+        self.max_url_attempts = max_url_attempts
+        self.failures = Counter()
+        self.stats = Counter()
+
+    async def run(self, url, operation, item_type=None, context=None):
+        """Await `operation()` until it succeeds or its retries run out.
+
+        With an `item_type` ("brand", "page", "ad", ...) the URL is dead-lettered when it is given up on,
+        and a dead letter from an earlier run is resolved when it succeeds.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = await operation()
+            except Exception as e:
+                error_class = classify(e)
+                self.failures[url] += 1
+                self.stats[error_class] += 1
+                if attempt >= ATTEMPTS[error_class] or self.failures[url] >= self.max_url_attempts:
+                    self.give_up(url, item_type, error_class, e, attempt, context)
+                    raise
+                delay = backoff_delay(attempt, error_class)
+                metrics.count("retries", site=self.site)
+                logging.warning(
+                    f"[{self.site}] {error_class} error on {url} (attempt {attempt}), retrying in {delay:.1f}s: "
+                    f"{str(e).splitlines()[0] if str(e) else type(e).__name__}"
+                )
+                await asyncio.sleep(delay)
+                continue
+            if item_type:
+                get_dead_letters().discard(self.site, item_type, url)
+            return result
+
+    def give_up(self, url, item_type, error_class, error, attempts, context=None):
+        self.stats["given_up"] += 1
+        logging.error(f"[{self.site}] Giving up on {url} after {attempts} attempts ({error_class}): {error}")
+        if item_type:
+            get_dead_letters().add(self.site, item_type, url, error_class, error, attempts, context)
+
+_retriers = {}
+
+def get_retrier(site):
+    """Return the shared retrier of a site, so a URL's attempt budget holds across every task of the process."""
+    if site not in _retriers:
+        _retriers[site] = Retrier(site)
+    return _retriers[site]
@@ -0,0 +1,190 @@
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+
+from metrics import metrics
+from sink import close_sink, get_sink, open_sink, use_sink
+
+# Worker processes of a sharded run, each with browsers of its own
+WORKER_PROCESSES = os.cpu_count() or 2
+
+class RemoteSink:
+    """Stands in for the output sink in a worker process, handing rows to the single writer in the parent.
+
+    `on_written` callbacks still run once the parent has the rows on disk, on a thread of this process.
+    """
+
+    def __init__(self, worker_id, requests, acks):
+        self.worker_id = worker_id
+        self.requests = requests
+        self.acks = acks
+        self.sequence = itertools.count()
+        self.callbacks = {}
+        self.waiters = {}
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="remote-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, path, rows, fieldnames, overwrite=False, on_written=None):
+        if self.closed:
+            logging.warning(f"Output sink is closed, dropping {len(rows)} rows for {path}.")
+            return
+        sequence = next(self.sequence)
+        if on_written:
+            self.callbacks[sequence] = on_written
+        self.requests.put(("rows", self.worker_id, sequence, path, list(rows), fieldnames, overwrite, on_written is not None))
+
+    async def write_async(self, path, rows, fieldnames, overwrite=False, on_written=None):
+        # The queue to the parent is unbounded, handing rows over never blocks
+        self.write(path, rows, fieldnames, overwrite, on_written)
+
+    def flush(self):
+        """Block until the parent has everything this process queued so far on disk."""
+        if self.closed:
+            return
+        sequence = next(self.sequence)
+        done = self.waiters[sequence] = threading.Event()
+        self.requests.put(("flush", self.worker_id, sequence))
+        done.wait()
+
+    async def drain(self):
+        await asyncio.to_thread(self.flush)
+
+    def run(self):
+        while True:
+            message = self.acks.get()
+            if message is None:
+                return
+            kind, sequence = message
+            if kind == "flushed":
+                self.waiters.pop(sequence).set()
+                continue
+            try:
+                self.callbacks.pop(sequence)()
+            except Exception as e:
+                logging.error(f"Output sink callback failed: {e}")
+
+    def close(self):
+        if self.closed:
+            return
+        self.flush()
+        self.closed = True
+        self.acks.put(None)
+        self.thread.join()
+
+class SinkServer:
+    """Parent side of RemoteSink: writes the rows of every worker process through this process' output sink."""
+
+    def __init__(self, requests, acks):
+        self.requests = requests
+        self.acks = acks
+        self.thread = threading.Thread(target=self.run, name="sink-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        sink = get_sink()
+        while True:
+            message = self.requests.get()
+            if message is None:
+                return
+            kind, worker_id, sequence = message[:3]
+            if kind == "rows":
+                path, rows, fieldnames, overwrite, wants_ack = message[3:]
+                on_written = (lambda acks=self.acks[worker_id], sequence=sequence: acks.put(("written", sequence))) if wants_ack else None
+                sink.write(path, rows, fieldnames, overwrite, on_written)
+            else:
+                # Acknowledged after the "written" acks of everything before it, which the flush runs
+                sink.flush()
+                self.acks[worker_id].put(("flushed", sequence))
+
+    def stop(self):
+        self.requests.put(None)
+        self.thread.join()
+
+async def work_items(work):
+    """Yield the items handed to this worker process until the parent says there are no more."""
+    while True:
+        item = await asyncio.to_thread(work.get)
+        if item is None:
+            return
+        yield item
+
+def worker_main(worker_id, task, work, requests, acks, options):
+    """Entry point of a worker process: route output to the parent and run `task` on its share of the work."""
+    # Forced, importing the task's module under spawn already ran its own basicConfig without the worker id
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s - %(levelname)s - [worker {worker_id}] %(message)s", force=True)
+    use_sink(RemoteSink(worker_id, requests, acks))
+    open_sink()  # Held for the whole process, so tasks closing the sink do not stop it between items
+    # Each process exports its own metrics, next to the parent's file and told apart by a worker label
+    metrics.path = metrics.path.replace(".prom", f"-worker-{worker_id}.prom")
+    metrics.labels = {"worker": str(worker_id)}
+    try:
+        asyncio.run(task(worker_id, work_items(work), options))
+    finally:
+        close_sink()
+        metrics.report()
+
+class ShardedRun:
+    """Spreads work items over worker processes that each run `task` with browsers of their own.
+
+    `task(worker_id, items, options)` must be a module-level coroutine function. It reads its work
+    from the async iterator `items`; dedup keys are shared through the SQLite dedup index, which every
+    process opens. Output is written as usual; the rows travel to this process, where a single sink writes them.
+    """
+
+    def __init__(self, task, processes=WORKER_PROCESSES, options=None, name="shard"):
+        self.task = task
+        self.process_count = processes
+        self.options = options or {}
+        self.name = name
+        self.processes = []
+        self.submitted = 0
+
+    def start(self):
+        # Spawned rather than forked, Playwright's driver and event loop do not survive a fork
+        context = multiprocessing.get_context("spawn")
+        self.work = context.Queue()
+        self.requests = context.Queue()
+        self.acks = [context.Queue() for _ in range(self.process_count)]
+        self.server = SinkServer(self.requests, self.acks)
+        self.server.start()
+        self.processes = [
+            context.Process(
+                target=worker_main,
+                args=(worker_id, self.task, self.work, self.requests, self.acks[worker_id], self.options),
+                name=f"{self.name}-{worker_id}",
+            )
+            for worker_id in range(self.process_count)
+        ]
+        for process in self.processes:
+            process.start()
+        logging.info(f"[{self.name}] Started {self.process_count} worker processes.")
+
+    def submit(self, *item):
+        """Queue one work item; the first worker process to ask for work takes it."""
+        self.work.put(item)
+        self.submitted += 1
+        return True
+
+    def finish(self):
+        """Let the workers run out of work, wait for them and stop the shared services."""
+        for _ in self.processes:
+            self.work.put(None)
+        failed = 0
+        for process in self.processes:
+            process.join()
+            if process.exitcode:
+                failed += 1
+                logging.error(f"[{self.name}] Worker process {process.name} exited with code {process.exitcode}.")
+        self.server.stop()
+        stats = {"items": self.submitted, "failed_processes": failed}
+        logging.info(f"[{self.name}] Sharded run finished: {stats}")
+        return stats
+
+    async def close(self):
+        return await asyncio.to_thread(self.finish)
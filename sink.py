@@ -0,0 +1,348 @@
+import asyncio
+import atexit
+import csv
+import json
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from metrics import metrics
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Optional, only needed for Parquet output
+    pyarrow = None
+
+def csv_header(path):
+    """Column names of an existing CSV file, or None if it is missing or empty."""
+    try:
+        with open(path, newline="", encoding="utf-8") as file:
+            return next(csv.reader(file), None)
+    except FileNotFoundError:
+        return None
+
+def csv_path_for(path, fieldnames):
+    """Return `path`, or the first of `name-1.csv`, `name-2.csv`, ... that is new or has the same columns."""
+    stem, extension = os.path.splitext(path)
+    candidate, number = path, 0
+    while True:
+        header = csv_header(candidate)
+        if header is None or header == list(fieldnames):
+            break
+        number += 1
+        candidate = f"{stem}-{number}{extension}"
+    if candidate != path:
+        logging.warning(f"{path} has other columns than {list(fieldnames)}, appending to {candidate} instead.")
+    return candidate
+
+class CsvWriter:
+    """An open CSV file that stays open for the whole run.
+
+    Rows are never appended under the header of other columns: a file written with an older set of
+    columns is left alone and the rows go to a new numbered file next to it.
+    """
+
+    def __init__(self, path, fieldnames, overwrite=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not overwrite:
+            path = csv_path_for(path, fieldnames)
+        self.file = open(path, mode="w" if overwrite else "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, fieldnames=fieldnames)
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class JsonlWriter:
+    """An open JSON Lines file, one typed record per line."""
+
+    def __init__(self, path, fieldnames, overwrite=False):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(path, mode="w" if overwrite else "a", encoding="utf-8")
+
+    def write_rows(self, rows):
+        self.file.writelines(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+def next_free_path(path):
+    """Return `path`, or `name-1.ext`, `name-2.ext`, ... if it already exists."""
+    stem, extension = os.path.splitext(path)
+    candidate, number = path, 0
+    while os.path.exists(candidate):
+        number += 1
+        candidate = f"{stem}-{number}{extension}"
+    return candidate
+
+class ParquetWriter:
+    """A Parquet file written in row groups, typed by a {field name: Arrow type name} schema.
+
+    Parquet files cannot be appended to, so a run that finds the file already there writes
+    a new numbered part next to it. The file is only readable once it has been closed.
+    """
+
+    def __init__(self, path, fieldnames, overwrite=False, row_group_size=10_000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not overwrite:
+            path = next_free_path(path)
+        self.schema = pyarrow.schema([(name, getattr(pyarrow, type_name)()) for name, type_name in fieldnames.items()])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+        self.row_group_size = row_group_size
+        self.rows = []
+
+    def write_rows(self, rows):
+        self.rows.extend(rows)
+        while len(self.rows) >= self.row_group_size:
+            self.write_row_group(self.rows[:self.row_group_size])
+            self.rows = self.rows[self.row_group_size:]
+
+    def write_row_group(self, rows):
+        self.writer.write_table(pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def flush(self):
+        pass  # Rows are held back until they fill a row group
+
+    def close(self):
+        if self.rows:
+            self.write_row_group(self.rows)
+            self.rows = []
+        self.writer.close()
+
+# Output format picked from the destination's file extension
+WRITERS = {
+    ".csv": CsvWriter,
+    ".jsonl": JsonlWriter,
+    ".parquet": ParquetWriter,
+}
+
+# Seconds a coroutine waits for room in a full sink queue, doubling up to the maximum
+WRITE_BACKOFF_MIN = 0.005
+WRITE_BACKOFF_MAX = 0.2
+
+class OutputSink:
+    """Buffered output shared by a whole run. Rows are written to disk on a background writer thread.
+
+    Each destination keeps one open handle, with at most `max_open_files` open at once. Buffered rows
+    are flushed once `max_buffered_rows` pile up or `flush_interval` seconds pass. `on_written`
+    callbacks run on the writer thread after their rows have been flushed. The queue is bounded, so
+    producers wait instead of growing memory when the disk falls behind: threads block in `write`,
+    coroutines back off in `write_async` without holding up the event loop.
+    """
+
+    def __init__(self, max_buffered_rows=1000, flush_interval=2.0, max_pending=1000, max_open_files=64):
+        self.max_buffered_rows = max_buffered_rows
+        self.flush_interval = flush_interval
+        self.max_open_files = max_open_files
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.writers = OrderedDict()
+        self.opened_paths = set()
+        self.buffers = {}
+        self.buffered_rows = 0
+        self.stats = Counter()
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="output-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, path, rows, fieldnames, overwrite=False, on_written=None):
+        """Queue rows for `path`, blocking while the queue is full. With `overwrite`, the file is truncated
+        the first time this run opens it.
+
+        `fieldnames` is a list of column names, or a {name: type} schema for typed formats.
+        """
+        if self.closed:
+            logging.warning(f"Output sink is closed, dropping {len(rows)} rows for {path}.")
+            return
+        self.queue.put(("rows", path, list(rows), fieldnames, overwrite, on_written))
+
+    async def write_async(self, path, rows, fieldnames, overwrite=False, on_written=None):
+        """Queue rows like `write`, but sleep while the queue is full so the other tasks keep running."""
+        if self.closed:
+            logging.warning(f"Output sink is closed, dropping {len(rows)} rows for {path}.")
+            return
+        item = ("rows", path, list(rows), fieldnames, overwrite, on_written)
+        delay = WRITE_BACKOFF_MIN
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, WRITE_BACKOFF_MAX)
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        if self.closed:
+            return
+        done = threading.Event()
+        self.queue.put(("flush", done))
+        done.wait()
+
+    async def drain(self):
+        """Wait for everything queued so far to reach the disk without blocking the event loop."""
+        await asyncio.to_thread(self.flush)
+
+    def close(self):
+        """Flush every buffer, close every file and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(("close",))
+        self.thread.join()
+        logging.info(
+            f"Output sink: {self.stats['rows']} rows written in {self.stats['flushes']} flushes "
+            f"to {len(self.opened_paths)} files"
+        )
+
+    def run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, next_flush - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is not None and item[0] == "rows":
+                _, path, rows, fieldnames, overwrite, on_written = item
+                buffer = self.buffers.setdefault(path, [fieldnames, overwrite, [], []])
+                buffer[2].extend(rows)
+                self.buffered_rows += len(rows)
+                if on_written:
+                    buffer[3].append(on_written)
+            elif item is not None and item[0] == "flush":
+                self.flush_buffers()
+                next_flush = time.monotonic() + self.flush_interval
+                item[1].set()
+                continue
+            elif item is not None and item[0] == "close":
+                self.flush_buffers()
+                for writer in self.writers.values():
+                    writer.close()
+                self.writers.clear()
+                return
+
+            if self.buffered_rows >= self.max_buffered_rows or time.monotonic() >= next_flush:
+                self.flush_buffers()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def writer_for(self, path, fieldnames, overwrite):
+        if path in self.writers:
+            self.writers.move_to_end(path)
+            return self.writers[path]
+        if len(self.writers) >= self.max_open_files:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        writer_class = WRITERS[os.path.splitext(path)[1].lower()]
+        # Only truncate on the first open, reopening after an eviction must append
+        writer = writer_class(path, fieldnames, overwrite=overwrite and path not in self.opened_paths)
+        self.opened_paths.add(path)
+        self.writers[path] = writer
+        return writer
+
+    def flush_buffers(self):
+        buffers, self.buffers = self.buffers, {}
+        self.buffered_rows = 0
+        if buffers:
+            self.stats["flushes"] += 1
+
+        for path, (fieldnames, overwrite, rows, callbacks) in buffers.items():
+            output_format = os.path.splitext(path)[1].lower().lstrip(".")
+            try:
+                with metrics.timer("write", format=output_format):
+                    writer = self.writer_for(path, fieldnames, overwrite)
+                    writer.write_rows(rows)
+                    writer.flush()
+                self.stats["rows"] += len(rows)
+                metrics.count("rows_written", len(rows), format=output_format)
+            except Exception as e:
+                # Callbacks of rows that did not reach the disk are dropped, so their pages stay pending
+                logging.error(f"Failed to write {len(rows)} rows to {path}: {e}")
+                continue
+
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception as e:
+                    logging.error(f"Output sink callback failed: {e}")
+
+_sink = None
+_sink_holders = 0
+
+def exit_on_signal(signum, frame):
+    # Turn SIGTERM into a normal exit so the atexit flush still runs
+    raise SystemExit(128 + signum)
+
+def get_sink():
+    """Return the process-wide output sink, creating it on first use and flushing it at exit."""
+    global _sink
+    if _sink is None:
+        _sink = OutputSink()
+        atexit.register(_sink.close)
+        if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, exit_on_signal)
+    return _sink
+
+def use_sink(sink):
+    """Make `sink` the process-wide sink, for worker processes whose rows are written elsewhere."""
+    global _sink
+    _sink = sink
+
+def open_sink():
+    """Hold the process-wide sink for one scrape, so jobs running side by side share it until the last one ends."""
+    global _sink_holders
+    _sink_holders += 1
+    return get_sink()
+
+def close_sink():
+    """Release the process-wide sink. The last holder flushes and closes it; the next get_sink() starts a fresh one."""
+    global _sink, _sink_holders
+    _sink_holders = max(_sink_holders - 1, 0)
+    if _sink is not None and _sink_holders == 0:
+        _sink.close()
+        _sink = None
+
+def output_formats(*formats):
+    """Return the requested output formats that can be written here, dropping Parquet without pyarrow."""
+    if "parquet" in formats and pyarrow is None:
+        logging.info("pyarrow not installed, skipping Parquet output.")
+        formats = tuple(output_format for output_format in formats if output_format != "parquet")
+    return formats
+
+async def write_outputs(base_path, rows, formats, fieldnames, schema, normalize, overwrite=False, on_written=None):
+    """Queue rows to `base_path` plus the extension of each format.
+
+    CSV keeps the raw scraped strings, JSONL and Parquet get `normalize`d rows typed by `schema`.
+    `on_written` follows the first format, so that should be a durable one (CSV or JSONL).
+    """
+    sink = get_sink()
+    typed_rows = None
+    for index, output_format in enumerate(formats):
+        callback = on_written if index == 0 else None
+        path = f"{base_path}.{output_format}"
+        if output_format == "csv":
+            await sink.write_async(path, rows, fieldnames, overwrite, callback)
+        else:
+            if typed_rows is None:
+                typed_rows = [normalize(row) for row in rows]
+            await sink.write_async(path, typed_rows, schema, overwrite, callback)
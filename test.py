@@ -1,177 +1,194 @@
-from playwright.sync_api import sync_playwright
-import random
-import time
-import csv
-import os
+import asyncio
 import re
 import logging
+from urllib.parse import urljoin
+
+from amazon import (
+    BRAND_WORKERS, LAUNCH_OPTIONS, OUTPUT_FORMATS, brand_worker, finish_brand, finish_crawl, get_random_user_agent,
+    new_context, scrape_brand_products,
+)
+from blocking import get_blocker
+from cache import get_cache
+from checkpoint import open_checkpoint
+from dedup import open_dedup_index
+from engine import run_workers
+from http_fetch import create_fetcher
+from normalize import PRODUCT_SCHEMA, normalize_product
+from metrics import metrics
+from pacing import act_and_wait, goto, pacer, wait_for_selector
+from pool import BrowserPool
+from retry import SelectorMissingError, classify, get_retrier
+from sink import close_sink, get_sink, open_sink, write_outputs
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
+# Selectors of the category walk. Result pages are read with the fetching and saving helpers of amazon.py
 class Selectors:
     MAIN_CATEGORY_LINK = "a[href='/electronics/b/?ie=UTF8&node=976419031&ref_=nav_cs_electronics']"
     SUB_CATEGORY = "li#sobe_d_b_ms_7_1 a.sl-sobe-carousel-sub-card-link"
     ALL_BRANDS = "#sobe_d_b_ms_4-carousel-viewport .sl-sobe-carousel-viewport-row ol.sl-sobe-carousel-viewport-row-inner li.sl-sobe-carousel-sub-card a"
     BRAND_LINK = "a.sl-sobe-carousel-sub-card-link img[alt='HP']"
     ALL_ITEMS = ".s-main-slot .s-result-item"
-    NAME_OF_ITEM = "h2.a-size-mini span"
-    RATING_OF_ITEM = "span[aria-label*='out of 5 stars']"
-    PRICE_OF_ITEM = ".a-price .a-offscreen"
-    NEXT_BUTTON = ".s-pagination-next.s-pagination-button"
-
-def get_random_user_agent():
-    user_agents = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) Gecko/20100101 Firefox/89.0",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36",
-        "Mozilla/5.0 (Linux; Android 10; Pixel 3 XL) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Mobile Safari/537.36",
-    ]
-    return random.choice(user_agents)
-
-def extract_product_info(product):
-    name = product.query_selector(Selectors.NAME_OF_ITEM).inner_text() if product.query_selector(Selectors.NAME_OF_ITEM) else "No Name"
-    rating = product.query_selector(Selectors.RATING_OF_ITEM).get_attribute("aria-label") if product.query_selector(Selectors.RATING_OF_ITEM) else "No Rating"
-    price = product.query_selector(Selectors.PRICE_OF_ITEM).inner_text() if product.query_selector(Selectors.PRICE_OF_ITEM) else "No Price"
-    
-    # Exclude products with no price
-    if price == "No Price":
-        return None  # Skip this product
-    
-    return {
-        "name": name,
-        "rating": rating,
-        "price": price,
-    }
-
-def save_data_to_csv(products, category, subcategory,brand_name):
-    """Save scraped product data to a CSV file."""
-    directory = f"data/{category}/{subcategory}/{brand_name}"
-    os.makedirs(directory, exist_ok=True)
-    
-    csv_file = f"{directory}/products.csv"
-    with open(csv_file, mode="a", newline='', encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=["name", "rating", "price"])
-        if file.tell() == 0:
-            writer.writeheader()
-        writer.writerows(products)
-    logging.info(f"Data saved to {csv_file}")
-
-def extract_category_and_subcategory(page):
+
+# Completed brands and result pages, so an interrupted crawl can resume
+CHECKPOINT_PATH = "data/brand_crawl_state.sqlite"
+
+async def save_products(products, category, subcategory,brand_name, on_written=None):
+    """Queue scraped products for every output format; `on_written` runs once the CSV rows are on disk."""
+    await write_outputs(
+        f"data/{category}/{subcategory}/{brand_name}/products", products, OUTPUT_FORMATS,
+        ["asin", "name", "rating", "price"], PRODUCT_SCHEMA, normalize_product, on_written=on_written,
+    )
+
+def brand_saver(category, subcategory):
+    """Return a function giving the `save` of each brand, which writes its products to the brand's own folder."""
+    def save_for(brand_name):
+        async def save(products, on_written=None):
+            await save_products(products, category, subcategory, brand_name, on_written)
+        return save
+    return save_for
+
+async def extract_category_and_subcategory(page):
     """Extract the category and subcategory from the page."""
-    category_element = page.query_selector(Selectors.MAIN_CATEGORY_LINK)
-    category = category_element.inner_text() if category_element else "Unknown Category"
+    category_element = await page.query_selector(Selectors.MAIN_CATEGORY_LINK)
+    category = await category_element.inner_text() if category_element else "Unknown Category"
+
+    subcategory_element = await page.query_selector(Selectors.SUB_CATEGORY)
+    subcategory = await subcategory_element.inner_text() if subcategory_element else "Unknown Subcategory"
 
-    subcategory_element = page.query_selector(Selectors.SUB_CATEGORY)
-    subcategory = subcategory_element.inner_text() if subcategory_element else "Unknown Subcategory"
 
-    
     category = re.sub(r'\s+', ' ', category).strip()
     subcategory = re.sub(r'\s+', ' ', subcategory).strip()
-    
+
 
     return category, subcategory
 
-def navigate_to_category(page):
-    """Navigate to the main category."""
-    main_category = page.query_selector(Selectors.MAIN_CATEGORY_LINK)
+async def navigate_to_category(page, category_url=None):
+    """Navigate to the main category, or straight to `category_url` when given."""
+    if category_url:
+        await pacer.pause(category_url)
+        await goto(page, urljoin(page.url, category_url), timeout=60000)
+        await wait_for_selector(page, Selectors.SUB_CATEGORY, timeout=60000)
+        return
+
+    main_category = await page.query_selector(Selectors.MAIN_CATEGORY_LINK)
     if main_category:
-        main_category.click()
         logging.info("Navigating to main category")
-        time.sleep(random.uniform(2, 5))
+        await act_and_wait(page, main_category.click, selector=Selectors.SUB_CATEGORY, url_change=True)
+        await pacer.pause(page.url)
 
-def navigate_to_subcategory(page):
+async def navigate_to_subcategory(page):
     """Navigate to the subcategory."""
-    sub_category = page.query_selector(Selectors.SUB_CATEGORY)
+    sub_category = await page.query_selector(Selectors.SUB_CATEGORY)
     if sub_category:
-        sub_category.click()
         logging.info("Navigating to subcategory")
-        time.sleep(random.uniform(2, 5))
+        await act_and_wait(page, sub_category.click, selector=Selectors.ALL_BRANDS, url_change=True)
+        await pacer.pause(page.url)
         # Scroll a few times to load more products
         for _ in range(2):
-            page.evaluate("window.scrollBy(0, window.innerHeight);")
-            time.sleep(random.uniform(2, 4))
+            await page.evaluate("window.scrollBy(0, window.innerHeight);")
+            await pacer.pause(page.url, scale=0.5)
 
-def navigate_to_brand_page(page, brand_link):
+async def navigate_to_brand_page(page, brand_link):
     """Navigate to a specific brand's page."""
     try:
-        if brand_link.is_visible() and brand_link.is_enabled():
-            href = brand_link.get_attribute('href')
+        if await brand_link.is_visible() and await brand_link.is_enabled():
+            href = await brand_link.get_attribute('href')
             if href:
                 logging.info(f"Navigating to brand page: {href}")
-                brand_link.click()
-                time.sleep(random.uniform(5, 10))
+                await act_and_wait(page, brand_link.click, selector=Selectors.ALL_ITEMS, url_change=True)
+                await pacer.pause(page.url)
     except Exception as e:
         logging.error(f"Error navigating to brand page: {e}")
 
 
-def scrape_brand_products(page, category_name, subcategory_name, scraped_products,brand_name):
-    """Scrape all products for a specific brand's page."""
-    brand_products = []
-    while True:
-        product_elements = page.query_selector_all(Selectors.ALL_ITEMS)
-        if not product_elements:
-            logging.warning("No products found on this page.")
-            break
-
-        for product in product_elements:
-            product_info = extract_product_info(product)
-            
-            if product_info is None:
-                continue  # Skip products with no price
-
-            # Check for duplicates based on product name
-            if product_info["name"] in scraped_products:
-                logging.info(f"Duplicate product found: {product_info['name']}, skipping.")
-                continue
-            
-            brand_products.append(product_info)
-            scraped_products.add(product_info["name"])  # Add product name to set to avoid duplicates
-            logging.info(f"Scraped product: {product_info}")
-
-        # Save brand-specific data
-        save_data_to_csv(brand_products, category_name, subcategory_name,brand_name)
-        brand_products = []
-
-        # Check if there's a "Next" button for pagination
-        next_button = page.query_selector(Selectors.NEXT_BUTTON)
-        if next_button and next_button.is_enabled():
-            logging.info("Navigating to next page...")
-            next_button.click()
-            logging.info("Page loaded, scraping next page...")
-            time.sleep(random.uniform(3, 5))  
-        else:
-            logging.info("No more pages to navigate.")
-            break
-
-def go_back_to_brands_page(page, brand_listing_url):
-    """Navigate directly to the brand list page and wait for brand links to load."""
+async def go_back_to_brands_page(page, brand_listing_url):
+    """Navigate directly to the brand list page and wait for brand links to load. Returns False if it could not."""
     logging.info("Returning to the brand list after scraping products.")
     try:
         # Navigate directly to the brand listing page
         logging.info(f"Navigating back to the brand listing URL: {brand_listing_url}")
-        page.goto(brand_listing_url, timeout=60000)  # Go to the saved brand listing URL
-        
+        # Go to the saved brand listing URL
+        await get_retrier("amazon").run(brand_listing_url, lambda: goto(page, brand_listing_url, timeout=60000))
+
         # Wait for the brand links to load (page must be loaded fully before interacting with it)
-        page.wait_for_selector(Selectors.ALL_BRANDS, timeout=60000)
+        await wait_for_selector(page, Selectors.ALL_BRANDS, timeout=60000)
         logging.info("Successfully returned to the brand listing page.")
-    except TimeoutError:
-        logging.error("Timeout while navigating back to the brand listing page.")
+        return True
+    # The retrier has already retried what was worth retrying, the caller decides how to carry on
+    except Exception as e:
+        logging.error(f"Could not return to the brand listing page ({classify(e)}): {e}")
+        return False
+
+async def get_brand_name(brand_link, index):
+    """Get a brand name from the image alt text, the link text or the href."""
+    # Extract the brand name from the 'alt' attribute of the image inside the anchor tag
+    brand_img = await brand_link.query_selector("img")
+    brand_name = await brand_img.get_attribute("alt") if brand_img else None
+
+    # If alt attribute is missing or empty, fallback to using the inner text or href
+    if not brand_name:
+        brand_name = (await brand_link.inner_text()).strip()  # fallback to inner text
+    if not brand_name:
+        href = await brand_link.get_attribute("href")
+        brand_name = href.split('/')[-1] if href else f"Brand_{index+1}"
+    return brand_name
+
+async def collect_brands(page):
+    """Collect the name and absolute URL of every brand on the brand listing page."""
+    brands = []
+    seen_urls = set()
+    for index, brand_link in enumerate(await page.query_selector_all(Selectors.ALL_BRANDS)):
+        href = await brand_link.get_attribute("href")
+        if not href:
+            continue
+        brand_url = urljoin(page.url, href)
+        if brand_url in seen_urls:
+            continue
+        seen_urls.add(brand_url)
+        brands.append((await get_brand_name(brand_link, index), brand_url))
+    return brands
+
+async def scrape_all_brands_concurrently(page, pool, category_name, subcategory_name, scraped_products, workers=BRAND_WORKERS, fetcher=None, checkpoint=None):
+    """Collect the brand links once and spread them across the contexts of the browser pool.
+
+    Returns True when every brand has been completed.
+    """
+    await wait_for_selector(page, Selectors.ALL_BRANDS, timeout=60000)
+    brands = await collect_brands(page)
+    if not brands:
+        logging.error("No brand links found on the brand listing page.")
+        return False
+
+    logging.info(f"Found {len(brands)} brands, scraping them with {workers} workers.")
+
+    async def worker(worker_id, brand_queue):
+        await brand_worker(worker_id, pool, brand_queue, scraped_products, fetcher, checkpoint, brand_saver(category_name, subcategory_name))
+
+    await run_workers(brands, worker, workers)
+    return checkpoint is None or checkpoint.all_done("brand", [brand_url for _, brand_url in brands])
+
+async def scrape_all_brands(page, category_name, subcategory_name, scraped_products, workers=BRAND_WORKERS, fetcher=None, checkpoint=None, pool=None):
+    """Scrape products for all brands in the brand listing page. Returns True when every brand has been completed."""
+    if workers > 1 and pool:
+        return await scrape_all_brands_concurrently(page, pool, category_name, subcategory_name, scraped_products, workers, fetcher, checkpoint)
 
-def scrape_all_brands(page, category_name, subcategory_name, scraped_products):
-    """Scrape products for all brands in the brand listing page."""
     brand_listing_url = page.url
     logging.info(f"Brand Listing URL: {brand_listing_url}")
 
+    save_for = brand_saver(category_name, subcategory_name)
+
     # Track the index of the current brand being processed
     current_brand_index = 0
+    brand_urls = []
 
     while True:
-        # Navigate back to the brand listing page and re-fetch the brand links
-        page.goto(brand_listing_url, timeout=60000)
-        page.wait_for_selector(Selectors.ALL_BRANDS, timeout=60000)
-        
+        # Navigate back to the brand listing page (served from the page cache) and re-fetch the brand links
+        if not await go_back_to_brands_page(page, brand_listing_url):
+            break
+
         # Retrieve brand links after navigating back to the listing page
-        brand_links = page.query_selector_all(Selectors.ALL_BRANDS)
+        brand_links = await page.query_selector_all(Selectors.ALL_BRANDS)
         if not brand_links:
             logging.error("No brand links found on the brand listing page.")
             break
@@ -179,69 +196,115 @@ def scrape_all_brands(page, category_name, subcategory_name, scraped_products):
         # Iterate starting from the current brand index
         for i in range(current_brand_index, len(brand_links)):
             brand_link = brand_links[i]
-            try:
-                # Extract the brand name from the 'alt' attribute of the image inside the anchor tag
-                brand_img = brand_link.query_selector("img")
-                brand_name = brand_img.get_attribute("alt") if brand_img else None
-                
-                # If alt attribute is missing or empty, fallback to using the inner text or href
-                if not brand_name:
-                    brand_name = brand_link.inner_text().strip()  # fallback to inner text
-                if not brand_name:
-                    brand_name = brand_link.get_attribute("href").split('/')[-1] if brand_link.get_attribute("href") else f"Brand_{i+1}"
-
-                logging.info(f"Processing brand Name: {brand_name}")
-                logging.info(f"Navigating to brand page {i + 1}")
-                navigate_to_brand_page(page, brand_link)
-                scrape_brand_products(page, category_name, subcategory_name, scraped_products,brand_name)
+            brand_name = await get_brand_name(brand_link, i)
+            brand_url = urljoin(page.url, await brand_link.get_attribute("href") or "")
+            if brand_url not in brand_urls:
+                brand_urls.append(brand_url)
+            if checkpoint and checkpoint.is_done("brand", brand_url):
+                logging.info(f"Brand {brand_name} was completed by an earlier run, skipping.")
+                current_brand_index = i + 1
+                continue
 
-                # After scraping, increment the index and go back to the brand list
-                current_brand_index = i + 1  # Move to the next brand
-                go_back_to_brands_page(page, brand_listing_url)
-                break  # Break to re-fetch brand links with the updated page
+            attempts = 0
+
+            async def scrape_brand():
+                nonlocal attempts
+                attempts += 1
+                link = brand_link
+                if attempts > 1:
+                    # The failed attempt left the page elsewhere, so the brand is opened from the listing again
+                    await go_back_to_brands_page(page, brand_listing_url)
+                    links = await page.query_selector_all(Selectors.ALL_BRANDS)
+                    if i >= len(links):
+                        raise SelectorMissingError(f"Brand {i + 1} is missing from the brand listing")
+                    link = links[i]
+                logging.info(f"Navigating to brand page {i + 1}")
+                await navigate_to_brand_page(page, link)
+                await scrape_brand_products(page, scraped_products, checkpoint=checkpoint, brand_url=brand_url, save=save_for(brand_name))
 
+            logging.info(f"Processing brand Name: {brand_name}")
+            try:
+                await get_retrier("amazon").run(brand_url, scrape_brand)
+                if checkpoint:
+                    await finish_brand(checkpoint, brand_url)
             except Exception as e:
+                # Given up after its retries, the brand stays pending and the walk moves on to the next one
                 logging.error(f"An error occurred while processing brand {i + 1}: {e}")
-                continue  # Continue to the next brand in case of an error
+
+            # Move to the next brand whether it succeeded or not, so a failing brand can never stall the walk.
+            # The page is on a brand page now, so the loop goes back to the brand list for fresh links.
+            current_brand_index = i + 1
+            break
 
         # If we reach the end of the list, exit the loop
         if current_brand_index >= len(brand_links):
             logging.info("All brands have been processed.")
             break
 
+    return checkpoint is None or checkpoint.all_done("brand", brand_urls)
+
 
-def scrape_amazon_bestsellers(url):
-    """Main function to scrape Amazon bestsellers."""
-    # Set to track products already scraped (by name)
-    scraped_products = set()
+async def scrape_amazon_bestsellers(url, category_url=None, brand_workers=BRAND_WORKERS, use_http=True, checkpoint_path=CHECKPOINT_PATH, resume=True):
+    """Main function to scrape Amazon bestsellers. Returns False if the crawl stopped on an error.
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(args=['--start-maximized'], headless=False)
-        context = browser.new_context(user_agent=get_random_user_agent())
-        page = context.new_page()
+    An interrupted crawl is picked up again unless `resume` is off. Once a crawl completes its checkpoint is
+    cleared, so the next crawl walks the category again; products saved by earlier crawls stay deduplicated.
+    """
+    complete = False
+    open_sink()
+    checkpoint = open_checkpoint(checkpoint_path, resume) if checkpoint_path else None
+    # Products already scraped (by ASIN) into the brand folders of this category, including by earlier runs
+    scraped_products = open_dedup_index(f"amazon-brands:{category_url or url}")
+    fetcher = create_fetcher(get_random_user_agent(), get_cache()) if use_http else None
 
-        try:
-            page.goto(url, timeout=60000)  # Increased timeout
-            time.sleep(random.uniform(2, 5))
+    # One context for the category walk plus one per brand worker, all warmed up on the home page
+    pool = BrowserPool(new_context, brand_workers + 1, LAUNCH_OPTIONS, warm_url=url, name="amazon")
+    try:
+        await pool.start()
+        async with pool.lease() as page:
+            await goto(page, url, timeout=60000)  # Increased timeout
+            await pacer.pause(url)
 
             # Navigate to the category page
-            navigate_to_category(page)
+            await navigate_to_category(page, category_url)
 
             # Extract category and subcategory info
-            category_name, subcategory_name = extract_category_and_subcategory(page)
+            category_name, subcategory_name = await extract_category_and_subcategory(page)
             logging.info(f"Category Name: {category_name}, Subcategory Name: {subcategory_name}")
 
+            if checkpoint and checkpoint.is_done("subcategory", subcategory_name):
+                logging.info(f"Subcategory {subcategory_name} was completed by an earlier run, nothing to do.")
+                return True
+
             # Navigate to the subcategory page
-            navigate_to_subcategory(page)
+            await navigate_to_subcategory(page)
 
             # Scrape products from all brands
-            scrape_all_brands(page, category_name, subcategory_name, scraped_products)
+            complete = await scrape_all_brands(page, category_name, subcategory_name, scraped_products, brand_workers, fetcher, checkpoint, pool)
+            if checkpoint and complete:
+                checkpoint.mark_done("subcategory", subcategory_name)
 
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-        finally:
-            browser.close()
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return False
+    finally:
+        await pool.close()
+        if fetcher:
+            await fetcher.close()
+        # The sink records completed pages and dedup keys, so let it catch up first. Draining rather than
+        # relying on close_sink(), which leaves the sink open while a job scheduler still holds it.
+        await get_sink().drain()
+        close_sink()
+        if complete and checkpoint:
+            finish_crawl(checkpoint)
+        scraped_products.close()
+        if checkpoint:
+            checkpoint.close()
+        get_blocker("amazon").report()
+        get_cache().report()
+        metrics.report()
+    return True
 
 if __name__ == "__main__":
     url = "https://www.amazon.in"
-    scrape_amazon_bestsellers(url)
\ No newline at end of file
+    asyncio.run(scrape_amazon_bestsellers(url))
@@ -0,0 +1,27 @@
+import os
+import sys
+
+# The scrapers are flat modules in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import mock_site
+
+@pytest.fixture(scope="session")
+def fixtures_dir(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("fixtures"))
+    mock_site.generate_fixtures(directory)
+    return directory
+
+@pytest.fixture(scope="session")
+def amazon_site(fixtures_dir):
+    site = mock_site.MockSite("amazon", fixtures_dir).start()
+    yield site
+    site.stop()
+
+@pytest.fixture(scope="session")
+def olx_site(fixtures_dir):
+    site = mock_site.MockSite("olx", fixtures_dir).start()
+    yield site
+    site.stop()
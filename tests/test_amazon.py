@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager
+from urllib.parse import quote
+
+import pytest
+
+import amazon
+import mock_site
+import retry
+from checkpoint import open_checkpoint
+from dedup import open_dedup_index
+from engine import run_workers
+from http_fetch import HttpFetcher
+from pacing import pacer
+from retry import DeadLetterQueue
+from sink import OutputSink, use_sink
+
+def test_categories_have_namespaces_of_their_own():
+    url = "https://www.amazon.in"
+    assert amazon.dedup_namespace(url) != amazon.dedup_namespace(url, "/electronics/b/?node=976419031")
+    assert amazon.dedup_namespace(url, "/b/?node=1") == amazon.dedup_namespace(url, "/b/?node=1")
+
+def test_finished_crawl_keeps_its_dedup_keys(tmp_path):
+    checkpoint = open_checkpoint(str(tmp_path / "state.sqlite"))
+    checkpoint.mark_done("brand", "https://www.amazon.in/s?k=hp")
+    index = open_dedup_index("amazon:test", path=str(tmp_path / "dedup.sqlite"))
+    assert index.claim("B01")
+    index.commit(["B01"])
+
+    amazon.finish_crawl(checkpoint)
+    assert checkpoint.summary() == {}
+    index.close()
+    index = open_dedup_index("amazon:test", path=str(tmp_path / "dedup.sqlite"))
+    assert not index.claim("B01")
+    index.close()
+    checkpoint.close()
+
+class FakePool:
+    """Browser pool whose pages are never needed, the mock site's result pages all parse over HTTP."""
+
+    def __init__(self):
+        self.leases = 0
+
+    @asynccontextmanager
+    async def lease(self):
+        self.leases += 1
+        yield None
+
+def test_brand_workers_share_the_brands_and_their_products(amazon_site, tmp_path, monkeypatch):
+    pytest.importorskip("httpx")
+    pytest.importorskip("selectolax")
+    monkeypatch.setattr(pacer, "enabled", False)
+    dead_letters = DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+    monkeypatch.setattr(retry, "_dead_letters", dead_letters)
+    brand_urls = [f"{amazon_site.url}s?k={quote(f'Electronics brand {number}')}" for number in range(mock_site.AMAZON_BRANDS)]
+    saved = {}
+
+    def save_for(index):
+        async def save(products, on_written):
+            saved.setdefault(index, []).extend(products)
+            on_written()
+        return save
+
+    async def scenario():
+        pool, fetcher = FakePool(), HttpFetcher("test")
+        scraped_products = open_dedup_index("amazon:test", path=str(tmp_path / "dedup.sqlite"))
+
+        async def worker(worker_id, brand_queue):
+            await amazon.brand_worker(worker_id, pool, brand_queue, scraped_products, fetcher, save_for=save_for)
+
+        try:
+            await run_workers(enumerate(brand_urls), worker, 2)
+        finally:
+            await fetcher.close()
+            scraped_products.close()
+            dead_letters.close()
+        return pool.leases
+
+    assert asyncio.run(scenario()) == len(brand_urls)
+    assert sorted(saved) == list(range(len(brand_urls)))
+    asins = [product["asin"] for products in saved.values() for product in products]
+    # Products listed under several brands are only saved with the first
+    assert len(asins) == len(set(asins))
+    assert all(saved.values())
+
+class EmptyResultsPage:
+    """Results page of a brand without products: one page, nothing on it, no captcha."""
+
+    url = "https://www.amazon.in/s?k=empty"
+
+    async def evaluate(self, script, *args):
+        return 1
+
+    async def eval_on_selector_all(self, selector, script, fields):
+        return []
+
+    async def query_selector(self, selector):
+        return None
+
+def test_brand_without_products_is_finished(tmp_path, monkeypatch):
+    monkeypatch.setattr(pacer, "enabled", False)
+    checkpoint = open_checkpoint(str(tmp_path / "state.sqlite"))
+    sink = OutputSink()
+    use_sink(sink)
+    brand_url = EmptyResultsPage.url
+
+    async def scenario():
+        await amazon.scrape_brand_products(EmptyResultsPage(), set(), checkpoint=checkpoint, brand_url=brand_url)
+        await amazon.finish_brand(checkpoint, brand_url)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        use_sink(None)
+        sink.close()
+    assert checkpoint.get_page_count(brand_url) == 1
+    assert checkpoint.is_done("brand", brand_url)
+    checkpoint.close()
@@ -0,0 +1,101 @@
+import asyncio
+import re
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from urllib.parse import urljoin
+
+from archive import ArchivePipeline, safe_filename, with_base_url
+from blocking import get_blocker
+from olx import new_pdf_context
+
+URL = "https://www.olx.com.pk/item/iphone-15-iid-42"
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def fallback(self):
+        self.outcome = "loaded"
+
+class FakeContext:
+    """Browser context whose pages request the images of the HTML they are given through its routes."""
+
+    def __init__(self):
+        self.handlers = []
+        self.requests = {}
+
+    async def route(self, pattern, handler):
+        self.handlers.append(handler)
+
+    def on(self, event, handler):
+        pass
+
+    async def new_page(self):
+        return FakePage(self)
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+
+    async def set_content(self, page_html):
+        base = re.search(r'<base href="([^"]+)"', page_html).group(1)
+        for src in re.findall(r'<img src="([^"]+)"', page_html):
+            route = FakeRoute(urljoin(base, src), "image")
+            for handler in reversed(self.context.handlers):
+                await handler(route)
+                if route.outcome == "aborted":
+                    break
+            self.context.requests[route.request.url] = route.outcome
+
+    async def pdf(self, path):
+        with open(path, "wb") as file:
+            file.write(b"%PDF")
+
+class FakeBrowser:
+    async def new_context(self, **options):
+        return FakeContext()
+
+class FakePool:
+    def __init__(self, page):
+        self.page = page
+
+    @asynccontextmanager
+    async def lease(self):
+        yield self.page
+
+def test_base_goes_first_in_head():
+    saved = '<html><head lang="en"><base href="/other/"><link href="style.css"></head></html>'
+    assert with_base_url(saved, URL) == (
+        f'<html><head lang="en"><base href="{URL}"><base href="/other/"><link href="style.css"></head></html>'
+    )
+
+def test_base_without_head():
+    assert with_base_url("<p>ad</p>", URL) == f'<base href="{URL}"><p>ad</p>'
+
+def test_base_url_is_escaped():
+    assert 'href="https://x/?a=1&amp;b=&quot;2&quot;"' in with_base_url("<head></head>", 'https://x/?a=1&b="2"')
+
+def test_header_is_not_head():
+    assert with_base_url("<header>x</header>", URL).startswith("<base")
+
+def test_safe_filename():
+    assert safe_filename('iPhone 15: "Pro" / Max?') == "iPhone 15 Pro  Max"
+
+def test_archived_ads_are_printed_with_their_images(tmp_path):
+    async def scenario():
+        context = await new_pdf_context(FakeBrowser())
+        page = await context.new_page()
+        (tmp_path / "ad.html").write_text('<html><head></head><body><img src="/images/42.jpg"></body></html>')
+        archive = ArchivePipeline(None, str(tmp_path), pdf_mode="deferred", pdf_pool=FakePool(page))
+        archive.pdf_queue.put_nowait((URL, str(tmp_path / "ad.html"), str(tmp_path / "ad.pdf")))
+        return context, await archive.close()
+
+    context, stats = asyncio.run(scenario())
+    assert stats["pdfs"] == 1
+    assert context.requests == {"https://www.olx.com.pk/images/42.jpg": "loaded"}
+    # The listing browser drops the same image
+    assert get_blocker("olx").should_block("https://www.olx.com.pk/images/42.jpg", "image")
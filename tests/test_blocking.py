@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from blocking import SITE_PROFILES, TYPICAL_SIZES, ResourceBlocker
+
+class FakeRoute:
+    def __init__(self, url, resource_type):
+        self.request = SimpleNamespace(url=url, resource_type=resource_type)
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def fallback(self):
+        self.outcome = "sent"
+
+def route(blocker, url, resource_type):
+    request = FakeRoute(url, resource_type)
+    asyncio.run(blocker.handle_route(request))
+    return request.outcome
+
+def response(url, resource_type, length):
+    return SimpleNamespace(headers={"content-length": str(length)}, request=SimpleNamespace(url=url, resource_type=resource_type))
+
+def test_heavy_resources_and_trackers_are_blocked():
+    blocker = ResourceBlocker("amazon", **SITE_PROFILES["amazon"])
+    assert route(blocker, "https://m.media-amazon.com/images/I/1.jpg", "image") == "aborted"
+    assert route(blocker, "https://aax-eu.amazon-adsystem.com/e/dtb/bid", "script") == "aborted"
+    assert route(blocker, "https://www.amazon.in/s?k=hp", "document") == "sent"
+    assert route(blocker, "https://www.amazon.in/api/results", "xhr") == "sent"
+    assert blocker.blocked == {"image": 1, "script": 1}
+    assert blocker.allowed == {"document": 1, "xhr": 1}
+
+def test_allow_patterns_win():
+    blocker = ResourceBlocker("olx", resource_types={"image"}, url_patterns=[r"\.jpg$"], allow_patterns=[r"/logo\."])
+    assert route(blocker, "https://www.olx.com.pk/logo.jpg", "image") == "sent"
+    assert route(blocker, "https://www.olx.com.pk/ad.jpg", "image") == "aborted"
+
+def test_savings_are_estimated_from_observed_sizes():
+    blocker = ResourceBlocker("youtube", **SITE_PROFILES["youtube"])
+    route(blocker, "https://i.ytimg.com/a.jpg", "image")
+    assert blocker.bytes_saved == TYPICAL_SIZES["image"]
+
+    blocker.record_response(response("https://www.youtube.com/", "image", 1_000))
+    blocker.record_response(response("https://www.youtube.com/", "image", 3_000))
+    route(blocker, "https://i.ytimg.com/b.jpg", "image")
+    assert blocker.bytes_saved == TYPICAL_SIZES["image"] + 2_000
+
+    stats = blocker.report()
+    assert stats["blocked_requests"] == 2
+    assert stats["bytes_downloaded"] == 4_000
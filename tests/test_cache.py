@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from cache import CACHE_RULES, PageCache
+from pacing import Pacer
+
+URL = "https://www.amazon.in/s?k=phones"
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"), rules=[(r"^https://www\.amazon\.in/s\?", 3600)])
+    yield cache
+    cache.close()
+
+def test_store_and_lookup(cache):
+    assert cache.lookup(URL) is None
+    cache.store(URL, 200, {"ETag": '"v1"', "Content-Length": "5"}, b"<html>phones</html>")
+    entry = cache.lookup(URL)
+    assert entry["fresh"] and entry["status"] == 200
+    assert entry["headers"]["etag"] == '"v1"' and "content-length" not in entry["headers"]
+    assert cache.load_body(entry) == b"<html>phones</html>"
+    assert cache.revalidation_headers(entry) == {"If-None-Match": '"v1"'}
+
+@pytest.mark.parametrize("url, ttl", [
+    ("https://www.olx.com.pk/items/q-iphone", 600),
+    ("https://www.olx.com.pk/lahore_g4060673/q-iphone?page=2", 600),
+    ("https://www.olx.com.pk/johar-town_g5001/q-iphone-15", 600),
+    ("https://www.olx.com.pk/item/iphone-15-iid-42", None),
+    ("https://www.amazon.in/s?k=phones", 3600),
+])
+def test_listing_rules(tmp_path, url, ttl):
+    cache = PageCache(str(tmp_path / "cache"), rules=CACHE_RULES)
+    assert cache.ttl_for(url) == ttl
+    cache.close()
+
+def test_uncacheable_responses_are_ignored(cache):
+    cache.store("https://www.amazon.in/dp/B0", 200, {}, b"<html>product</html>")
+    cache.store(URL, 503, {}, b"<html>unavailable</html>")
+    assert cache.lookup("https://www.amazon.in/dp/B0") is None
+    assert cache.lookup(URL) is None
+
+def test_expired_entries_are_refreshed(cache):
+    cache.store(URL, 200, {}, b"<html>phones</html>")
+    cache.connection.execute("UPDATE entries SET expires_at = 0")
+    assert not cache.lookup(URL)["fresh"]
+    cache.refresh(URL)
+    assert cache.lookup(URL)["fresh"]
+
+def test_eviction_keeps_shared_bodies(tmp_path):
+    cache = PageCache(str(tmp_path / "cache"), rules=[(r"^https://", 3600)], max_bytes=25)
+    cache.store("https://a/1", 200, {}, b"x" * 10)
+    cache.store("https://a/2", 200, {}, b"x" * 10)  # Same body as /1
+    cache.store("https://a/3", 200, {}, b"y" * 20)
+    assert cache.lookup("https://a/3") is not None
+    assert cache.lookup("https://a/1") is None and cache.lookup("https://a/2") is None
+    cache.close()
+
+class FakeRequest:
+    resource_type = "document"
+    method = "GET"
+    headers = {}
+
+    def __init__(self, url, page):
+        self.url = url
+        self.frame = type("Frame", (), {"page": page})()
+
+class FakeResponse:
+    status = 200
+    headers = {}
+
+    async def body(self):
+        return b"<html>phones</html>"
+
+class FakeRoute:
+    def __init__(self, request, pacer):
+        self.request = request
+        self.pacer = pacer
+        self.slots_in_use = None
+        self.fulfilled = None
+
+    async def fetch(self, **kwargs):
+        limiter = self.pacer.limiter("amazon.in")
+        self.slots_in_use = limiter.in_flight
+        return FakeResponse()
+
+    async def fulfill(self, **kwargs):
+        self.fulfilled = kwargs
+
+def test_cache_misses_take_a_request_slot_unless_a_goto_holds_one(cache, monkeypatch):
+    pacer = Pacer()
+    monkeypatch.setattr("cache.pacer", pacer)
+    page = object()
+
+    async def main():
+        # A click-started navigation takes a slot of its own
+        route = FakeRoute(FakeRequest(URL, page), pacer)
+        await cache.handle_route(route)
+        assert route.slots_in_use == 1
+        assert route.fulfilled["body"] == b"<html>phones</html>"
+
+        # A goto's navigation is already covered by the goto's slot
+        cache.delete(URL)
+        async with pacer.request(URL, page):
+            route = FakeRoute(FakeRequest(URL, page), pacer)
+            await cache.handle_route(route)
+        assert route.slots_in_use == 1
+
+    asyncio.run(main())
+    assert cache.stats["misses"] == 2
@@ -0,0 +1,47 @@
+from capture import ResponseCapture, find_key, json_body
+
+REQUEST = {"url": "https://example.com/api/search?page=1", "method": "GET", "headers": {}, "post_data": None}
+
+def decode(payload):
+    return payload.get("items", []), payload.get("more")
+
+def test_find_key_at_any_depth_in_document_order():
+    payload = {"a": [{"hits": 1}, {"b": {"hits": 2}}], "hits": 3}
+    assert sorted(find_key(payload, "hits")) == [1, 2, 3]
+    assert list(find_key({"a": [{"hits": 1}, {"hits": 2}]}, "hits")) == [1, 2]
+    assert list(find_key([], "hits")) == []
+
+def test_json_body():
+    assert json_body({"post_data": '{"context": {}}'}) == {"context": {}}
+    assert json_body({"post_data": None}) is None
+    assert json_body({"post_data": "not json"}) is None
+
+def test_records_are_collected_until_taken():
+    capture = ResponseCapture("api/search", decode, next_request=lambda request, payload: request)
+    capture.handle_payload(REQUEST, {"items": [1, 2], "more": True})
+    capture.handle_payload(REQUEST, {"items": [3], "more": True})
+    assert capture.take() == [1, 2, 3]
+    assert capture.take() == []
+    assert capture.responses == 2
+    assert capture.can_fetch_next()
+
+def test_last_page_stops_direct_fetching():
+    capture = ResponseCapture("api/search", decode, next_request=lambda request, payload: request)
+    capture.handle_payload(REQUEST, {"items": [1], "more": False})
+    assert capture.exhausted
+    assert not capture.can_fetch_next()
+
+def test_payloads_without_results_or_undecodable_are_ignored():
+    def broken(payload):
+        raise KeyError("items")
+
+    capture = ResponseCapture("api/search", decode)
+    capture.handle_payload(REQUEST, {"other": True})
+    assert capture.responses == 0 and capture.last_request is None
+    capture.decode = broken
+    capture.handle_payload(REQUEST, {"items": [1]})
+    assert capture.take() == []
+    # Without a way to build the next request, later pages are left to the browser
+    capture.decode = decode
+    capture.handle_payload(REQUEST, {"items": [1], "more": True})
+    assert not capture.can_fetch_next()
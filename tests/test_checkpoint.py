@@ -0,0 +1,35 @@
+from checkpoint import open_checkpoint
+
+def test_resume_by_default(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    checkpoint = open_checkpoint(path)
+    checkpoint.mark_done("brand", "https://example.com/s?k=a")
+    checkpoint.close()
+
+    checkpoint = open_checkpoint(path)
+    assert checkpoint.is_done("brand", "https://example.com/s?k=a")
+    checkpoint.close()
+
+def test_start_over_without_resume(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    checkpoint = open_checkpoint(path)
+    checkpoint.mark_done("brand", "https://example.com/s?k=a")
+    checkpoint.set_page_count("https://example.com/s?k=a", 3)
+    checkpoint.close()
+
+    checkpoint = open_checkpoint(path, resume=False)
+    assert not checkpoint.is_done("brand", "https://example.com/s?k=a")
+    assert checkpoint.get_page_count("https://example.com/s?k=a") is None
+    checkpoint.close()
+
+def test_resume_keeps_progress(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    checkpoint = open_checkpoint(path)
+    checkpoint.complete_page("https://example.com/s?k=a&page=1")
+    checkpoint.close()
+
+    checkpoint = open_checkpoint(path)
+    assert checkpoint.is_done("page", "https://example.com/s?k=a&page=1")
+    checkpoint.reset()
+    assert checkpoint.summary() == {}
+    checkpoint.close()
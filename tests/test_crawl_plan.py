@@ -0,0 +1,49 @@
+import json
+import time
+
+import crawl_plan
+from crawl_plan import (
+    category_node, load_plan, new_plan, plan_brand_urls, plan_path, resolve_brand_url, save_plan, strip_tracking,
+)
+
+PAGE_URL = "https://www.amazon.in/electronics/b/?node=976419031"
+
+def test_strip_tracking_keeps_the_search():
+    url = "https://www.amazon.in/s?k=hp&ref=sr_pg_1&pf_rd_r=X&qid=123&rh=n%3A976419031#top"
+    assert strip_tracking(url) == "https://www.amazon.in/s?k=hp&rh=n%3A976419031"
+
+def test_search_links_are_kept():
+    assert resolve_brand_url(PAGE_URL, "/s?k=HP&ref_=abc", "HP") == "https://www.amazon.in/s?k=HP"
+
+def test_store_links_become_searches_within_the_category():
+    url = resolve_brand_url(PAGE_URL, "/stores/HP/page/123", "HP Laptops", category_node(PAGE_URL))
+    assert url == "https://www.amazon.in/s?k=HP+Laptops&rh=n%3A976419031"
+    # Without a name there is nothing to search for, so the link is followed as it is
+    assert resolve_brand_url(PAGE_URL, "/stores/HP/page/123?ref=x") == "https://www.amazon.in/stores/HP/page/123"
+
+def test_plan_brand_urls_in_crawl_order_without_repeats():
+    plan = new_plan(PAGE_URL, None, [
+        {"url": "https://www.amazon.in/a", "brands": ["https://www.amazon.in/s?k=1", "https://www.amazon.in/s?k=2"]},
+        {"url": "https://www.amazon.in/b", "brands": ["https://www.amazon.in/s?k=2", "https://www.amazon.in/s?k=3"]},
+    ])
+    assert plan_brand_urls(plan) == [f"https://www.amazon.in/s?k={number}" for number in (1, 2, 3)]
+
+def test_plans_are_named_after_site_and_category(tmp_path):
+    path = plan_path("https://www.amazon.in", None, str(tmp_path))
+    assert path.startswith(str(tmp_path / "www.amazon.in-"))
+    assert path != plan_path("https://www.amazon.in", PAGE_URL, str(tmp_path))
+
+def test_saved_plans_load_until_they_expire(tmp_path):
+    path = str(tmp_path / "plan.json")
+    plan = new_plan(PAGE_URL, None, [{"url": PAGE_URL, "brands": ["https://www.amazon.in/s?k=1"]}])
+    save_plan(path, plan)
+    assert load_plan(path) == plan
+    assert load_plan(path, ttl=-1) is None
+    assert load_plan(str(tmp_path / "missing.json")) is None
+
+def test_plans_of_other_versions_or_unreadable_are_discovered_again(tmp_path):
+    path = tmp_path / "plan.json"
+    path.write_text(json.dumps({"version": crawl_plan.PLAN_VERSION + 1, "created": time.time(), "nodes": []}))
+    assert load_plan(str(path)) is None
+    path.write_text("{not json")
+    assert load_plan(str(path)) is None
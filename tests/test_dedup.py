@@ -0,0 +1,88 @@
+import sqlite3
+
+from dedup import BloomFilter, DedupIndex, key_hash, open_dedup_index
+
+def test_bloom_filter_is_sized_from_its_capacity():
+    small, large = BloomFilter(1_000), BloomFilter(1_000_000)
+    assert len(large.bits) > len(small.bits) * 500
+    small.add(key_hash("a"))
+    assert key_hash("a") in small
+    assert sum(key_hash(n) in small for n in range(1000, 2000)) < 50
+
+def test_claims_are_shared_by_indexes_of_one_namespace(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    first, second = DedupIndex(path, "amazon"), DedupIndex(path, "amazon")
+    other = DedupIndex(path, "olx")
+    assert first.claim("B01")
+    assert not second.claim("B01")
+    assert other.claim("B01")
+    assert "B01" in second
+
+    first.commit(["B01"])
+    assert not second.claim("B01")
+    assert "B01" in second
+    for index in (first, second, other):
+        index.close()
+
+def test_keys_committed_elsewhere_are_seen_despite_the_bloom_filter(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    reader, writer = DedupIndex(path, "amazon"), DedupIndex(path, "amazon")
+    assert not reader.stored(key_hash("B01"))  # Builds the filter while the key is not there yet
+    assert writer.claim("B01")
+    writer.commit(["B01"])
+    assert not reader.claim("B01")
+    assert reader.stored(key_hash("B01"))
+    reader.close()
+    writer.close()
+
+def test_close_releases_claims_that_were_never_committed(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    index = DedupIndex(path, "amazon")
+    assert index.claim("B01") and index.claim("B02")
+    index.commit(["B01"])
+    index.close()
+
+    index = DedupIndex(path, "amazon")
+    assert not index.claim("B01")
+    assert index.claim("B02")
+    index.close()
+
+def test_recover_releases_claims_of_dead_processes_only(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    index = DedupIndex(path, "amazon")
+    assert index.claim("mine")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            "INSERT INTO claims (namespace, hash, owner) VALUES (?, ?, ?)", ("amazon", key_hash("dead"), "another-process")
+        )
+    connection.close()
+
+    recovered = open_dedup_index("amazon", path=path)
+    assert recovered.claim("dead")
+    assert not recovered.claim("mine")
+    recovered.close()
+    index.close()
+
+def test_full_bloom_filter_is_rebuilt_bigger(tmp_path):
+    index = DedupIndex(str(tmp_path / "dedup.sqlite"), "amazon", capacity=10)
+    keys = [f"B{n}" for n in range(25)]
+    for key in keys:
+        assert index.claim(key)
+    index.commit(keys)
+    assert index.bloom is None
+    assert all(not index.claim(key) for key in keys)
+    assert index.bloom.capacity >= 50
+    index.close()
+
+def test_reset_forgets_keys_and_claims(tmp_path):
+    path = str(tmp_path / "dedup.sqlite")
+    index = open_dedup_index("amazon", path=path)
+    index.claim("B01")
+    index.commit(["B01"])
+    index.claim("B02")
+    index.close()
+
+    index = open_dedup_index("amazon", reset=True, path=path)
+    assert index.claim("B01") and index.claim("B02")
+    index.close()
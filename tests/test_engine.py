@@ -0,0 +1,51 @@
+import asyncio
+
+from engine import gather_limited, run_all, run_workers
+
+def test_gather_limited_keeps_the_limit_and_the_input_order():
+    running = []
+    peak = []
+
+    async def task(number):
+        running.append(number)
+        peak.append(len(running))
+        await asyncio.sleep(0.01 * (5 - number))
+        running.remove(number)
+        if number == 3:
+            raise ValueError("broken page")
+        return number
+
+    results = asyncio.run(gather_limited([task(number) for number in range(5)], 2))
+    assert max(peak) == 2
+    assert results[:3] == [0, 1, 2] and results[4] == 4
+    assert isinstance(results[3], ValueError)
+
+def test_run_workers_share_one_queue():
+    done = {}
+
+    async def worker(worker_id, item_queue):
+        while not item_queue.empty():
+            item = item_queue.get_nowait()
+            await asyncio.sleep(0)
+            done[item] = worker_id
+
+    results = asyncio.run(run_workers(range(10), worker, 4))
+    assert len(results) == 4
+    assert sorted(done) == list(range(10))
+    assert set(done.values()) == {0, 1, 2, 3}
+    # No more workers than items
+    assert len(asyncio.run(run_workers(range(2), worker, 4))) == 2
+
+def test_run_all_interleaves_entry_points_on_one_loop():
+    ready = asyncio.Event()
+
+    async def first():
+        ready.set()
+        return "first"
+
+    async def second():
+        # Only finishes if the first entry point runs while this one waits
+        await asyncio.wait_for(ready.wait(), 1)
+        return "second"
+
+    assert run_all(second(), first()) == ["second", "first"]
@@ -0,0 +1,107 @@
+import asyncio
+from collections import Counter
+
+import jobs
+import sink
+from jobs import JobQueue, Scheduler
+from sink import OutputSink, close_sink, open_sink
+
+def stub_sites(monkeypatch, run):
+    monkeypatch.setattr(jobs, "SITES", {site: (run, fields) for site, (_, fields) in jobs.SITES.items()})
+    monkeypatch.setattr(jobs, "POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(jobs, "RETRY_DELAY", 0)
+
+def test_jobs_run_within_the_overall_and_site_limits(tmp_path, monkeypatch):
+    running, peak = Counter(), Counter()
+
+    async def run(job):
+        running[job["site"]] += 1
+        peak[job["site"]] = max(peak[job["site"]], running[job["site"]])
+        peak["all"] = max(peak["all"], sum(running.values()))
+        await asyncio.sleep(0.02)
+        running[job["site"]] -= 1
+        return True
+
+    stub_sites(monkeypatch, run)
+    monkeypatch.setattr(jobs.metrics, "path", str(tmp_path / "metrics.prom"))
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    for number in range(4):
+        job_queue.add("olx", f"phone {number}", "Lahore")
+        job_queue.add("amazon", category=f"/b/?node={number}")
+        job_queue.add("youtube", f"cooking {number}")
+
+    stats = asyncio.run(Scheduler(job_queue, max_jobs=4, site_limits={"youtube": 1}).run())
+    assert stats == {"done": 12}
+    assert peak["amazon"] == jobs.SITE_LIMITS["amazon"]
+    assert peak["olx"] == jobs.SITE_LIMITS["olx"]
+    assert peak["youtube"] == 1
+    assert peak["all"] <= 4
+    assert job_queue.summary() == {"done": 12}
+    job_queue.close()
+
+def test_higher_priority_jobs_start_first(tmp_path, monkeypatch):
+    order = []
+
+    async def run(job):
+        order.append(job["query"])
+        return True
+
+    stub_sites(monkeypatch, run)
+    monkeypatch.setattr(jobs.metrics, "path", str(tmp_path / "metrics.prom"))
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_queue.add("youtube", "later")
+    job_queue.add("youtube", "first", priority=5)
+    asyncio.run(Scheduler(job_queue, site_limits={"youtube": 1}).run())
+    assert order == ["first", "later"]
+    job_queue.close()
+
+def test_failed_jobs_are_retried_until_they_run_out_of_attempts(tmp_path, monkeypatch):
+    attempts = Counter()
+
+    async def run(job):
+        attempts[job["query"]] += 1
+        if job["query"] == "broken":
+            raise RuntimeError("page crashed")
+        # Fails once, then works
+        return attempts[job["query"]] > 1
+
+    stub_sites(monkeypatch, run)
+    monkeypatch.setattr(jobs.metrics, "path", str(tmp_path / "metrics.prom"))
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_queue.add("youtube", "flaky")
+    job_queue.add("youtube", "broken", max_attempts=2)
+
+    stats = asyncio.run(Scheduler(job_queue).run())
+    assert stats == {"retried": 2, "done": 1, "failed": 1}
+    assert attempts == {"flaky": 2, "broken": 2}
+    [failed] = job_queue.jobs("failed")
+    assert failed["last_error"] == "RuntimeError: page crashed"
+    job_queue.close()
+
+def test_jobs_missing_a_field_or_queued_twice_are_refused(tmp_path):
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    assert not job_queue.add("olx", "phone")
+    assert not job_queue.add("ebay", "phone")
+    assert job_queue.add("olx", "phone", "Lahore")
+    assert not job_queue.add("olx", "phone", "Lahore")
+    job_queue.close()
+
+def test_jobs_share_the_sink_until_the_scheduler_ends(tmp_path, monkeypatch):
+    sinks = []
+
+    async def run(job):
+        # Like the scrapers, each job holds the sink while it runs
+        sinks.append(open_sink())
+        close_sink()
+        return True
+
+    stub_sites(monkeypatch, run)
+    monkeypatch.setattr(jobs.metrics, "path", str(tmp_path / "metrics.prom"))
+    monkeypatch.setattr(sink, "_sink", OutputSink())
+    job_queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_queue.add("youtube", "first")
+    job_queue.add("youtube", "second")
+    asyncio.run(Scheduler(job_queue, site_limits={"youtube": 1}).run())
+    assert sinks[0] is sinks[1]
+    assert sinks[0].closed and sink._sink is None
+    job_queue.close()
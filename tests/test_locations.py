@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+import locations
+import mock_site
+from locations import LocationCache, location_slug_from_url
+from olx import Selectors, open_location_search, search_olx
+from pacing import pacer
+
+LAHORE = f"lahore_g{mock_site.OLX_LOCATIONS['Lahore']}"
+
+class FakePage:
+    """Loads pages from the mock site over plain HTTP and remembers where it went."""
+
+    def __init__(self):
+        self.url = "about:blank"
+        self.content = ""
+        self.visited = []
+
+    async def goto(self, url, **kwargs):
+        def load():
+            try:
+                with urlopen(url) as response:
+                    return response.status, response.read().decode()
+            except HTTPError as e:
+                return e.code, ""
+
+        self.visited.append(url)
+        status, self.content = await asyncio.to_thread(load)
+        self.url = url
+        return SimpleNamespace(status=status, ok=status < 400)
+
+    async def wait_for_selector(self, selector, **kwargs):
+        if selector != Selectors.ALL_ADS or "_68441e28" not in self.content:
+            raise TimeoutError(selector)
+
+@pytest.fixture
+def location_cache(tmp_path, monkeypatch):
+    cache = LocationCache(str(tmp_path / "locations.sqlite"))
+    monkeypatch.setattr(locations, "_locations", cache)
+    monkeypatch.setattr(pacer, "enabled", False)
+    yield cache
+    cache.close()
+
+def test_location_slug_from_url():
+    assert location_slug_from_url(f"https://www.olx.com.pk/{LAHORE}/q-iphone?page=2") == LAHORE
+    assert location_slug_from_url(f"https://www.olx.com.pk/{LAHORE}") == LAHORE
+    assert location_slug_from_url("https://www.olx.com.pk/items/q-iphone") is None
+
+def test_resolved_locations_expire_and_can_be_forgotten(tmp_path):
+    cache = LocationCache(str(tmp_path / "locations.sqlite"))
+    cache.store("Johar Town,  Lahore", "Johar Town, Lahore, Pakistan", "johar-town_g1")
+    assert cache.lookup("johar town, lahore") == {"label": "Johar Town, Lahore, Pakistan", "slug": "johar-town_g1"}
+    cache.ttl = -1
+    assert cache.lookup("Johar Town, Lahore") is None
+    cache.ttl = 3600
+    cache.forget("Johar Town, Lahore")
+    assert cache.lookup("Johar Town, Lahore") is None
+    cache.close()
+
+def test_cached_location_opens_its_listing_directly(olx_site, location_cache):
+    location_cache.store("Lahore", "Lahore, Pakistan", LAHORE)
+    page = FakePage()
+    assert asyncio.run(search_olx(page, olx_site.url, mock_site.OLX_QUERY, "Lahore"))
+    # Straight to the listing, the home page and its suggestions are never loaded
+    assert page.visited == [olx_site.url + mock_site.olx_listing_path(mock_site.OLX_QUERY, "Lahore").lstrip("/")]
+
+def test_stale_location_is_resolved_again(olx_site, location_cache):
+    location_cache.store("Lahore", "Lahore, Pakistan", "lahore_g1")
+    page = FakePage()
+    assert not asyncio.run(open_location_search(page, olx_site.url, mock_site.OLX_QUERY, "Lahore"))
+    assert location_cache.lookup("Lahore") is None
@@ -0,0 +1,27 @@
+import asyncio
+
+from metrics import Metrics
+
+def test_scopes_report_their_own_metrics(tmp_path):
+    metrics = Metrics(path=str(tmp_path / "metrics.prom"))
+
+    async def job(name, pages):
+        with metrics.scope(job=name):
+            for _ in range(pages):
+                metrics.count("pages", site="amazon")
+                await asyncio.sleep(0)
+            with metrics.timer("navigation", site="amazon"):
+                pass
+            return metrics.report()
+
+    async def scenario():
+        return await asyncio.gather(job("first", 2), job("second", 3))
+
+    first, second = asyncio.run(scenario())
+    assert first["counters"] == {"pages": 2}
+    assert second["counters"] == {"pages": 3}
+    assert first["stages"]["navigation"]["count"] == 1
+    # Jobs leave the metrics file to the process, which reports the totals
+    assert not (tmp_path / "metrics.prom").exists()
+    assert metrics.report()["counters"] == {"pages": 5}
+    assert 'scraper_pages_total{site="amazon"} 5' in (tmp_path / "metrics.prom").read_text(encoding="utf-8")
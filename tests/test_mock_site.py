@@ -0,0 +1,36 @@
+import asyncio
+from urllib.parse import quote
+
+import pytest
+
+import amazon
+import mock_site
+from http_fetch import HttpFetcher
+from pacing import pacer
+
+pytest.importorskip("httpx")
+pytest.importorskip("selectolax")
+
+def fetch(url):
+    async def scenario():
+        fetcher = HttpFetcher("test")
+        try:
+            return await fetcher.fetch_items(url, amazon.Selectors.ALL_ITEMS, amazon.Selectors.ITEM_FIELDS), fetcher.stats
+        finally:
+            await fetcher.close()
+    return asyncio.run(scenario())
+
+def test_result_pages_are_parsed_over_http(amazon_site, monkeypatch):
+    monkeypatch.setattr(pacer, "enabled", False)
+    brand_url = f"{amazon_site.url}s?k={quote('Electronics brand 0')}"
+    (records, tree), stats = fetch(amazon.build_page_url(brand_url, 2))
+    assert len(records) == mock_site.AMAZON_ITEMS_PER_PAGE
+    assert all(record["asin"] for record in records)
+    assert amazon.page_count_from_html(tree) == mock_site.AMAZON_PAGES
+    assert stats["pages"] == 1
+
+def test_missing_pages_are_escalated_to_the_browser(amazon_site, monkeypatch):
+    monkeypatch.setattr(pacer, "enabled", False)
+    result, stats = fetch(f"{amazon_site.url}s?k=unknown")
+    assert result is None
+    assert stats["bad_status"] == 1 and stats["escalated"] == 1
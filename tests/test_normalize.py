@@ -0,0 +1,49 @@
+import pytest
+
+from normalize import normalize_channel, normalize_product, parse_count, parse_price, parse_rating
+
+@pytest.mark.parametrize("text, expected", [
+    ("₹1,299.00", (1299.0, "INR")),
+    ("$19.99", (19.99, "USD")),
+    ("Rs 45,000", (45000.0, "PKR")),
+    ("1,299", (1299.0, None)),
+    ("No Price", (None, None)),
+    (None, (None, None)),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("4.3 out of 5 stars", 4.3),
+    ("5 out of 5 stars", 5.0),
+    ("No Rating", None),
+    (None, None),
+])
+def test_parse_rating(text, expected):
+    assert parse_rating(text) == expected
+
+@pytest.mark.parametrize("text, expected", [
+    ("1.2M subscribers", 1_200_000),
+    ("5.6K subscribers", 5_600),
+    ("1,234 subscribers", 1_234),
+    ("812 subscribers", 812),
+    ("@user123 • 5.6K subscribers", 5_600),
+    ("5.6K subscribers • @user123", 5_600),
+    ("@user123", None),
+    ("@2cellos", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_count(text, expected):
+    assert parse_count(text) == expected
+
+def test_normalize_product():
+    product = {"asin": "B01", "name": "Mouse", "price": "₹499.00", "rating": "4.1 out of 5 stars"}
+    assert normalize_product(product) == {"asin": "B01", "name": "Mouse", "price": 499.0, "currency": "INR", "rating": 4.1}
+
+def test_normalize_channel():
+    channel = {
+        "channel_id": "UC1", "title": "Cellos", "subscribers": "@2cellos • 7.1M subscribers",
+        "description": "", "avatar": "https://example.com/a.jpg", "url": "https://www.youtube.com/@2cellos",
+    }
+    assert normalize_channel(channel)["subscribers"] == 7_100_000
@@ -0,0 +1,40 @@
+from olx import ad_from_hit, ad_key, decode_listing_response, merge_ad_records, next_listing_request
+
+def ad(ad_id, title="iPhone 15", price="Rs 100", location="Johar Town, Lahore"):
+    return {"title": title, "price": price, "location": location, "url": f"/item/iphone-15-iid-{ad_id}"}
+
+def test_ad_key_prefers_the_ad_id():
+    assert ad_key(ad(42)) == "42"
+    assert ad_key({"title": "a", "price": "b", "location": "c", "url": None}) == "a|b|c"
+
+def test_merge_keeps_ads_found_only_in_the_dom():
+    api_records = [ad(1, price="Rs 1,000"), ad(2)]
+    dom_records = [ad(2, price="Rs 2"), ad(3)]
+    merged = merge_ad_records(api_records, dom_records)
+    assert [ad_key(record) for record in merged] == ["1", "2", "3"]
+    # The API's record of an ad found in both wins
+    assert merged[1]["price"] == "Rs 100"
+
+def test_merge_without_api_records():
+    assert merge_ad_records([], [ad(3)]) == [ad(3)]
+
+def hit(ad_id, price=45000):
+    return {"_source": {
+        "externalID": str(ad_id), "slug": "iphone-15", "title": "iPhone 15", "price": price,
+        "location": [{"name": "Pakistan"}, {"name": "Lahore"}, {"name": "Johar Town"}],
+    }}
+
+def test_ad_from_hit_matches_the_dom_record():
+    assert ad_from_hit(hit(42)) == ad(42, price="Rs 45,000")
+
+def test_decode_listing_response():
+    payload = {"results": [{"hits": {"hits": [hit(1), hit(2)]}}, {"hits": [{"_source": {"title": "not an ad"}}]}]}
+    ads, has_more = decode_listing_response(payload)
+    assert [ad_key(record) for record in ads] == ["1", "2"]
+    assert has_more is True
+    assert decode_listing_response({"results": []}) == ([], None)
+
+def test_next_listing_request_pages_through_the_query():
+    request = {"url": "https://www.olx.com.pk/api/search?q=iphone&page=2", "method": "GET", "headers": {}, "post_data": None}
+    assert next_listing_request(request, {})["url"] == "https://www.olx.com.pk/api/search?q=iphone&page=3"
+    assert next_listing_request({**request, "url": "https://www.olx.com.pk/api/search?q=iphone"}, {}) is None
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import pacing
+from pacing import DomainLimiter, TokenBucket
+
+def test_token_bucket_allows_a_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+    bucket.refund()
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+def test_requests_waiting_for_a_token_hold_no_slot():
+    async def scenario():
+        limiter = DomainLimiter("example.com", rate=10, max_concurrency=4)
+        limiter.bucket = TokenBucket(rate=10, burst=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.02)
+        assert not waiting.done()
+        assert limiter.in_flight == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert limiter.in_flight == 1
+        # The cancelled request gave its token back, so the next one waits no longer than it would have
+        assert limiter.bucket.reserve() <= 0.1 + 0.01
+
+    asyncio.run(scenario())
+
+def test_concurrency_limit_wakes_waiters_on_release():
+    async def scenario():
+        limiter = DomainLimiter("example.com", rate=100, max_concurrency=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.02)
+        assert not waiting.done() and limiter.state()["waiting"] == 1
+        limiter.release(0.1)
+        await asyncio.wait_for(waiting, 1)
+        assert limiter.in_flight == 1
+
+    asyncio.run(scenario())
+
+def test_limits_grow_on_fast_windows_and_are_cut_on_errors():
+    limiter = DomainLimiter("example.com", rate=2.0, max_concurrency=8)
+    concurrency = limiter.concurrency
+    for _ in range(pacing.LIMIT_WINDOW):
+        limiter.in_flight += 1
+        limiter.release(0.1)
+    assert limiter.concurrency == concurrency + 1
+    assert limiter.bucket.rate == 2.0 + pacing.RATE_STEP
+
+    for number in range(pacing.LIMIT_WINDOW):
+        limiter.in_flight += 1
+        limiter.release(0.1, error=ValueError() if number % 2 else None)
+    assert limiter.concurrency == max(int((concurrency + 1) * pacing.DECREASE_FACTOR), 1)
+    assert limiter.bucket.rate == (2.0 + pacing.RATE_STEP) * pacing.DECREASE_FACTOR
+    assert limiter.state()["error_rate"] == 0.5
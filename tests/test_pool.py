@@ -0,0 +1,134 @@
+import asyncio
+from types import SimpleNamespace
+
+import pool
+from pool import BrowserPool
+
+class FakePage:
+    def __init__(self):
+        self.handlers = {}
+        self.heap = 0
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def navigate(self):
+        self.handlers["framenavigated"](SimpleNamespace(parent_frame=None))
+
+    async def evaluate(self, script):
+        return self.heap
+
+class FakeContext:
+    def __init__(self):
+        self.handlers = {}
+        self.closed = False
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    async def new_page(self):
+        page = FakePage()
+        self.handlers["page"](page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.contexts = []
+        self.handlers = {}
+
+    def on(self, event, handler):
+        self.handlers[event] = handler
+
+    def is_connected(self):
+        return self.connected
+
+    def crash(self):
+        self.connected = False
+        self.handlers["disconnected"](self)
+
+    async def new_context(self):
+        context = FakeContext()
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.connected = False
+
+class FakePlaywright:
+    def __init__(self):
+        self.chromium = self
+        self.browsers = []
+
+    async def start(self):
+        return self
+
+    async def launch(self, **options):
+        self.browsers.append(FakeBrowser())
+        return self.browsers[-1]
+
+    async def stop(self):
+        pass
+
+async def new_context(browser):
+    return await browser.new_context()
+
+def run_pool(monkeypatch, scenario, **options):
+    playwright = FakePlaywright()
+    monkeypatch.setattr(pool, "async_playwright", lambda: playwright)
+
+    async def main():
+        async with BrowserPool(new_context, **options) as browser_pool:
+            await scenario(browser_pool)
+        return browser_pool
+
+    return asyncio.run(main()), playwright
+
+def test_warm_pages_are_reused_and_leased_to_one_holder_at_a_time(monkeypatch):
+    pages = []
+
+    async def scenario(browser_pool):
+        async def hold():
+            async with browser_pool.lease() as page:
+                pages.append(page)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(*(hold() for _ in range(6)))
+
+    browser_pool, playwright = run_pool(monkeypatch, scenario, size=2)
+    assert len(set(map(id, pages))) == 2
+    # Both contexts were created at startup and never replaced
+    assert len(playwright.browsers[0].contexts) == 2
+    assert browser_pool.stats["leases"] == 6
+
+def test_contexts_are_recycled_after_their_navigation_budget_or_on_memory(monkeypatch):
+    async def scenario(browser_pool):
+        for _ in range(3):
+            async with browser_pool.lease() as page:
+                page.navigate()
+                page.navigate()
+        async with browser_pool.lease() as page:
+            page.heap = 600_000_000
+
+    browser_pool, playwright = run_pool(monkeypatch, scenario, max_navigations=2, max_memory_mb=512)
+    contexts = playwright.browsers[0].contexts
+    assert len(contexts) == 5
+    assert all(context.closed for context in contexts[:4])
+    assert browser_pool.stats["recycled_navigations"] == 3
+    assert browser_pool.stats["recycled_memory"] == 1
+
+def test_crashed_browser_is_relaunched_before_its_context_is_leased_again(monkeypatch):
+    async def scenario(browser_pool):
+        async with browser_pool.lease():
+            browser_pool.browser.crash()
+        async with browser_pool.lease() as page:
+            assert page is not None
+
+    browser_pool, playwright = run_pool(monkeypatch, scenario)
+    assert len(playwright.browsers) == 2
+    assert len(playwright.browsers[1].contexts) == 1
+    assert browser_pool.stats["crashes"] == 1
+    assert browser_pool.stats["launches"] == 2
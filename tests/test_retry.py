@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+import pytest
+
+import retry
+from retry import (
+    BLOCKED, FATAL, SELECTOR_MISSING, TRANSIENT, BlockedError, DeadLetterQueue, Retrier, SelectorMissingError,
+    backoff_delay, classify,
+)
+
+class TimeoutError(Exception):
+    """Stands in for Playwright's TimeoutError, which is told apart by name and message."""
+
+@pytest.mark.parametrize("error, expected", [
+    (BlockedError("Captcha on /s?k=a"), BLOCKED),
+    (SelectorMissingError("Brand 3 is missing"), SELECTOR_MISSING),
+    (TimeoutError("Timeout 30000ms exceeded.\n  waiting for locator('.s-main-slot')"), SELECTOR_MISSING),
+    (TimeoutError("Timeout 60000ms exceeded.\nnavigating to \"https://www.amazon.in/\""), TRANSIENT),
+    (asyncio.TimeoutError(), TRANSIENT),
+    (ConnectionResetError(), TRANSIENT),
+    (httpx.ConnectError("connection refused"), TRANSIENT),
+    (Exception("page.goto: net::ERR_CONNECTION_RESET at https://www.amazon.in/"), TRANSIENT),
+    (Exception("Target closed"), TRANSIENT),
+    (KeyError("price"), FATAL),
+    (ValueError("bad URL"), FATAL),
+])
+def test_classify(error, expected):
+    assert classify(error) == expected
+
+def test_backoff_delay_is_capped_and_longer_when_blocked(monkeypatch):
+    monkeypatch.setattr(retry.random, "uniform", lambda low, high: high)
+    assert backoff_delay(1) == retry.BACKOFF_BASE
+    assert backoff_delay(3) == retry.BACKOFF_BASE * 4
+    assert backoff_delay(20) == retry.BACKOFF_MAX
+    assert backoff_delay(1, BLOCKED) == retry.BACKOFF_BASE * retry.BLOCKED_BACKOFF_FACTOR
+
+@pytest.fixture
+def dead_letters(tmp_path, monkeypatch):
+    queue = DeadLetterQueue(str(tmp_path / "dead_letters.sqlite"))
+    monkeypatch.setattr(retry, "_dead_letters", queue)
+    monkeypatch.setattr(retry, "BACKOFF_BASE", 0.001)
+    yield queue
+    queue.close()
+
+def test_transient_errors_are_retried(dead_letters):
+    attempts = []
+
+    async def operation():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionResetError()
+        return "ok"
+
+    assert asyncio.run(Retrier("amazon").run("https://example.com/a", operation, "page")) == "ok"
+    assert len(attempts) == 3
+    assert dead_letters.entries() == []
+
+def test_exhausted_operations_are_dead_lettered_and_resolved_later(dead_letters):
+    async def fail():
+        raise ValueError("bad record")
+
+    async def succeed():
+        return "ok"
+
+    retrier = Retrier("amazon")
+    with pytest.raises(ValueError):
+        asyncio.run(retrier.run("https://example.com/a", fail, "brand", {"brand_url": "https://example.com/a"}))
+    [entry] = dead_letters.entries("amazon", "brand")
+    assert entry["error_class"] == FATAL
+    assert entry["attempts"] == 1
+    assert entry["context"] == {"brand_url": "https://example.com/a"}
+
+    asyncio.run(retrier.run("https://example.com/a", succeed, "brand"))
+    assert dead_letters.entries() == []
+
+def test_url_attempt_budget_is_shared_across_runs(dead_letters):
+    async def fail():
+        raise ConnectionResetError()
+
+    retrier = Retrier("amazon", max_url_attempts=5)
+    for expected in (4, 5):
+        with pytest.raises(ConnectionResetError):
+            asyncio.run(retrier.run("https://example.com/a", fail))
+        assert retrier.failures["https://example.com/a"] == expected
@@ -0,0 +1,74 @@
+import csv
+import os
+import queue
+
+import pytest
+
+from shard import RemoteSink, ShardedRun, SinkServer
+from sink import OutputSink, get_sink, use_sink
+
+async def write_items(worker_id, items, options):
+    """Task of the sharded runs below: one CSV row per item, and a marker file once the row is on disk."""
+    def written(item):
+        with open(os.path.join(options["directory"], f"written-{item}"), "w"):
+            pass
+
+    async for (item,) in items:
+        if item == "broken":
+            raise RuntimeError("worker crashed")
+        await get_sink().write_async(
+            os.path.join(options["directory"], "items.csv"), [{"item": item, "worker": worker_id}], ["item", "worker"],
+            on_written=lambda item=item: written(item),
+        )
+
+def read_items(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+@pytest.fixture
+def parent_sink(tmp_path, monkeypatch):
+    # Worker processes start in this directory and write their metrics files there
+    monkeypatch.chdir(tmp_path)
+    sink = OutputSink()
+    use_sink(sink)
+    yield sink
+    use_sink(None)
+    sink.close()
+
+def test_remote_sink_writes_through_the_parent_and_acknowledges(tmp_path, parent_sink):
+    requests, acks = queue.Queue(), queue.Queue()
+    server = SinkServer(requests, [acks])
+    server.start()
+    remote = RemoteSink(0, requests, acks)
+    written = []
+    remote.write(str(tmp_path / "rows.csv"), [{"name": "a"}], ["name"], on_written=lambda: written.append("a"))
+    remote.write(str(tmp_path / "rows.csv"), [{"name": "b"}], ["name"])
+    remote.flush()
+    # Flushed means on disk, with the callbacks of everything written before it run
+    assert [row["name"] for row in read_items(tmp_path / "rows.csv")] == ["a", "b"]
+    assert written == ["a"]
+    remote.close()
+    server.stop()
+
+def test_sharded_run_spreads_items_and_writes_in_the_parent(tmp_path, parent_sink):
+    run = ShardedRun(write_items, processes=2, options={"directory": str(tmp_path)}, name="test")
+    run.start()
+    items = [f"item-{number}" for number in range(20)]
+    for item in items:
+        run.submit(item)
+    stats = run.finish()
+    parent_sink.flush()
+
+    assert stats == {"items": 20, "failed_processes": 0}
+    rows = read_items(tmp_path / "items.csv")
+    assert sorted(row["item"] for row in rows) == sorted(items)
+    assert {row["worker"] for row in rows} <= {"0", "1"}
+    assert all((tmp_path / f"written-{item}").exists() for item in items)
+
+def test_failed_worker_processes_are_counted(tmp_path, parent_sink):
+    run = ShardedRun(write_items, processes=1, options={"directory": str(tmp_path)}, name="test")
+    run.start()
+    run.submit("item-0")
+    run.submit("broken")
+    assert run.finish() == {"items": 2, "failed_processes": 1}
+    assert [row["item"] for row in read_items(tmp_path / "items.csv")] == ["item-0"]
@@ -0,0 +1,122 @@
+import asyncio
+import csv
+import json
+import threading
+import time
+
+import pytest
+
+from sink import OutputSink, use_sink, write_outputs
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+def test_write_async_waits_for_room_without_blocking_the_loop(tmp_path):
+    sink = OutputSink(max_pending=1, flush_interval=60)
+    path = str(tmp_path / "rows.csv")
+    # Hold the writer thread in the callback of a flush, then fill the queue behind it
+    release = threading.Event()
+    sink.write(path, [{"a": 1}], ["a"], on_written=release.wait)
+    sink.queue.put(("flush", threading.Event()))
+    while not sink.queue.empty():
+        time.sleep(0.01)
+    sink.queue.put(("flush", threading.Event()))
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        write = asyncio.create_task(sink.write_async(path, [{"a": 2}], ["a"]))
+        await asyncio.sleep(0.1)
+        assert not write.done()
+        release.set()
+        await asyncio.wait_for(write, 5)
+        ticker.cancel()
+        return ticks
+
+    # The loop kept running other tasks while the write waited
+    assert asyncio.run(main()) > 3
+    sink.close()
+    assert read_csv(path) == [{"a": "1"}, {"a": "2"}]
+
+def test_on_written_runs_after_rows_are_on_disk(tmp_path):
+    sink = OutputSink()
+    path = str(tmp_path / "rows.jsonl")
+    seen = []
+    asyncio.run(sink.write_async(path, [{"a": 1}], {"a": "int64"}, on_written=lambda: seen.extend(open(path).read().splitlines())))
+    sink.flush()
+    assert [json.loads(line) for line in seen] == [{"a": 1}]
+    sink.close()
+
+def test_csv_with_other_columns_is_not_appended_to(tmp_path):
+    path = tmp_path / "products.csv"
+    path.write_text("name,rating,price\nOld,4.0,10\n", encoding="utf-8")
+    fieldnames = ["asin", "name", "rating", "price"]
+    for run in range(2):
+        sink = OutputSink()
+        sink.write(str(path), [{"asin": f"B0{run}", "name": "New", "rating": "5.0", "price": "20"}], fieldnames)
+        sink.close()
+
+    assert path.read_text(encoding="utf-8") == "name,rating,price\nOld,4.0,10\n"
+    rows = read_csv(tmp_path / "products-1.csv")
+    assert [row["asin"] for row in rows] == ["B00", "B01"]
+    assert not (tmp_path / "products-2.csv").exists()
+
+def test_jsonl_and_parquet_hold_typed_rows(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+    schema = {"name": "string", "price": "float64"}
+    rows = [{"name": "Mouse", "price": 499.0}, {"name": "Cable", "price": None}]
+    sink = OutputSink()
+    sink.write(str(tmp_path / "rows.jsonl"), rows, schema)
+    sink.write(str(tmp_path / "rows.parquet"), rows, schema)
+    sink.close()
+
+    with open(tmp_path / "rows.jsonl", encoding="utf-8") as file:
+        assert [json.loads(line) for line in file] == rows
+    assert pyarrow_parquet.read_table(tmp_path / "rows.parquet").to_pylist() == rows
+
+def test_parquet_files_are_never_appended_to(tmp_path):
+    pytest.importorskip("pyarrow")
+    for _ in range(2):
+        sink = OutputSink()
+        sink.write(str(tmp_path / "rows.parquet"), [{"name": "Mouse"}], {"name": "string"})
+        sink.close()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["rows-1.parquet", "rows.parquet"]
+
+def test_overwrite_truncates_once_and_evicted_files_are_appended_to(tmp_path):
+    first, second = str(tmp_path / "first.csv"), str(tmp_path / "second.csv")
+    with open(first, "w", encoding="utf-8") as file:
+        file.write("name\nfrom an earlier run\n")
+    sink = OutputSink(max_open_files=1)
+    sink.write(first, [{"name": "a"}], ["name"], overwrite=True)
+    sink.flush()
+    sink.write(second, [{"name": "b"}], ["name"])
+    sink.flush()
+    # The first file was closed to stay within max_open_files, reopening it must not truncate it again
+    sink.write(first, [{"name": "c"}], ["name"], overwrite=True)
+    sink.close()
+
+    assert [row["name"] for row in read_csv(first)] == ["a", "c"]
+    assert [row["name"] for row in read_csv(second)] == ["b"]
+
+def test_write_outputs_keeps_raw_csv_and_normalizes_the_rest(tmp_path):
+    sink = OutputSink()
+    use_sink(sink)
+    try:
+        asyncio.run(write_outputs(
+            str(tmp_path / "products"), [{"price": "₹499.00"}], ("csv", "jsonl"), ["price"], {"price": "float64"},
+            lambda row: {"price": float(row["price"].lstrip("₹"))},
+        ))
+    finally:
+        use_sink(None)
+        sink.close()
+    assert read_csv(tmp_path / "products.csv") == [{"price": "₹499.00"}]
+    with open(tmp_path / "products.jsonl", encoding="utf-8") as file:
+        assert json.loads(file.readline()) == {"price": 499.0}
@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from youtube import channel_from_renderer, decode_search_response, next_search_request, scrape_queries_sharded
+
+def renderer(subscriber_count_text, video_count_text=None):
+    value = {"channelId": "UC123", "title": {"simpleText": "Channel"}, "subscriberCountText": {"simpleText": subscriber_count_text}}
+    if video_count_text:
+        value["videoCountText"] = {"simpleText": video_count_text}
+    return value
+
+def test_subscribers_from_either_text():
+    assert channel_from_renderer(renderer("1.2M subscribers"))["subscribers"] == "1.2M subscribers"
+    assert channel_from_renderer(renderer("@user123", "5.6K subscribers"))["subscribers"] == "5.6K subscribers"
+
+def test_handle_is_not_a_subscriber_count():
+    assert channel_from_renderer(renderer("@user123"))["subscribers"] is None
+    assert channel_from_renderer(renderer("@user123", "42 videos"))["subscribers"] is None
+
+def test_decode_search_response():
+    payload = {"contents": [
+        {"itemSectionRenderer": {"contents": [{"channelRenderer": renderer("1.2M subscribers")}, {"videoRenderer": {}}]}},
+        {"continuationItemRenderer": {"continuationEndpoint": {"continuationCommand": {"token": "NEXT"}}}},
+    ]}
+    records, has_more = decode_search_response(payload)
+    assert [record["channel_id"] for record in records] == ["UC123"]
+    assert records[0]["url"] == "/channel/UC123"
+    assert has_more is True
+    assert decode_search_response({"contents": []}) == ([], False)
+
+def test_next_search_request_sends_the_continuation():
+    request = {
+        "url": "https://www.youtube.com/youtubei/v1/search", "method": "POST", "headers": {},
+        "post_data": json.dumps({"context": {"client": {"hl": "en"}}, "query": "cooking"}),
+    }
+    payload = {"continuationCommand": {"token": "NEXT"}}
+    assert json.loads(next_search_request(request, payload)["post_data"]) == {"context": {"client": {"hl": "en"}}, "continuation": "NEXT"}
+    assert next_search_request(request, {}) is None
+
+def test_no_queries_start_no_worker_processes():
+    assert asyncio.run(scrape_queries_sharded("https://www.youtube.com/", [])) == {"items": 0, "failed_processes": 0}
@@ -1,8 +1,20 @@
-import csv
 import random
 import logging
-import time
-from playwright.sync_api import sync_playwright
+import asyncio
+import json
+import os
+import re
+
+from blocking import get_blocker
+from capture import ResponseCapture, find_key, json_body
+from extraction import apply_defaults, extract_new_items, field
+from normalize import CHANNEL_SCHEMA, normalize_channel
+from metrics import log_item, metrics
+from pacing import act_and_wait, goto, pacer
+from pool import BrowserPool
+from retry import get_retrier
+from shard import WORKER_PROCESSES, ShardedRun
+from sink import close_sink, open_sink, output_formats, write_outputs
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
@@ -16,6 +28,36 @@ class Selectors:
     CHANNEL_SUBSCRIBER_COUNT = "#metadata subscribers #video-count"  # Subscriber count selector
     CHANNEL_DESCRIPTION = "#description"  # Channel description selector
     CHANNEL_AVATAR = "#avatar img"  # Avatar image selector
+    SEARCH_RESPONSE = r"/youtubei/v1/search"  # Results XHR, also used for filters and continuations
+    CHANNEL_NAME_FALLBACK = "div.ytd-channel-renderer #text"
+    CHANNEL_LINK = "a#main-link"
+    CONTINUATION = "ytd-continuation-item-renderer"  # Only present while more results can be loaded
+    # Fields read from each channel in CHANNEL_CONTAINER by the batched extractor
+    CHANNEL_FIELDS = {
+        "title": field(CHANNEL_NAME, CHANNEL_NAME_FALLBACK, text_content=True),
+        "subscribers": field(CHANNEL_SUBSCRIBER_COUNT, text_content=True),
+        "description": field(CHANNEL_DESCRIPTION, text_content=True),
+        "avatar": field(CHANNEL_AVATAR, attribute="src"),
+        "url": field(CHANNEL_LINK, attribute="href"),
+    }
+    CHANNEL_DEFAULTS = {
+        "title": "No title",
+        "subscribers": "No subscriber info",
+        "description": "No description",
+        "avatar": "No avatar",
+        "url": None,
+    }
+
+# Searched for when no query is given
+SEARCH_QUERY = "Playwright tutorial"
+
+# Consecutive scrolls without a single new channel before giving up on a stalled continuation
+MAX_IDLE_SCROLLS = 3
+
+# Formats channels are saved in. CSV keeps the scraped strings, JSONL and Parquet hold typed fields
+OUTPUT_FORMATS = output_formats("csv", "jsonl", "parquet")
+
+LAUNCH_OPTIONS = {"headless": False}  # Set headless to True for headless mode
 
 # Function to generate random user agents
 def get_random_user_agents():
@@ -27,195 +69,276 @@ def get_random_user_agents():
     ]
     return random.choice(user_agents)
 
+async def new_context(browser):
+    """Create a browser context with a random user agent and YouTube resource blocking."""
+    context = await browser.new_context(user_agent=get_random_user_agents())
+    await get_blocker("youtube").attach(context)
+    pacer.watch(context)
+    return context
+
 # Function to perform a search
-def search_bar(page):
+async def search_bar(page, query=SEARCH_QUERY):
     try:
         # Locate the search bar
-        search_input = page.wait_for_selector(Selectors.SEARCH_BAR, timeout=5000)
+        search_input = await page.wait_for_selector(Selectors.SEARCH_BAR, timeout=5000)
         logging.info("Search bar found!")
 
         # Clear any pre-filled text in the search bar
-        search_input.click()  
-        page.keyboard.press("Control+A")  
-        page.keyboard.press("Backspace") 
-
-        # Mimic human typing
-        query = "Playwright tutorial"  # Replace with desired query
-        for char in query:
-            search_input.type(char, delay=random.uniform(100, 300))  # Typing delay
+        await search_input.click()  
+        await page.keyboard.press("Control+A")  
+        await page.keyboard.press("Backspace") 
+
+        await search_input.fill(query)
         logging.info("Query typed into search bar.")
+        await pacer.pause(page.url, scale=0.5)
 
-        # Locate and click the search button
-        search_button = page.wait_for_selector(Selectors.SEARCH_BUTTON, timeout=5000)
-        search_button.click()
+        # Locate and click the search button, then wait for the results page to show its filter button
+        search_button = await page.wait_for_selector(Selectors.SEARCH_BUTTON, timeout=5000)
+        await act_and_wait(page, search_button.click, selector=Selectors.FILTER_BUTTON, url_change=True)
         logging.info("Search button clicked!")
-
-        # Wait for the search results to load (adjust the sleep time as needed)
-        time.sleep(random.uniform(3, 6))  # Simulate human-like delay after clicking the search button
+        await pacer.pause(page.url)
 
         return True
     except Exception as e:
         logging.error(f"Error in search_bar function: {e}")
         return False
 
-# Function to simulate faster human-like scrolling with random speed and delay
-def fast_scroll(page, scroll_delay_range=(1, 2), scroll_increment_range=(100, 500)):
+# Function to scroll the continuation spinner into view and wait for the next batch of results
+async def scroll_to_continuation(page):
     try:
-        logging.info("Starting faster scroll...")
-        scroll_increment = random.randint(*scroll_increment_range)  # Randomize scroll amount
-        page.evaluate(f"window.scrollBy(0, {scroll_increment})")  # Scroll vertically
-        logging.info(f"Scrolled by {scroll_increment} pixels.")
-        time.sleep(random.uniform(*scroll_delay_range))  # Random delay between scrolls
+        scroll = lambda: page.evaluate(
+            "(selector) => { const spinner = document.querySelector(selector); "
+            "if (spinner) spinner.scrollIntoView(); else window.scrollTo(0, document.documentElement.scrollHeight); }",
+            Selectors.CONTINUATION,
+        )
+        return await act_and_wait(page, scroll, response_pattern=Selectors.SEARCH_RESPONSE, timeout=15000)
     except Exception as e:
-        logging.error(f"Error in fast_scroll function: {e}")
+        logging.error(f"Error in scroll_to_continuation function: {e}")
+        return False
+
+def get_text(value):
+    """Read a YouTube API text object, which is either {"simpleText": ...} or {"runs": [{"text": ...}]}."""
+    if not value:
+        return None
+    if "simpleText" in value:
+        return value["simpleText"]
+    return "".join(run.get("text", "") for run in value.get("runs", [])) or None
+
+def channel_from_renderer(renderer):
+    """Turn a channelRenderer from the search API into the same record the DOM extractor produces."""
+    # Newer layouts show the @handle in subscriberCountText and the subscriber count in videoCountText
+    counts = [get_text(renderer.get("subscriberCountText")), get_text(renderer.get("videoCountText"))]
+    # The count is missing rather than read from the handle when neither text mentions subscribers
+    subscribers = next((text for text in counts if text and re.search(r"subscriber", text, re.IGNORECASE)), None)
+    thumbnails = renderer.get("thumbnail", {}).get("thumbnails", [])
+    avatar = thumbnails[-1]["url"] if thumbnails else None
+    if avatar and avatar.startswith("//"):
+        avatar = "https:" + avatar
+    browse = renderer.get("navigationEndpoint", {}).get("browseEndpoint", {})
+    url = browse.get("canonicalBaseUrl") or (f"/channel/{renderer['channelId']}" if renderer.get("channelId") else None)
+    return {
+        "channel_id": renderer.get("channelId"),
+        "title": get_text(renderer.get("title")),
+        "subscribers": subscribers,
+        "description": get_text(renderer.get("descriptionSnippet")),
+        "avatar": avatar,
+        "url": url,
+    }
+
+def channel_id_from_url(url):
+    """Read the channel ID out of a /channel/UC... link. Links to an @handle do not carry one."""
+    match = re.search(r"/channel/(UC[\w-]+)", url or "")
+    return match.group(1) if match else None
+
+def decode_search_response(payload):
+    """Read the channels of a youtubei/v1/search response, and whether more results can be loaded."""
+    records = [channel_from_renderer(renderer) for renderer in find_key(payload, "channelRenderer")]
+    # Every response that has more results ends with a continuation item
+    has_more = next(find_key(payload, "continuationItemRenderer"), None) is not None
+    return records, has_more
+
+def next_search_request(last_request, payload):
+    """Build the continuation request for the results after `payload`, as the page itself would send it."""
+    body = json_body(last_request)
+    token = next((command.get("token") for command in find_key(payload, "continuationCommand")), None)
+    if not body or "context" not in body or not token:
+        return None
+    return {**last_request, "post_data": json.dumps({"context": body["context"], "continuation": token})}
+
+def new_search_capture():
+    """Capture channel results from the search API, then fetch further continuations directly."""
+    return ResponseCapture(Selectors.SEARCH_RESPONSE, decode_search_response, next_search_request, name="youtube")
 
 # Function to click the "Filter" button
-def filter_for_channels(page):
+async def filter_for_channels(page):
     try:
         # Locate and click the Filter button
-        filter_button = page.wait_for_selector(Selectors.FILTER_BUTTON, timeout=5000)
+        filter_button = await page.wait_for_selector(Selectors.FILTER_BUTTON, timeout=5000)
         logging.info("Filter button found!")
-        filter_button.click()
+        await act_and_wait(page, filter_button.click, selector=Selectors.CHANNEL_FILTER)  # Wait for filter options to load
         logging.info("Filter button clicked!")
-        time.sleep(random.uniform(2, 4))  # Wait for filter options to load
         return True
     except Exception as e:
         logging.error(f"Error in filter_for_channels function: {e}")
         return False
 
 # Function to apply the "Channel" filter
-def select_channel_filter(page):
+async def select_channel_filter(page):
     try:
         # Locate and click the Channel filter
-        channel_filter = page.wait_for_selector(Selectors.CHANNEL_FILTER, timeout=5000)
+        channel_filter = await page.wait_for_selector(Selectors.CHANNEL_FILTER, timeout=5000)
         logging.info("Channel filter found!")
-        channel_filter.click()
+        await act_and_wait(page, channel_filter.click, selector=Selectors.CHANNEL_CONTAINER, response_pattern=Selectors.SEARCH_RESPONSE)
         logging.info("Channel filter applied!")
+        await pacer.pause(page.url)
         return True
     except Exception as e:
         logging.error(f"Error in select_channel_filter function: {e}")
         return False
 
-def extract_channel_details(page):
+async def extract_channel_details(page, capture=None):
     try:
-        # Add a wait for channel containers to load properly after the filter is applied
-        page.wait_for_selector(Selectors.CHANNEL_CONTAINER, timeout=10000)  # Wait for channel containers to appear
-        logging.info("Channel containers found!")
-        
-        # Try selecting the correct container for channels
-        channel_containers = page.query_selector_all(Selectors.CHANNEL_CONTAINER)
-        if not channel_containers:
-            logging.warning("No channel containers found.")
-        
+        if capture and capture.responses:
+            # Channels decoded from the search API, no rendering or selector matching needed
+            channel_records = capture.take()
+        else:
+            # Read every field of only the channel containers added since the last call, in one round trip
+            channel_records = await extract_new_items(page, Selectors.CHANNEL_CONTAINER, Selectors.CHANNEL_FIELDS)
+
         channel_details = []
 
-        # Iterate through each container to extract channel details
-        for container in channel_containers:
-            # Look for a more accurate channel name element inside the container
-            channel_name = container.query_selector(Selectors.CHANNEL_NAME) or container.query_selector("div.ytd-channel-renderer #text")  # Fallback selector
-            title = channel_name.text_content().strip() if channel_name else "No title"
-            
-            # Get additional channel information (subscribers, description, avatar)
-            subscriber_count = container.query_selector(Selectors.CHANNEL_SUBSCRIBER_COUNT)
-            description = container.query_selector(Selectors.CHANNEL_DESCRIPTION)
-            avatar = container.query_selector(Selectors.CHANNEL_AVATAR)
-
-            subscribers = subscriber_count.text_content().strip() if subscriber_count else "No subscriber info"
-            desc = description.text_content().strip() if description else "No description"
-            avatar_url = avatar.get_attribute('src') if avatar else "No avatar"
-
-            # Logging the extracted channel name and details
-            channel_details.append({
-                "title": title,
-                "subscribers": subscribers,
-                "description": desc,
-                "avatar": avatar_url,
-            })
-            logging.info(f"Extracted details for channel: {title}")
+        for record in channel_records:
+            detail = apply_defaults(record, Selectors.CHANNEL_DEFAULTS)
+            # The API names the channel ID, rendered results only link to it
+            detail["channel_id"] = detail.get("channel_id") or channel_id_from_url(detail["url"])
+            channel_details.append(detail)
+            log_item("channel", "Extracted details for channel: %s", detail["title"])
 
         return channel_details
     except Exception as e:
         logging.error(f"Error in extract_channel_details: {e}")
         return []
 
-# Function to save the extracted details to a CSV file
-def save_to_csv(channel_details, filename="channel_details.csv"):
-    try:
-        # Define the header for the CSV file
-        fieldnames = ["title", "subscribers", "description", "avatar"]
-        
-        # Open the CSV file in write mode
-        with open(filename, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.DictWriter(file, fieldnames=fieldnames)
-            
-            # Write the header
-            writer.writeheader()
-            
-            # Write the data rows
-            for detail in channel_details:
-                writer.writerow(detail)
-        
-        logging.info(f"Channel details saved to {filename}")
-    except Exception as e:
-        logging.error(f"Error saving to CSV: {e}")
+# Function to queue extracted details for every output format, the files are rewritten on each run
+async def save_channels(channel_details, base_path="channel_details"):
+    fieldnames = ["channel_id", "title", "subscribers", "description", "avatar", "url"]
+    await write_outputs(base_path, channel_details, OUTPUT_FORMATS, fieldnames, CHANNEL_SCHEMA, normalize_channel, overwrite=True)
+
+def channel_key(detail):
+    """Identify a channel by its ID, falling back to its URL and then its title when those are missing."""
+    return detail["channel_id"] or detail["url"] or detail["title"]
+
+async def continuation_exhausted(page, capture=None):
+    if capture and capture.responses:
+        return capture.exhausted
+    return await page.query_selector(Selectors.CONTINUATION) is None
 
-# Function to continuously scroll and collect channels
-def scroll_and_collect_channels(page, max_scrolls=10, scroll_delay_range=(1, 2), scroll_increment_range=(100, 500)):
-    all_channel_details = []
+# Function to keep loading results until the search continuation runs out, streaming new channels to the output files
+async def scroll_and_collect_channels(page, capture=None, max_scrolls=None, base_path="channel_details"):
+    seen_channels = set()
     channels_collected = 0
+    scrolls = 0
+    idle_scrolls = 0
+
+    while True:
+        # Only channels added since the previous scroll are extracted, the index drops any repeats
+        new_channel_details = []
+        for detail in await extract_channel_details(page, capture):
+            key = channel_key(detail)
+            if key not in seen_channels:
+                seen_channels.add(key)
+                new_channel_details.append(detail)
+            else:
+                metrics.count("duplicates", site="youtube")
 
-    for _ in range(max_scrolls):
-        # Perform scrolling and extract channel details
-        fast_scroll(page, scroll_delay_range, scroll_increment_range)
-        
-        # Extract and collect channel details after scrolling
-        new_channel_details = extract_channel_details(page)
         if new_channel_details:
-            all_channel_details.extend(new_channel_details)
+            await save_channels(new_channel_details, base_path)
             channels_collected += len(new_channel_details)
-            logging.info(f"Loaded more channels: {channels_collected} new channels.")
+            idle_scrolls = 0
+            logging.info(f"Loaded {len(new_channel_details)} new channels, {channels_collected} in total.")
         else:
-            logging.info("No new channels loaded, stopping the scroll.")
-            break
+            idle_scrolls += 1
 
-        # Check if the page is still loading more channels
-        if len(new_channel_details) == 0:
-            logging.info(f"No more new channels found. Total channels collected: {channels_collected}")
+        if await continuation_exhausted(page, capture):
+            logging.info(f"Search results exhausted. Total channels collected: {channels_collected}")
+            break
+        if idle_scrolls >= MAX_IDLE_SCROLLS:
+            logging.info(f"No new channels after {idle_scrolls} scrolls, stopping. Total channels collected: {channels_collected}")
+            break
+        if max_scrolls is not None and scrolls >= max_scrolls:
+            logging.info(f"Reached {max_scrolls} scrolls. Total channels collected: {channels_collected}")
             break
-        
-        time.sleep(random.uniform(2, 4))  # Sleep before next scroll
-        
-    return all_channel_details
+
+        # Once the search API is known the next results are requested directly, scrolling is the fallback
+        if not (capture and await capture.fetch_next(page)):
+            await pacer.pause(page.url)  # Politeness delay before next scroll
+            await scroll_to_continuation(page)
+        scrolls += 1
+
+    return channels_collected
+
+def query_base_path(query):
+    """Output path of the channels found for one query, data/youtube/<query>."""
+    return os.path.join("data", "youtube", re.sub(r'[<>:"/\\|?*\s]+', '_', query).strip('_'))
 
 # Main function to control the workflow
-def main_youtube_scraper(url):
-    with sync_playwright() as p:
-        # Launch the browser
-        browser = p.chromium.launch(headless=False)  # Set to True for headless mode
-        context = browser.new_context(user_agent=get_random_user_agents())
-        page = context.new_page()
-
-        try:
+async def main_youtube_scraper(url, query=SEARCH_QUERY, base_path="channel_details"):
+    """Search YouTube for channels matching `query`. Returns False if the search stopped on an error."""
+    open_sink()
+    pool = BrowserPool(new_context, launch_options=LAUNCH_OPTIONS, name="youtube")
+    try:
+        await pool.start()
+        # The search session keeps its page until the results run out
+        async with pool.lease() as page:
             logging.info(f"Visiting: {url}")
-            page.goto(url, timeout=60000)  # Open YouTube
-            time.sleep(random.uniform(2, 5))  # Wait for the page to load
+            # Open YouTube, resolves on the load event
+            await get_retrier("youtube").run(url, lambda: goto(page, url, timeout=60000))
+            await pacer.pause(url)
 
             # Perform search operation
-            if search_bar(page):
-                # Apply filters and select "Channels"
-                if filter_for_channels(page):
-                    if select_channel_filter(page):
-                        # Scrape channels continuously while scrolling
-                        all_channel_details = scroll_and_collect_channels(page)
-
-                        # Save the data to a CSV file
-                        save_to_csv(all_channel_details)
-        except Exception as e:
-            logging.error(f"An error occurred: {e}")
-        finally:
-            logging.info("Closing browser.")
-            browser.close()
+            if not await search_bar(page, query):
+                return False
+            # Apply filters and select "Channels"
+            if not await filter_for_channels(page):
+                return False
+            # Listen before filtering, so the results of the channel filter itself are captured too
+            capture = new_search_capture()
+            capture.attach(page)
+            if not await select_channel_filter(page):
+                return False
+            # Scrape channels continuously while scrolling, saving them as they come in
+            await scroll_and_collect_channels(page, capture, base_path=base_path)
+    except Exception as e:
+        logging.error(f"An error occurred: {e}")
+        return False
+    finally:
+        logging.info("Closing browser.")
+        await pool.close()
+        close_sink()
+        get_blocker("youtube").report()
+        metrics.report()
+    return True
+
+async def search_shard(worker_id, queries, options):
+    """Worker process side of the sharded run: search every query handed to this process."""
+    failed = []
+    async for (query,) in queries:
+        if not await main_youtube_scraper(options["url"], query, query_base_path(query)):
+            failed.append(query)
+    if failed:
+        logging.warning(f"Searches that stopped on an error: {failed}")
+
+async def scrape_queries_sharded(url, queries, processes=WORKER_PROCESSES):
+    """Search many queries at once, spread over worker processes that each run their own browser."""
+    if not queries:
+        logging.info("No queries to search.")
+        return {"items": 0, "failed_processes": 0}
+    run = ShardedRun(search_shard, min(processes, len(queries)), options={"url": url}, name="youtube")
+    run.start()
+    for query in queries:
+        run.submit(query)
+    return await run.close()
 
 # Call the main function with YouTube URL
 if __name__ == "__main__":
-    main_youtube_scraper("https://www.youtube.com/")
+    asyncio.run(main_youtube_scraper("https://www.youtube.com/"))